@@ -0,0 +1,6 @@
+set PYTHONPATH=python-3.13.2-embed-amd64\
+set TCL_LIBRARY=python-3.13.2-embed-amd64\Lib\tcl8.6
+set /p COORDINATOR=Coordinator address: 
+python-3.13.2-embed-amd64\python.exe distributed_hashing.py %COORDINATOR%
+
+pause
\ No newline at end of file
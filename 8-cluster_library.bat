@@ -0,0 +1,5 @@
+set PYTHONPATH=python-3.13.2-embed-amd64\
+set TCL_LIBRARY=python-3.13.2-embed-amd64\Lib\tcl8.6
+python-3.13.2-embed-amd64\python.exe cluster_library.py
+
+pause
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""Сравнение полного и быстрого (draft) декодирования для phash.
+
+Запуск из корня проекта:
+    python benchmarks/decode_benchmark.py                 # синтетические JPEG 12/24/50 Мп
+    python benchmarks/decode_benchmark.py D:\\Camera\\2024  # свои фотографии
+
+Печатает изображений/сек для обоих режимов и расстояние Хэмминга между хэшами.
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import time
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hashing import compute_phash  # noqa: E402
+
+CAMERA_SIZES = {
+    '12MP': (4000, 3000),
+    '24MP': (6000, 4000),
+    '50MP': (8660, 5773),
+}
+
+
+def synthetic_photo(size, seed):
+    """JPEG-подобная "фотография": плавные формы, увеличенные до нужного размера, плюс шум сенсора"""
+    rnd = random.Random(seed)
+    small = Image.new('RGB', (400, 300), tuple(rnd.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(small)
+    for _ in range(40):
+        x, y = rnd.randrange(400), rnd.randrange(300)
+        w, h = rnd.randrange(20, 200), rnd.randrange(20, 150)
+        draw.ellipse((x, y, x + w, y + h), fill=tuple(rnd.randrange(256) for _ in range(3)))
+    img = small.filter(ImageFilter.GaussianBlur(3)).resize(size, Image.BICUBIC)
+    noise = Image.effect_noise(size, 12).convert('RGB')
+    return Image.blend(img, noise, 0.08)
+
+
+def generate(directory, per_size):
+    files = []
+    for label, size in CAMERA_SIZES.items():
+        for i in range(per_size):
+            path = os.path.join(directory, f'{label}_{i}.jpg')
+            synthetic_photo(size, seed=f'{label}-{i}').save(path, quality=92)
+            files.append((label, path))
+    return files
+
+
+def hash_files(paths, fast):
+    hashes = {}
+    start = time.perf_counter()
+    for path in paths:
+        with Image.open(path) as img:
+            hashes[path] = int(compute_phash(img, fast), 16)
+    return hashes, time.perf_counter() - start
+
+
+def run(files):
+    groups = {}
+    for label, path in files:
+        groups.setdefault(label, []).append(path)
+
+    print(f"{'group':<10}{'files':>6}{'full img/s':>12}{'fast img/s':>12}{'speedup':>9}{'max dist':>10}{'mean dist':>11}")
+    for label, paths in groups.items():
+        full, full_time = hash_files(paths, fast=False)
+        fast, fast_time = hash_files(paths, fast=True)
+        distances = [(full[p] ^ fast[p]).bit_count() for p in paths]
+        print(f"{label:<10}{len(paths):>6}{len(paths) / full_time:>12.2f}{len(paths) / fast_time:>12.2f}"
+              f"{full_time / fast_time:>8.1f}x{max(distances):>10}{sum(distances) / len(distances):>11.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', help='папка с JPEG (по умолчанию - синтетические файлы)')
+    parser.add_argument('--per-size', type=int, default=5, help='синтетических файлов на каждый размер')
+    args = parser.parse_args()
+
+    if args.directory:
+        files = []
+        for root, _, names in os.walk(args.directory):
+            for name in names:
+                if name.lower().endswith(('jpg', 'jpeg')):
+                    path = os.path.join(root, name)
+                    with Image.open(path) as img:
+                        megapixels = img.width * img.height / 1e6
+                    files.append((f'{megapixels:.0f}MP', path))
+        run(sorted(files))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            print("Generating synthetic camera JPEGs...")
+            run(generate(tmp, args.per_size))
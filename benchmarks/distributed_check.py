@@ -0,0 +1,186 @@
+"""Проверка протокола координатор/воркер распределенного хэширования на localhost.
+
+Запуск из корня проекта:
+    python benchmarks/distributed_check.py
+    python benchmarks/distributed_check.py --files 200 --workdir D:\\check
+
+Координатор и два воркера (по процессу в Pool) работают на этой машине, сценарии
+повторяются для путей и для send_bytes=True (воркерам уходит содержимое файлов):
+- kill: медленный воркер держит пачку и убивается после первого результата другого -
+  его пачка должна вернуться в очередь (_lost) и быть посчитанной другим воркером;
+- steal: один воркер медленный, после STEAL_AFTER свободный воркер забирает копию
+  его пачки; засчитывается первый результат, второй отбрасывается (discarded, если
+  он пришел до конца прохода).
+В обоих сценариях каждый файл должен прийти ровно один раз и с тем же хэшем, что
+при локальном хэшировании. Код выхода 1, если проверка не прошла.
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import collections
+from multiprocessing import Process, freeze_support
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import distributed_hashing  # noqa: E402
+from distributed_hashing import Coordinator, run_worker  # noqa: E402
+from workers import process_files_create  # noqa: E402
+from decode_benchmark import synthetic_photo  # noqa: E402
+
+AUTHKEY = b'distributed-check'
+# Задержка воркера на файл, секунд: передается процессам Pool через окружение
+DELAY_ENV = 'DISTRIBUTED_CHECK_DELAY'
+FAST_DELAY = 0.01
+SLOW_DELAY = 0.5
+DOOMED_DELAY = 2.0
+# Порог кражи пачки в сценарии steal (в distributed_hashing - 5 секунд)
+STEAL_AFTER = 1.0
+
+
+class CheckedCoordinator(Coordinator):
+    """Координатор со счетчиками: сколько элементов вернулось в очередь, сколько пачек украдено
+    и сколько повторных результатов отброшено"""
+
+    def __init__(self, *args, **kwargs):
+        self.requeued = 0
+        self.stolen = 0
+        self.discarded = 0
+        super().__init__(*args, **kwargs)
+
+    def _take(self, size, taken):
+        task = super()._take(size, taken)
+        if task is not None:
+            with self.cond:
+                entry = self.in_flight.get(task[0])
+                if entry is not None and entry[2] > 1:
+                    self.stolen += 1
+        return task
+
+    def _complete(self, batch_id, results):
+        with self.cond:
+            if batch_id not in self.in_flight:
+                self.discarded += 1
+        super()._complete(batch_id, results)
+
+    def _lost(self, batch_id):
+        with self.cond:
+            entry = self.in_flight.get(batch_id)
+            if entry is not None and entry[2] == 1:
+                self.requeued += len(entry[0])
+        super()._lost(batch_id)
+
+
+def delayed_create(items):
+    """process_files_create с задержкой на файл из окружения процесса воркера"""
+    time.sleep(float(os.environ.get(DELAY_ENV, 0)) * len(items))
+    return process_files_create(items)
+
+
+def isolated_worker(address, delay):
+    # Своя группа процессов: kill() завершит воркер вместе с его Pool
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    os.environ[DELAY_ENV] = str(delay)
+    run_worker(address, AUTHKEY, processes=1, reconnect=False)
+
+
+def start_worker(coordinator, delay, connected):
+    """Воркер с задержкой delay на файл; ждем, пока координатор увидит connected воркеров"""
+    process = Process(target=isolated_worker, args=(('127.0.0.1', coordinator.listener.address[1]), delay))
+    process.start()
+    deadline = time.monotonic() + 30
+    while coordinator.workers < connected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return process
+
+
+def kill(process):
+    if process.is_alive():
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.terminate()  # Windows: процесс Pool воркера завершится сам, потеряв родителя
+    process.join()
+
+
+def make_files(root, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(root, f'IMG_{i:05d}.jpg')
+        synthetic_photo((320, 240), seed=i).save(path, 'JPEG', quality=85)
+        paths.append(path)
+    return paths
+
+
+def run_scenario(name, paths, reference, send_bytes):
+    """(ок, сообщение) для сценария kill или steal"""
+    coordinator = CheckedCoordinator(host='127.0.0.1', port=0, authkey=AUTHKEY, send_bytes=send_bytes,
+                                     local_worker=False)
+    workers = []
+    counts = collections.Counter()
+    mismatches = 0
+    start = time.perf_counter()
+    try:
+        # Оба воркера ждут работу до начала раздачи, поэтому пачку получает и медленный
+        workers.append(start_worker(coordinator, DOOMED_DELAY if name == 'kill' else SLOW_DELAY, 1))
+        workers.append(start_worker(coordinator, FAST_DELAY, 2))
+        for results in coordinator.imap_unordered(delayed_create, paths):
+            # Первый результат приходит от быстрого воркера - медленный в это время держит свою пачку
+            if name == 'kill' and workers[0].is_alive():
+                kill(workers[0])
+            for result in results:
+                if result is None:
+                    mismatches += 1
+                    continue
+                counts[result[1]] += 1
+                if result[0]['phash'] != reference[result[1]]:
+                    mismatches += 1
+    finally:
+        coordinator.close()
+        for process in workers:
+            kill(process)
+
+    seconds = time.perf_counter() - start
+    missing = len(set(paths) - set(counts))
+    repeated = sum(1 for count in counts.values() if count > 1)
+    exercised = coordinator.requeued if name == 'kill' else coordinator.stolen
+    ok = not missing and not repeated and not mismatches and exercised > 0
+    message = (f"{name:<6}{'bytes' if send_bytes else 'paths':<7}{seconds:>7.1f}s  missing {missing}, "
+               f"repeated {repeated}, mismatches {mismatches}, requeued {coordinator.requeued}, "
+               f"stolen {coordinator.stolen}, discarded {coordinator.discarded}")
+    return ok, message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=96, help="сколько синтетических файлов хэшировать")
+    parser.add_argument('--workdir', help="папка для файлов (по умолчанию - временная)")
+    args = parser.parse_args()
+
+    distributed_hashing.STEAL_AFTER = STEAL_AFTER
+    workdir = tempfile.mkdtemp(prefix='distributed_check_', dir=args.workdir)
+    try:
+        print(f"🖼️ Generating {args.files} files in {workdir}...")
+        paths = make_files(workdir, args.files)
+        reference = {result[1]: result[0]['phash'] for result in process_files_create(paths)}
+
+        failed = 0
+        for name in ('kill', 'steal'):
+            for send_bytes in (False, True):
+                ok, message = run_scenario(name, paths, reference, send_bytes)
+                print(f"{'✅' if ok else '❌'} {message}")
+                failed += not ok
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        print(f"❌ {failed} scenarios failed")
+        sys.exit(1)
+    print("✅ Every file was hashed exactly once in every scenario")
+
+
+if __name__ == '__main__':
+    freeze_support()
+    main()
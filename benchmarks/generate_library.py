@@ -0,0 +1,183 @@
+"""Генератор воспроизводимой синтетической фотобиблиотеки для бенчмарков.
+
+Запуск из корня проекта:
+    python benchmarks/generate_library.py D:\\bench\\10k --files 10000 --seed 1
+
+Создает две папки:
+    library\\   - "домашняя" библиотека в структуре ГГГГ\\ММ, с внутренними копиями
+    incoming\\  - новые файлы: точные копии и пересжатые копии файлов библиотеки плюс новые снимки
+Форматы JPEG/PNG/GIF/BMP, разные размеры, EXIF DateTimeOriginal у части JPEG,
+даты в именах файлов во всех форматах, которые понимает photo_organizer.
+"""
+import os
+import json
+import random
+import shutil
+import argparse
+from datetime import datetime, timedelta
+from PIL import Image, ImageDraw
+
+FORMATS = (('jpg', 0.70), ('png', 0.15), ('gif', 0.08), ('bmp', 0.07))
+
+# Доли от числа файлов библиотеки
+INTERNAL_EXACT = 0.05     # побайтовые копии внутри библиотеки
+INTERNAL_NEAR = 0.03      # пересжатые копии внутри библиотеки
+INCOMING = 0.20           # размер incoming
+INCOMING_EXACT = 0.30     # доли внутри incoming
+INCOMING_NEAR = 0.20
+
+EPOCH = datetime(2012, 1, 1)
+EXIF_DATE_TAG = 36867     # DateTimeOriginal
+EXIF_IFD = 0x8769
+
+
+def scene(rnd, max_side):
+    """Случайный "снимок": фон и набор фигур, размер от max_side/4 до max_side"""
+    width = rnd.randint(max_side // 4, max_side)
+    height = rnd.randint(max_side // 4, max_side)
+    img = Image.new('RGB', (width, height), tuple(rnd.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(rnd.randint(5, 25)):
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        w, h = rnd.randint(5, width // 2 + 5), rnd.randint(5, height // 2 + 5)
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        if rnd.random() < 0.5:
+            draw.ellipse((x, y, x + w, y + h), fill=color)
+        else:
+            draw.rectangle((x, y, x + w, y + h), fill=color)
+    return img
+
+
+def file_name(rnd, date, ext, counter):
+    """Имя файла: с датой в одном из форматов photo_organizer или "камерное" без даты"""
+    style = rnd.random()
+    if style < 0.2:
+        return f"IMG_{date:%Y%m%d}_{counter:06d}.{ext}"
+    if style < 0.3:
+        return f"{date:%Y-%m-%d} {counter:06d}.{ext}"
+    if style < 0.4:
+        return f"photo_{date:%Y_%m_%d}_{counter:06d}.{ext}"
+    return f"DSC_{counter:06d}.{ext}"
+
+
+def save(img, path, ext, rnd, date, quality=None):
+    if ext == 'jpg':
+        exif = None
+        if rnd.random() < 0.6:
+            exif = Image.Exif()
+            exif.get_ifd(EXIF_IFD)[EXIF_DATE_TAG] = date.strftime("%Y:%m:%d %H:%M:%S")
+        kwargs = {'exif': exif} if exif is not None else {}
+        img.save(path, quality=quality or rnd.randint(75, 95), **kwargs)
+    elif ext == 'gif':
+        img.convert('P', palette=Image.ADAPTIVE).save(path)
+    else:
+        img.save(path)
+    # Фиксированное время изменения - для воспроизводимости источника даты "filemtime"
+    timestamp = date.timestamp()
+    os.utime(path, (timestamp, timestamp))
+
+
+def near_copy(source, path, rnd, date):
+    """Пересжатая и слегка уменьшенная копия: другой файл, почти тот же phash"""
+    with Image.open(source) as img:
+        img = img.convert('RGB')
+        scale = rnd.uniform(0.7, 0.95)
+        img = img.resize((max(8, int(img.width * scale)), max(8, int(img.height * scale))))
+        save(img, path, 'jpg', rnd, date, quality=rnd.randint(55, 80))
+
+
+def copy_exact(source, path):
+    shutil.copy2(source, path)
+
+
+def generate_library(root, files, seed=0, max_side=640):
+    """Генерация library/ и incoming/ в root. Возвращает манифест (он же пишется в manifest.json)"""
+    rnd = random.Random(seed)
+    library_dir = os.path.join(root, 'library')
+    incoming_dir = os.path.join(root, 'incoming')
+    os.makedirs(library_dir, exist_ok=True)
+    os.makedirs(incoming_dir, exist_ok=True)
+    extensions = [ext for ext, _ in FORMATS]
+    weights = [weight for _, weight in FORMATS]
+
+    internal_exact = int(files * INTERNAL_EXACT)
+    internal_near = int(files * INTERNAL_NEAR)
+    originals = files - internal_exact - internal_near
+
+    library = []
+    counter = 0
+    for _ in range(originals):
+        counter += 1
+        date = EPOCH + timedelta(seconds=rnd.randrange(10 * 365 * 86400))
+        ext = rnd.choices(extensions, weights)[0]
+        directory = os.path.join(library_dir, f"{date:%Y}", f"{date:%m}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, file_name(rnd, date, ext, counter))
+        save(scene(rnd, max_side), path, ext, rnd, date)
+        library.append((path, date))
+
+    def copy_name(date, ext):
+        nonlocal counter
+        counter += 1
+        return file_name(rnd, date, ext, counter)
+
+    for _ in range(internal_exact):
+        source, date = rnd.choice(library)
+        ext = source.rsplit('.', 1)[1]
+        copy_exact(source, os.path.join(os.path.dirname(source), copy_name(date, ext)))
+    for _ in range(internal_near):
+        source, date = rnd.choice(library)
+        near_copy(source, os.path.join(os.path.dirname(source), copy_name(date, 'jpg')), rnd, date)
+
+    incoming = int(files * INCOMING)
+    incoming_exact = int(incoming * INCOMING_EXACT)
+    incoming_near = int(incoming * INCOMING_NEAR)
+    incoming_new = incoming - incoming_exact - incoming_near
+    batch_dirs = [os.path.join(incoming_dir, f"import_{i:02d}") for i in range(max(1, incoming // 500))]
+    for directory in batch_dirs:
+        os.makedirs(directory, exist_ok=True)
+
+    for _ in range(incoming_exact):
+        source, date = rnd.choice(library)
+        ext = source.rsplit('.', 1)[1]
+        copy_exact(source, os.path.join(rnd.choice(batch_dirs), copy_name(date, ext)))
+    for _ in range(incoming_near):
+        source, date = rnd.choice(library)
+        near_copy(source, os.path.join(rnd.choice(batch_dirs), copy_name(date, 'jpg')), rnd, date)
+    for _ in range(incoming_new):
+        counter += 1
+        date = EPOCH + timedelta(seconds=rnd.randrange(10 * 365 * 86400))
+        ext = rnd.choices(extensions, weights)[0]
+        path = os.path.join(rnd.choice(batch_dirs), file_name(rnd, date, ext, counter))
+        save(scene(rnd, max_side), path, ext, rnd, date)
+
+    manifest = {
+        'seed': seed,
+        'files': files,
+        'max_side': max_side,
+        'library': 'library',
+        'incoming': 'incoming',
+        'counts': {
+            'library_originals': originals,
+            'library_exact_copies': internal_exact,
+            'library_near_copies': internal_near,
+            'incoming_exact_copies': incoming_exact,
+            'incoming_near_copies': incoming_near,
+            'incoming_new': incoming_new,
+        },
+    }
+    with open(os.path.join(root, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help='папка, в которой будет создана библиотека')
+    parser.add_argument('--files', type=int, default=1000, help='число файлов в библиотеке')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-side', type=int, default=640, help='максимальная сторона изображения, px')
+    args = parser.parse_args()
+
+    manifest = generate_library(args.root, args.files, args.seed, args.max_side)
+    print(json.dumps(manifest['counts'], indent=2))
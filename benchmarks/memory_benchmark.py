@@ -0,0 +1,131 @@
+"""Пиковая память (RSS) родительского процесса create_db и find_duplicates в зависимости от числа файлов.
+
+Запуск из корня проекта:
+    python benchmarks/memory_benchmark.py                      # 5k, 20k и 80k файлов
+    python benchmarks/memory_benchmark.py --scales 10000 100000 --workdir D:\\bench
+
+Файлы - крошечные JPEG со случайными пикселями: декодируются за микросекунды, а размеры
+у многих совпадают, поэтому работает и отложенная проверка побайтовых копий. Каждый этап
+запускается в отдельном процессе, печатается его пиковый RSS (без процессов Pool):
+- create_db: первое наполнение БД;
+- rescan: повторный проход без изменений;
+- find_duplicates: проверка папки того же размера, половина файлов - копии из библиотеки.
+При ограниченной памяти пик почти не зависит от числа файлов.
+"""
+import os
+import sys
+import json
+import shutil
+import random
+import argparse
+import subprocess
+import tempfile
+from multiprocessing import freeze_support
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SCALES = (5000, 20000, 80000)
+FILES_PER_DIR = 500
+STAGES = ('create_db', 'rescan', 'find_duplicates')
+
+
+def peak_rss_mb():
+    """Пиковый RSS текущего процесса, МБ; None, если платформа его не сообщает"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil  # Windows: только если psutil установлен
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def tiny_jpeg(path, rnd):
+    img = Image.frombytes('L', (16, 16), bytes(rnd.randrange(256) for _ in range(256)))
+    img.save(path, 'JPEG', quality=rnd.choice((70, 80, 90)))
+
+
+def generate(root, files, seed=0):
+    """library/ из files файлов и incoming/: половина - копии файлов библиотеки, половина - новые"""
+    rnd = random.Random(seed)
+    library_files = []
+    for i in range(files):
+        directory = os.path.join(root, 'library', f'{i // FILES_PER_DIR:04d}')
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(directory)
+        path = os.path.join(directory, f'IMG_{i:07d}.jpg')
+        tiny_jpeg(path, rnd)
+        library_files.append(path)
+    for i in range(files):
+        directory = os.path.join(root, 'incoming', f'{i // FILES_PER_DIR:04d}')
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(directory)
+        path = os.path.join(directory, f'NEW_{i:07d}.jpg')
+        if i % 2:
+            shutil.copyfile(rnd.choice(library_files), path)
+        else:
+            tiny_jpeg(path, rnd)
+
+
+def run_stage(stage, workdir):
+    """Этап в этом процессе (режим --child): печатает JSON с пиковым RSS"""
+    import contextlib
+    from library_db import create_db
+    from duplicate_finder import find_duplicates
+
+    library = os.path.join(workdir, 'library')
+    db_path = os.path.join(workdir, 'phash_db.sqlite')
+    os.chdir(workdir)  # find_duplicates пишет отчеты в текущую папку
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        if stage == 'find_duplicates':
+            find_duplicates([os.path.join(workdir, 'incoming')], db_path)
+        else:
+            create_db(library, db_path)
+    print(json.dumps({'stage': stage, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def measure(stage, workdir):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', stage, workdir],
+                            cwd=ROOT, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])['peak_rss_mb']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='число файлов библиотеки')
+    parser.add_argument('--workdir', help='папка для сгенерированных файлов (по умолчанию - временная)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--child', nargs=2, metavar=('STAGE', 'WORKDIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_stage(*args.child)
+        return
+
+    print(f"{'files':>10}" + ''.join(f"{stage:>18}" for stage in STAGES) + "   (peak RSS, MB)")
+    rows = []
+    for files in args.scales:
+        workdir = tempfile.mkdtemp(prefix=f'memory_{files}_', dir=args.workdir)
+        try:
+            generate(workdir, files, args.seed)
+            peaks = [measure(stage, workdir) for stage in STAGES]
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        rows.append(peaks)
+        print(f"{files:>10}" + ''.join(f"{peak:>18.1f}" if peak is not None else f"{'n/a':>18}" for peak in peaks))
+
+    if len(rows) > 1 and None not in rows[0] + rows[-1]:
+        growth = [last - first for first, last in zip(rows[0], rows[-1])]
+        print(f"📈 Growth from {args.scales[0]} to {args.scales[-1]} files: "
+              + ', '.join(f"{stage} {delta:+.1f} MB" for stage, delta in zip(STAGES, growth)))
+
+
+if __name__ == '__main__':
+    freeze_support()
+    main()
@@ -0,0 +1,99 @@
+"""Сравнение imagehash.phash и пакетного phash на NumPy (hashing.phash_batch).
+
+Запуск из корня проекта:
+    python benchmarks/phash_benchmark.py                 # синтетические снимки 640x480
+    python benchmarks/phash_benchmark.py D:\\Camera\\2024  # свои фотографии (декодируются заранее)
+
+Изображения декодируются в оттенки серого до замера, поэтому сравнивается только хэширование:
+- imagehash.phash по одному файлу (прежний путь в compute_hashes);
+- phash_batch по одному файлу (новый путь в compute_hashes);
+- phash_batch пачками по --batch изображений (по умолчанию workers.HASH_CHUNK - как в воркерах);
+- отдельно хвост после уменьшения до 32x32: DCT scipy, медиана и hex-строка на файл против пачки.
+Печатает изображений/сек и число расхождений с imagehash (должно быть 0).
+"""
+import os
+import sys
+import argparse
+import time
+import numpy as np
+import imagehash
+import scipy.fftpack
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hashing import PHASH_SIZE, phash_batch, phash_pixels, phash_to_int  # noqa: E402
+from workers import HASH_CHUNK  # noqa: E402
+from decode_benchmark import synthetic_photo  # noqa: E402
+
+
+def load_directory(directory, limit):
+    images = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(('jpg', 'jpeg', 'png')) and len(images) < limit:
+                with Image.open(os.path.join(root, name)) as img:
+                    img.draft('L', (640, 640))
+                    images.append(img.convert('L'))
+    return images
+
+
+def synthetic_images(count):
+    # Несколько почти однотонных изображений проверяют пересчет неоднозначных хэшей через scipy
+    flat = [Image.new('L', (640, 480), value) for value in (0, 128, 255)]
+    return flat + [synthetic_photo((640, 480), seed=i).convert('L') for i in range(count - len(flat))]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def scipy_tail(pixels):
+    """То, что imagehash.phash делает после уменьшения: DCT scipy, медиана, ImageHash и hex-строка"""
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=0), axis=1)[:PHASH_SIZE, :PHASH_SIZE]
+    return phash_to_int(imagehash.ImageHash(dct > np.median(dct)))
+
+
+def run(images, batch):
+    count = len(images)
+    reference, reference_time = timed(lambda: [phash_to_int(imagehash.phash(img)) for img in images])
+    single, single_time = timed(lambda: [int(phash_batch(phash_pixels(img))[0]) for img in images])
+
+    def batched():
+        hashes = []
+        for i in range(0, count, batch):
+            hashes += phash_batch(np.stack([phash_pixels(img) for img in images[i:i + batch]])).tolist()
+        return hashes
+
+    batch_hashes, batch_time = timed(batched)
+    pixels = np.stack([phash_pixels(img) for img in images])
+    tail, tail_time = timed(lambda: [scipy_tail(block) for block in pixels])
+    block, block_time = timed(lambda: phash_batch(pixels).tolist())
+
+    print(f"{'path':<34}{'img/s':>12}{'speedup':>9}{'mismatches':>12}")
+    rows = [
+        ('imagehash.phash per file', reference, reference_time, reference_time),
+        ('phash_batch per file', single, single_time, reference_time),
+        (f'phash_batch, batches of {batch}', batch_hashes, batch_time, reference_time),
+        ('32x32 tail: scipy per file', tail, tail_time, tail_time),
+        ('32x32 tail: phash_batch block', block, block_time, tail_time),
+    ]
+    for label, hashes, seconds, baseline in rows:
+        mismatches = sum(a != b for a, b in zip(hashes, reference))
+        print(f"{label:<34}{count / seconds:>12.1f}{baseline / seconds:>8.1f}x{mismatches:>12}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', help='папка с изображениями (по умолчанию - синтетические)')
+    parser.add_argument('--count', type=int, default=300, help='сколько изображений хэшировать')
+    parser.add_argument('--batch', type=int, default=HASH_CHUNK, help='размер пачки для phash_batch')
+    args = parser.parse_args()
+
+    if args.directory:
+        images = load_directory(args.directory, args.count)
+    else:
+        print("Generating synthetic photos...")
+        images = synthetic_images(args.count)
+    run(images, args.batch)
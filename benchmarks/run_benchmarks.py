@@ -0,0 +1,165 @@
+"""Бенчмарк всех этапов на синтетической библиотеке.
+
+Запуск из корня проекта:
+    python benchmarks/run_benchmarks.py                          # 1k, 10k и 100k файлов
+    python benchmarks/run_benchmarks.py --scales 1000 --verbose
+    python benchmarks/run_benchmarks.py --workdir D:\\bench --output results.json
+
+Сгенерированные библиотеки кэшируются в workdir (по числу файлов и seed), каждый
+прогон работает на свежей копии. Результат - JSON со временем каждого этапа,
+числом файлов и файлов/сек, чтобы прогоны можно было сравнивать между собой.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import time
+import contextlib
+from datetime import datetime
+from multiprocessing import cpu_count, freeze_support
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from generate_library import generate_library  # noqa: E402
+from library_db import create_db  # noqa: E402
+from duplicate_finder import find_duplicates  # noqa: E402
+from find_internal_duplicates import find_internal_duplicates  # noqa: E402
+from cluster_library import cluster_library  # noqa: E402
+from photo_organizer import organize_photos  # noqa: E402
+from scanner import scan_files  # noqa: E402
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def count_files(root):
+    return sum(1 for _ in scan_files([root]))
+
+
+def count_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+
+@contextlib.contextmanager
+def quiet(enabled):
+    """Прячем прогресс-бары и печать этапов, чтобы они не мешали отчету"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+def timed(stages, name, items, func, verbose):
+    with quiet(not verbose):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+    stages[name] = {
+        'seconds': round(seconds, 3),
+        'items': items,
+        'items_per_sec': round(items / seconds, 1) if seconds else None,
+    }
+    print(f"  {name:<28}{seconds:>9.2f}s{stages[name]['items_per_sec'] or 0:>12.1f} files/s")
+
+
+def mutate_library(library, fraction=0.01):
+    """Изменения для инкрементального прохода: переименование, удаление и перезапись части файлов"""
+    files = sorted(path for path, _ in scan_files([library]))
+    step = max(1, int(1 / fraction))
+    for i, path in enumerate(files[::step]):
+        action = i % 3
+        if action == 0:
+            base, ext = os.path.splitext(path)
+            os.replace(path, f"{base}_renamed{ext}")
+        elif action == 1:
+            os.remove(path)
+        else:
+            with open(path, 'ab') as f:
+                f.write(b'\0')
+    return len(files[::step])
+
+
+def run_scale(files, seed, max_side, workdir, verbose):
+    cache = os.path.join(workdir, f"library-{files}-seed{seed}-{max_side}px")
+    if not os.path.exists(os.path.join(cache, 'manifest.json')):
+        print(f"🧪 Generating synthetic library with {files} files...")
+        shutil.rmtree(cache, ignore_errors=True)
+        generate_library(cache, files, seed, max_side)
+
+    run_dir = os.path.join(workdir, 'run')
+    shutil.rmtree(run_dir, ignore_errors=True)
+    shutil.copytree(cache, run_dir)
+    library = os.path.join(run_dir, 'library')
+    incoming = os.path.join(run_dir, 'incoming')
+    db_path = os.path.join(run_dir, 'phash_db.sqlite')
+    library_files = count_files(library)
+    incoming_files = count_files(incoming)
+
+    print(f"⏱️ {files} files ({library_files} in library, {incoming_files} incoming)")
+    stages = {}
+    previous_dir = os.getcwd()
+    os.chdir(run_dir)  # скрипты пишут свои отчеты в текущую папку
+    try:
+        timed(stages, 'create_db', library_files, lambda: create_db(library, db_path), verbose)
+        timed(stages, 'update_library_unchanged', library_files, lambda: create_db(library, db_path), verbose)
+        changed = mutate_library(library)
+        timed(stages, 'update_library_changed', library_files, lambda: create_db(library, db_path), verbose)
+        stages['update_library_changed']['changed_files'] = changed
+        timed(stages, 'find_duplicates', incoming_files, lambda: find_duplicates([incoming], db_path), verbose)
+        timed(stages, 'find_internal_duplicates', library_files,
+              lambda: find_internal_duplicates(library, db_path), verbose)
+        timed(stages, 'cluster_library', library_files, lambda: cluster_library(db_path), verbose)
+        unique_files = count_lines('unique.txt')
+        timed(stages, 'organize_photos', unique_files, lambda: organize_photos('unique.txt'), verbose)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    return {'files': files, 'library_files': library_files, 'incoming_files': incoming_files, 'stages': stages}
+
+
+if __name__ == '__main__':
+    freeze_support()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='размеры библиотек, файлов')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-side', type=int, default=640, help='максимальная сторона изображения, px')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'photo_organizer_bench'),
+                        help='папка для кэша сгенерированных библиотек')
+    parser.add_argument('--output', help='путь к JSON с результатами')
+    parser.add_argument('--verbose', action='store_true', help='показывать вывод самих скриптов')
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cpu_count(),
+        'seed': args.seed,
+        'max_side': args.max_side,
+        'results': [run_scale(files, args.seed, args.max_side, os.path.abspath(args.workdir), args.verbose)
+                    for files in args.scales],
+    }
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"💾 Results saved to {output}")
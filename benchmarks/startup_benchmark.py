@@ -0,0 +1,85 @@
+"""Время холодного старта и запуска воркеров при spawn.
+
+Запуск из корня проекта:
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --repeat 10 --processes 4
+
+Печатает:
+- холодный старт: python cli.py --help против импорта find-duplicates.py (как при запуске скрипта);
+- импорт модуля с функциями воркеров в чистом интерпретаторе: секунды и число загруженных модулей;
+- запуск Pool с методом spawn: время до первого результата от каждого воркера.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import time
+from multiprocessing import get_context, freeze_support
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORT_PROBE = ("import sys, time; start = time.perf_counter(); import importlib; "
+                "importlib.import_module({name!r}); print(time.perf_counter() - start, len(sys.modules))")
+
+
+def run_python(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def cold_start(repeat):
+    """Медиана времени запуска процесса Python до выхода"""
+    cases = {
+        'cli.py --help': ['cli.py', '--help'],
+        'import find-duplicates': ['-c', "import importlib; importlib.import_module('find-duplicates')"],
+    }
+    return {label: statistics.median(run_python(args) for _ in range(repeat)) for label, args in cases.items()}
+
+
+def import_cost(name, repeat):
+    """(медиана секунд импорта, число модулей после импорта) в чистом интерпретаторе"""
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(name=name)], cwd=ROOT, check=True,
+                                capture_output=True, text=True)
+        seconds, modules = result.stdout.split()
+        runs.append((float(seconds), int(modules)))
+    return statistics.median(seconds for seconds, _ in runs), runs[0][1]
+
+
+def pool_spawn(processes):
+    """Секунды от создания spawn-Pool до результата от каждого воркера (chunksize=1, по задаче на воркер)"""
+    from workers import process_files_hash
+    start = time.perf_counter()
+    with get_context('spawn').Pool(processes) as pool:
+        # Несуществующий путь: воркер импортирует модуль функции и сразу возвращает [(путь, None, None)]
+        list(pool.imap_unordered(process_files_hash, [['missing.jpg']] * processes, chunksize=1))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help="повторов каждого замера")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help="воркеров в Pool")
+    args = parser.parse_args()
+
+    print("🚀 Cold start (median):")
+    for label, seconds in cold_start(args.repeat).items():
+        print(f"  {label:<28} {seconds:.3f}s")
+
+    print("\n📦 Worker-side import in a fresh interpreter (median):")
+    for name in ('workers', 'library_db', 'duplicate_finder'):
+        seconds, modules = import_cost(name, args.repeat)
+        print(f"  {name:<28} {seconds:.3f}s  {modules} modules")
+
+    seconds = statistics.median(pool_spawn(args.processes) for _ in range(args.repeat))
+    print(f"\n🧵 Spawn Pool({args.processes}) until every worker answered (median): {seconds:.3f}s "
+          f"({seconds / args.processes:.3f}s per worker)")
+
+
+if __name__ == '__main__':
+    freeze_support()
+    main()
@@ -0,0 +1,162 @@
+"""Единая точка входа без GUI: этапы конвейера - подкоманды, пути - аргументы.
+
+    python cli.py index [библиотека]                 обновить БД по библиотеке (по умолчанию library.path)
+    python cli.py find <папка> [<папка> ...]         дубликаты папок относительно библиотеки
+    python cli.py internal <папка>                   дубликаты внутри папки библиотеки
+    python cli.py move [duplicates_filtered.txt]     переместить дубликаты в корзину
+    python cli.py organize [unique.txt] [--dry-run]  разложить фотографии по датам
+    python cli.py restore                            вернуть файлы из корзины
+
+Общие параметры перед командой: --config (config.yaml, без файла - настройки по умолчанию)
+и --db (phash_db.sqlite). PIL, imagehash, numpy, tqdm и yaml импортируются только внутри
+выбранной команды: --help отвечает сразу, а воркеры Pool при spawn не загружают лишнего.
+"""
+import os
+import sys
+import argparse
+import importlib
+from multiprocessing import freeze_support
+
+
+def load_config(path):
+    """Настройки из config.yaml; нет файла - пустые настройки (значения по умолчанию)"""
+    if not os.path.exists(path):
+        return {}
+    import yaml
+    with open(path, 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file) or {}
+
+
+def hashing_options(config):
+    """(fast_hash, hash_types, filters) по секциям hashing и duplicates, как в update_library"""
+    from hashing import hash_types_from_config
+    hashing_config = config.get('hashing') or {}
+    filters = (config.get('duplicates') or {}).get('filters') or {}
+    hash_types = hash_types_from_config([*(hashing_config.get('types') or []), *filters])
+    return hashing_config.get('fast_decode', False), hash_types, filters
+
+
+def metrics_for(config, script):
+    from metrics import Metrics
+    return Metrics.from_config(config.get('metrics'), script)
+
+
+def require_db(db_path):
+    if not os.path.exists(db_path):
+        print(f"❌ {db_path} not found! Run 'cli.py index' first")
+        sys.exit(1)
+
+
+def cmd_index(args, config):
+    from library_db import create_db
+    from distributed_hashing import coordinator_from_config
+    from readahead import ReadAhead
+
+    library = args.library or (config.get('library') or {}).get('path')
+    if not library:
+        print("❌ Library path is not set: pass it as an argument or set library.path in config.yaml")
+        sys.exit(1)
+    fast_hash, hash_types, _ = hashing_options(config)
+    coordinator = coordinator_from_config(config.get('distributed'))
+    try:
+        create_db(os.path.abspath(library), args.db, fast_hash=fast_hash, hash_types=hash_types,
+                  coordinator=coordinator, read_ahead=ReadAhead.from_config(config.get('readahead')),
+                  metrics=metrics_for(config, 'create_db'))
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+
+
+def cmd_find(args, config):
+    from duplicate_finder import find_duplicates
+    from keepers import KeeperRules
+    from readahead import ReadAhead
+
+    require_db(args.db)
+    fast_hash, _, filters = hashing_options(config)
+    find_duplicates([os.path.abspath(directory) for directory in args.directories], args.db,
+                    max_distance=(config.get('duplicates') or {}).get('max_distance', 0), fast_hash=fast_hash,
+                    filters=filters, keepers=KeeperRules.from_config(config.get('keepers')),
+                    read_ahead=ReadAhead.from_config(config.get('readahead')),
+                    metrics=metrics_for(config, 'find_duplicates'))
+
+
+def cmd_internal(args, config):
+    from find_internal_duplicates import find_internal_duplicates
+    from keepers import KeeperRules
+
+    require_db(args.db)
+    find_internal_duplicates(os.path.abspath(args.directory), args.db,
+                             keepers=KeeperRules.from_config(config.get('keepers')),
+                             metrics=metrics_for(config, 'find_internal_duplicates'))
+
+
+def cmd_move(args, config):
+    # Имя скрипта с дефисом - обычным import его не загрузить
+    move_duplicates = importlib.import_module('move-duplicates')
+    move_duplicates.move_duplicates_to_trash(args.duplicates_file, metrics_for(config, 'move_duplicates'),
+                                             trash_dir=args.trash)
+
+
+def cmd_organize(args, config):
+    from photo_organizer import organize_photos
+
+    organize_photos(args.source_file, args.output, args.db, dry_run=args.dry_run,
+                    metrics=metrics_for(config, 'organize_photos'))
+
+
+def cmd_restore(args, config):
+    move_duplicates = importlib.import_module('move-duplicates')
+    move_duplicates.restore_duplicates_from_trash(args.trash)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default='config.yaml', help="файл настроек (по умолчанию config.yaml)")
+    parser.add_argument('--db', default='phash_db.sqlite', help="БД библиотеки (по умолчанию phash_db.sqlite)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    index = commands.add_parser('index', help="создать или обновить БД библиотеки")
+    index.add_argument('library', nargs='?', help="папка библиотеки (по умолчанию library.path из config.yaml)")
+    index.set_defaults(func=cmd_index)
+
+    find = commands.add_parser('find', help="дубликаты папок относительно библиотеки")
+    find.add_argument('directories', nargs='+', help="проверяемые папки")
+    find.set_defaults(func=cmd_find)
+
+    internal = commands.add_parser('internal', help="дубликаты внутри папки библиотеки")
+    internal.add_argument('directory', help="папка внутри библиотеки")
+    internal.set_defaults(func=cmd_internal)
+
+    move = commands.add_parser('move', help="переместить дубликаты в корзину")
+    move.add_argument('duplicates_file', nargs='?', default='duplicates_filtered.txt')
+    move.add_argument('--trash', help="папка корзины (по умолчанию Trash в текущей папке)")
+    move.set_defaults(func=cmd_move)
+
+    organize = commands.add_parser('organize', help="разложить фотографии по годам и месяцам")
+    organize.add_argument('source_file', nargs='?', default='unique.txt', help="список файлов (unique.txt)")
+    organize.add_argument('--output', default='sorted_photos', help="папка для результата")
+    organize.add_argument('--dry-run', action='store_true', help="только план в move_plan.txt, без перемещения")
+    organize.set_defaults(func=cmd_organize)
+
+    restore = commands.add_parser('restore', help="вернуть все файлы из корзины на исходные места")
+    restore.add_argument('--trash', help="папка корзины (по умолчанию Trash в текущей папке)")
+    restore.set_defaults(func=cmd_restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Фикс для кодировки в Windows
+    if sys.platform.startswith('win'):
+        import locale
+        sys.stdin.reconfigure(encoding='utf-8')
+        sys.stdout.reconfigure(encoding='utf-8')
+        locale.setlocale(locale.LC_ALL, 'Russian_Russia.65001')
+    args.func(args, load_config(args.config))
+
+
+if __name__ == '__main__':
+    freeze_support()
+    main()
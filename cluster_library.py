@@ -0,0 +1,263 @@
+"""Кластеризация всей библиотеки по phash: похожие снимки (серии, пересохраненные правки)
+собираются в кластеры, id кластера хранится в images.cluster_id.
+
+Пары в пределах расстояния Хэмминга ищутся через multi-index hashing на массивах numpy,
+а не перебором всех пар, и объединяются в кластеры через union-find. Повторный запуск
+ищет соседей только для новых и перехэшированных файлов и пересчитывает только
+затронутые ими кластеры.
+"""
+import os
+import csv
+import json
+import sys
+import locale
+from datetime import datetime
+from itertools import combinations
+import numpy as np
+import yaml
+from hashing import int_to_phash
+from keepers import QUALITY_JOIN, QUALITY_SQL, KeeperRules, quality_from_row
+from library_db import connect, init_db
+
+# Фикс для кодировки в Windows
+if sys.platform.startswith('win'):
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout.reconfigure(encoding='utf-8')
+    locale.setlocale(locale.LC_ALL, 'Russian_Russia.65001')
+
+# Хэш делится на 4 полосы по 16 бит. Если два хэша отличаются не более чем на d бит,
+# то хотя бы в одной полосе они отличаются не более чем на d // 4 бит - кандидаты
+# берутся из отсортированных полос по ключам с перебором этих бит
+BANDS = 4
+BAND_BITS = 16
+# Ограничение на число пар-кандидатов, которые проверяются за один шаг (память ~ 40 байт на пару)
+MAX_CANDIDATES = 4_000_000
+# Число хэшей-запросов в одном шаге поиска соседей
+QUERY_CHUNK = 65536
+
+
+def popcount64(x):
+    """Число единичных бит в каждом элементе массива uint64"""
+    if hasattr(np, 'bitwise_count'):  # numpy >= 2.0
+        return np.bitwise_count(x)
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def probe_masks(radius, bits=BAND_BITS):
+    """Маски всех вариантов ключа полосы, отличающихся не более чем на radius бит"""
+    masks = [0]
+    for r in range(1, radius + 1):
+        masks += [sum(1 << bit for bit in combo) for combo in combinations(range(bits), r)]
+    return np.array(masks, dtype=np.uint64)
+
+
+def neighbor_pairs(hashes, queries, max_distance):
+    """Пары индексов (запрос, сосед) массива hashes на расстоянии 1..max_distance.
+
+    hashes - уникальные хэши (uint64), queries - индексы хэшей, для которых ищутся соседи.
+    Для каждой полосы хэши сортируются по ключу, кандидаты находятся через searchsorted,
+    расстояние считается векторно. Пары могут повторяться (сосед найден в нескольких полосах).
+    """
+    masks = probe_masks(max_distance // BANDS)
+    key_mask = np.uint64((1 << BAND_BITS) - 1)
+    bands = []
+    for band in range(BANDS):
+        keys = (hashes >> np.uint64(band * BAND_BITS)) & key_mask
+        order = np.argsort(keys, kind='stable')
+        # Хэши в порядке ключей полосы: кандидаты одной корзины читаются подряд
+        bands.append((keys, order, keys[order], hashes[order]))
+
+    found_a, found_b = [], []
+    for start in range(0, len(queries), QUERY_CHUNK):
+        chunk = queries[start:start + QUERY_CHUNK]
+        chunk_hashes = hashes[chunk]
+        for keys, order, sorted_keys, sorted_hashes in bands:
+            chunk_keys = keys[chunk]
+            for mask in masks:
+                probe = chunk_keys ^ mask
+                low = np.searchsorted(sorted_keys, probe, 'left')
+                counts = np.searchsorted(sorted_keys, probe, 'right') - low
+                # Большие корзины (например, почти однотонные снимки) разбиваются на шаги по MAX_CANDIDATES пар
+                ends = np.cumsum(counts)
+                step_start = 0
+                while step_start < len(chunk):
+                    base = ends[step_start - 1] if step_start else 0
+                    step_end = max(int(np.searchsorted(ends, base + MAX_CANDIDATES, 'right')), step_start + 1)
+                    step_counts = counts[step_start:step_end]
+                    total = int(step_counts.sum())
+                    if total:
+                        # Позиции кандидатов в отсортированной полосе: диапазоны [low, low + count) подряд
+                        step_ends = np.cumsum(step_counts)
+                        first = low[step_start:step_end] - (step_ends - step_counts)
+                        position = np.arange(total) + np.repeat(first, step_counts)
+                        distance = popcount64(np.repeat(chunk_hashes[step_start:step_end], step_counts)
+                                              ^ sorted_hashes[position])
+                        # Хэши уникальны, расстояние 0 - сам запрос
+                        keep = np.flatnonzero((distance <= max_distance) & (distance > 0))
+                        found_a.append(chunk[step_start:step_end][np.searchsorted(step_ends, keep, 'right')])
+                        found_b.append(order[position[keep]])
+                    step_start = step_end
+    if not found_a:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(found_a), np.concatenate(found_b)
+
+
+class UnionFind:
+    """Система непересекающихся множеств над индексами 0..n-1, parent - начальный лес"""
+
+    def __init__(self, parent):
+        self.parent = list(parent)
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # сокращение пути вдвое
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            if a < b:
+                self.parent[b] = a
+            else:
+                self.parent[a] = b
+
+    def roots(self):
+        """Корень для каждого элемента: массив numpy"""
+        parent = np.array(self.parent, dtype=np.intp)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return parent
+            parent = grandparent
+
+
+def update_clusters(c, max_distance):
+    """Пересчет cluster_id для некластеризованных записей и затронутых ими кластеров.
+
+    Записи с cluster_id IS NULL (новые, перехэшированные, из сброшенных кластеров)
+    ищут соседей среди всех хэшей библиотеки. Уже построенные кластеры загружаются
+    в union-find как готовые деревья, поэтому соседей для их участников заново не ищем.
+    id кластера - наименьший id записи в нем, у одиночных снимков - собственный id.
+    Возвращает (число записей для кластеризации, число обновленных записей).
+    """
+    c.execute('SELECT max_distance FROM cluster_state WHERE id = 1')
+    state = c.fetchone()
+    if state is not None and state[0] != max_distance:
+        print(f"♻️ Threshold changed ({state[0]} -> {max_distance}), rebuilding all clusters...")
+        c.execute('UPDATE images SET cluster_id = NULL')
+
+    print("📥 Loading hashes...")
+    c.execute('SELECT id, phash, COALESCE(cluster_id, -1) FROM images WHERE phash IS NOT NULL')
+    rows = np.fromiter(c, dtype=[('id', np.int64), ('phash', np.int64), ('cluster', np.int64)])
+    if not len(rows):
+        return 0, 0
+    ids = rows['id']
+    phashes = rows['phash'].view(np.uint64)
+    clusters = rows['cluster']
+
+    # Кластеризуются уникальные хэши: записи с одинаковым phash всегда в одном кластере
+    hashes, hash_index = np.unique(phashes, return_inverse=True)
+    dirty = clusters < 0
+    if not dirty.any():
+        return 0, 0
+    queries = np.unique(hash_index[dirty])
+
+    # Существующие кластеры - деревья высоты 1: хэш участника указывает на хэш первой записи кластера
+    parent = np.arange(len(hashes))
+    clean = ~dirty
+    _, first, inverse = np.unique(clusters[clean], return_index=True, return_inverse=True)
+    members = hash_index[clean]
+    parent[members] = members[first][inverse]
+    parent[members[first]] = members[first]
+    sets = UnionFind(parent.tolist())
+
+    print(f"🧭 Searching neighbors for {len(queries)} hashes among {len(hashes)} (max distance {max_distance})...")
+    query, neighbor = neighbor_pairs(hashes, queries, max_distance) if max_distance > 0 else ((), ())
+    for a, b in zip(np.asarray(query).tolist(), np.asarray(neighbor).tolist()):
+        sets.union(a, b)
+    roots = sets.roots()
+
+    # Пересчитываются только множества, в которые попал хотя бы один некластеризованный хэш
+    row_roots = roots[hash_index]
+    affected = np.isin(row_roots, roots[queries])
+    cluster_ids = np.full(len(hashes), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(cluster_ids, row_roots[affected], ids[affected])
+    new_clusters = cluster_ids[row_roots]
+    changed = affected & (new_clusters != clusters)
+
+    print(f"💾 Saving clusters for {int(changed.sum())} images...")
+    c.executemany('UPDATE images SET cluster_id = ? WHERE id = ?',
+                  zip(new_clusters[changed].tolist(), ids[changed].tolist()))
+    c.execute('INSERT OR REPLACE INTO cluster_state VALUES (1, ?, ?)',
+              (max_distance, datetime.now().isoformat(timespec='seconds')))
+    return int(dirty.sum()), int(changed.sum())
+
+
+def cluster_library(db_path='phash_db.sqlite', max_distance=6, output='clusters.jsonl', keepers=None):
+    """Кластеризация библиотеки и отчет по кластерам из двух и более снимков.
+
+    output - по строке на кластер: JSONL {"cluster", "count", "keeper", "files": [{"path", "phash"}]}
+    или, если имя файла оканчивается на .csv, строки cluster,phash,keep,file_path.
+    keeper - лучший снимок кластера по правилам keepers (KeeperRules).
+    """
+    keepers = keepers or KeeperRules()
+    if not os.path.exists(db_path):
+        print(f"❌ {db_path} not found! Run update_library first")
+        return
+    conn = connect(db_path)
+    c = conn.cursor()
+    init_db(c)
+
+    pending, updated = update_clusters(c, max_distance)
+    conn.commit()
+    if pending:
+        print(f"🧩 Clustered {pending} new or changed images, {updated} cluster ids updated")
+    else:
+        print("✅ Clusters are up to date")
+
+    # Отчет собирается в SQLite по индексу images_cluster
+    c.execute(f'''
+        SELECT images.cluster_id, COUNT(*),
+               json_group_array(json_array(dirs.path || images.name, images.phash, {QUALITY_SQL}))
+        FROM images JOIN dirs ON dirs.id = images.dir_id {QUALITY_JOIN}
+        WHERE images.cluster_id IS NOT NULL
+        GROUP BY images.cluster_id
+        HAVING COUNT(*) > 1
+    ''')
+    csv_output = output.lower().endswith('.csv')
+    groups = 0
+    files_in_groups = 0
+    with open(output, 'w', encoding='utf-8', newline='') as report:
+        writer = csv.writer(report) if csv_output else None
+        if writer:
+            writer.writerow(('cluster', 'phash', 'keep', 'file_path'))
+        for cluster_id, count, files in c:
+            files = sorted((file_path, int_to_phash(phash), quality_from_row(quality))
+                           for file_path, phash, *quality in json.loads(files))
+            keeper = keepers.best([(file_path, quality) for file_path, _, quality in files])
+            groups += 1
+            files_in_groups += count
+            if writer:
+                writer.writerows((cluster_id, phash, int(file_path == keeper), file_path)
+                                 for file_path, phash, _ in files)
+            else:
+                report.write(json.dumps({'cluster': cluster_id, 'count': count, 'keeper': keeper,
+                                         'files': [{'path': path, 'phash': phash} for path, phash, _ in files]},
+                                        ensure_ascii=False) + '\n')
+    conn.close()
+    print(f"✅ Done! {groups} clusters with {files_in_groups} images saved to {output}")
+
+
+if __name__ == '__main__':
+    with open('config.yaml', 'r', encoding='utf-8') as file:
+        application_config = yaml.safe_load(file)
+
+    # Порог для кластеров обычно выше, чем для поиска дубликатов: серии снимков отличаются сильнее копий
+    clusters_config = application_config.get('clusters') or {}
+    cluster_library(max_distance=clusters_config.get('max_distance', 6),
+                    keepers=KeeperRules.from_config(application_config.get('keepers')))
@@ -0,0 +1,120 @@
+import os
+import hashlib
+from hashing import HASH_TYPES
+
+# Сколько байт с начала и с конца файла входит в быстрый дайджест
+QUICK_CHUNK = 64 * 1024
+READ_CHUNK = 1024 * 1024
+
+
+def quick_digest(file_path):
+    """BLAKE2 по началу и концу файла - дешевый фильтр перед полным дайджестом"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        head = f.read(QUICK_CHUNK)
+        h.update(head)
+        if len(head) == QUICK_CHUNK:
+            f.seek(-QUICK_CHUNK, os.SEEK_END)
+            h.update(f.read(QUICK_CHUNK))
+    return h.digest()
+
+
+def full_digest(file_path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def digests_from_bytes(data):
+    """(quick_digest, digest) для уже прочитанного файла - те же значения, что и у функций выше"""
+    quick = hashlib.blake2b(data[:QUICK_CHUNK], digest_size=16)
+    if len(data) >= QUICK_CHUNK:
+        quick.update(data[-QUICK_CHUNK:])
+    return quick.digest(), hashlib.blake2b(data, digest_size=16).digest()
+
+
+# Глобальные функции для multiprocessing
+def process_quick_digest(file_path):
+    try:
+        return (file_path, quick_digest(file_path))
+    except OSError:
+        return (file_path, None)
+
+def process_full_digest(file_path):
+    try:
+        return (file_path, full_digest(file_path))
+    except OSError:
+        return (file_path, None)
+
+
+def _narrow(groups, key):
+    """Оставляем только группы из 2+ элементов, где есть хотя бы один кандидат (rowid is None)"""
+    narrowed = {}
+    for items in groups:
+        for item in items:
+            if item[key] is not None:
+                narrowed.setdefault((item['size'], item[key]), []).append(item)
+    return [
+        items for items in narrowed.values()
+        if len(items) > 1 and any(item['rowid'] is None for item in items)
+    ]
+
+
+def _fill(pool, items, key, worker):
+    pending = {item['file_path']: item for item in items if item[key] is None}
+    for file_path, value in pool.imap_unordered(worker, list(pending), chunksize=16):
+        pending[file_path][key] = value
+        pending[file_path]['computed'] = True
+
+
+def group_identical(pool, c, candidates):
+    """Группы побайтово одинаковых файлов среди кандидатов и записей БД без декодирования изображений.
+
+    candidates - словарь {file_path: size}. Файлы отсеиваются по размеру, затем по
+    дайджесту начала/конца файла и только потом читаются целиком. Дайджесты записей
+    БД, посчитанные по ходу, сохраняются в images (коммит - за вызывающим кодом).
+    Возвращает список групп; элемент группы - словарь с ключами file_path, size,
+    quick_digest, digest, rowid (None для кандидатов) и hashes - словарь хэшей записи БД.
+    """
+    by_size = {}
+    for file_path, size in candidates.items():
+        by_size.setdefault(size, []).append({
+            'file_path': file_path, 'size': size, 'quick_digest': None,
+            'digest': None, 'rowid': None, 'hashes': None, 'computed': False,
+        })
+
+    # 1. Размер: к кандидатам добавляем записи библиотеки того же размера
+    sizes = list(by_size)
+    for i in range(0, len(sizes), 999):
+        chunk = sizes[i:i+999]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'''SELECT id, file_path, size, quick_digest, digest, {', '.join(HASH_TYPES)}
+                      FROM image_files WHERE size IN ({placeholders})''', chunk)
+        for rowid, file_path, size, quick, digest, *hashes in c.fetchall():
+            if file_path in candidates:
+                continue  # старая запись измененного файла - ее дайджесты устарели
+            by_size[size].append({
+                'file_path': file_path, 'size': size, 'quick_digest': quick,
+                'digest': digest, 'rowid': rowid, 'hashes': dict(zip(HASH_TYPES, hashes)), 'computed': False,
+            })
+    groups = [items for items in by_size.values() if len(items) > 1]
+
+    # 2. Начало и конец файла
+    _fill(pool, [item for items in groups for item in items], 'quick_digest', process_quick_digest)
+    groups = _narrow(groups, 'quick_digest')
+
+    # 3. Полный дайджест
+    _fill(pool, [item for items in groups for item in items], 'digest', process_full_digest)
+    groups = _narrow(groups, 'digest')
+
+    library_updates = [
+        (item['quick_digest'], item['digest'], item['rowid'])
+        for items in by_size.values() for item in items
+        if item['rowid'] is not None and item['computed'] and item['quick_digest'] is not None
+    ]
+    if library_updates:
+        c.executemany('UPDATE images SET quick_digest = ?, digest = COALESCE(?, digest) WHERE id = ?',
+                      library_updates)
+    return groups
@@ -0,0 +1,277 @@
+"""Распределенное хэширование: координатор (update_library) раздает пачки файлов воркерам по TCP.
+
+Запуск воркера на другой машине (authkey берется из секции distributed в config.yaml):
+    python distributed_hashing.py <адрес координатора> [порт]
+
+Воркеры сами запрашивают следующую пачку, размер пачки - по числу их ядер; внутри воркера
+пачка делится на части workers.chunked, и func получает список элементов. Пачка
+потерянного воркера возвращается в очередь, а освободившиеся воркеры в конце прохода
+забирают копии самых долгих пачек у медленных (засчитывается первый результат).
+Результаты пишет в SQLite только координатор. Соединения аутентифицируются authkey
+(multiprocessing.connection, HMAC), но данные не шифруются - только для локальной сети.
+"""
+import os
+import sys
+import time
+import queue
+import socket
+import threading
+import collections
+from multiprocessing import Pool, Process, cpu_count, freeze_support
+from multiprocessing.connection import Client, Listener
+import yaml
+from workers import HASH_CHUNK, chunked
+
+DEFAULT_PORT = 6001
+# Файлов в пачке на одно ядро воркера: две части по workers.HASH_CHUNK
+BATCH_PER_PROCESS = 32
+# Через сколько секунд пачку в работе можно отдать еще одному свободному воркеру
+STEAL_AFTER = 5.0
+# Воркер, не приславший результат пачки за это время, считается потерянным
+BATCH_TIMEOUT = 600.0
+# Пауза между попытками воркера подключиться к координатору
+RECONNECT_DELAY = 5.0
+# Сколько элементов ждет раздачи: поток подачи приостанавливается, пока воркеры их не заберут
+MAX_PENDING = 4096
+
+
+class Coordinator:
+    """Раздача работы воркерам. imap_unordered повторяет интерфейс workers.imap_chunks.
+
+    send_bytes=True - воркерам отправляется содержимое файлов (для машин без доступа
+    к библиотеке), иначе только пути, которые должны открываться на воркерах так же.
+    local_worker=True - на этой машине тоже запускается воркер.
+    """
+
+    def __init__(self, host='0.0.0.0', port=DEFAULT_PORT, authkey=b'', send_bytes=False, local_worker=True,
+                 batch_timeout=BATCH_TIMEOUT):
+        if not authkey:
+            raise ValueError("distributed.authkey must be set")
+        self.authkey = authkey
+        self.send_bytes = send_bytes
+        self.batch_timeout = batch_timeout
+        self.listener = Listener((host, port), authkey=authkey)
+        self.cond = threading.Condition()
+        self.func = None
+        self.pending = collections.deque()  # элементы, которые еще не отданы воркерам
+        self.in_flight = {}  # id пачки -> [элементы, время выдачи, число воркеров с этой пачкой]
+        self.results = queue.Queue()
+        self.feeding = False
+        self.feed_error = None
+        self.next_batch = 0
+        self.workers = 0
+        self.closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+        print(f"🌐 Coordinator listening on {host}:{self.listener.address[1]}")
+
+        self.local = None
+        if local_worker:
+            address = ('127.0.0.1', self.listener.address[1])
+            # Не daemon: у daemon-процесса не может быть своего Pool
+            self.local = Process(target=run_worker, args=(address, authkey, None, False))
+            self.local.start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self.closed:
+                    return
+                continue  # неверный authkey или оборванное подключение
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _take(self, size, taken):
+        """Следующая пачка для воркера: (id, функция, элементы) или None при закрытии координатора"""
+        with self.cond:
+            while not self.closed:
+                if self.pending:
+                    items = [self.pending.popleft() for _ in range(min(size, len(self.pending)))]
+                    batch_id = self.next_batch
+                    self.next_batch += 1
+                    self.in_flight[batch_id] = [items, time.monotonic(), 1]
+                    self.cond.notify_all()  # в очереди освободилось место для _feed
+                    return batch_id, self.func, items
+                # Очередь пуста - забираем копию самой старой пачки, которую держит один медленный воркер
+                now = time.monotonic()
+                stealable = [(entry[1], batch_id) for batch_id, entry in self.in_flight.items()
+                             if entry[2] == 1 and batch_id not in taken and now - entry[1] >= STEAL_AFTER]
+                if stealable:
+                    _, batch_id = min(stealable)
+                    self.in_flight[batch_id][2] += 1
+                    return batch_id, self.func, self.in_flight[batch_id][0]
+                self.cond.wait(1.0)
+            return None
+
+    def _complete(self, batch_id, results):
+        with self.cond:
+            # Результат украденной пачки, которую уже вернул другой воркер, отбрасывается
+            if self.in_flight.pop(batch_id, None) is not None:
+                self.results.put(results)
+            self.cond.notify_all()
+
+    def _lost(self, batch_id):
+        with self.cond:
+            entry = self.in_flight.get(batch_id)
+            if entry is not None:
+                entry[2] -= 1
+                if entry[2] == 0:
+                    del self.in_flight[batch_id]
+                    self.pending.extendleft(reversed(entry[0]))
+            self.cond.notify_all()
+
+    def _payload(self, items):
+        if not self.send_bytes:
+            return items
+        payload = []
+        for file_path in items:
+            try:
+                with open(file_path, 'rb') as f:
+                    payload.append((file_path, f.read()))
+            except OSError:
+                payload.append((file_path, b''))  # воркер вернет None, как для битого файла
+        return payload
+
+    def _serve(self, conn):
+        name = '?'
+        batch_id = None
+        connected = False
+        try:
+            _, name, processes = conn.recv()
+            with self.cond:
+                self.workers += 1
+            connected = True
+            print(f"\n🤝 Worker {name} connected ({processes} processes)")
+            taken = set()
+            while True:
+                task = self._take(processes * BATCH_PER_PROCESS, taken)
+                if task is None:
+                    conn.send(('stop',))
+                    return
+                batch_id, func, items = task
+                taken.add(batch_id)
+                conn.send(('batch', batch_id, func, self._payload(items)))
+                if not conn.poll(self.batch_timeout):
+                    raise TimeoutError(f"no result for {self.batch_timeout:.0f}s")
+                _, done_id, results = conn.recv()
+                self._complete(done_id, results)
+                batch_id = None
+        except Exception as e:
+            print(f"\n⚠️ Worker {name} lost ({e or type(e).__name__}), its batch goes back to the queue")
+        finally:
+            if batch_id is not None:
+                self._lost(batch_id)
+            if connected:
+                with self.cond:
+                    self.workers -= 1
+            conn.close()
+
+    def _feed(self, iterable):
+        try:
+            for item in iterable:
+                with self.cond:
+                    while len(self.pending) >= MAX_PENDING and not self.closed:
+                        self.cond.wait(1.0)
+                    self.pending.append(item)
+                    self.cond.notify_all()
+        except BaseException as e:
+            self.feed_error = e
+        finally:
+            with self.cond:
+                self.feeding = False
+                self.cond.notify_all()
+
+    def imap_unordered(self, func, iterable, chunksize=None):
+        """Результаты func по частям iterable (списки элементов) в порядке готовности; chunksize не используется"""
+        with self.cond:
+            self.func = func
+            self.feeding = True
+        threading.Thread(target=self._feed, args=(iterable,), daemon=True).start()
+        waiting_since = time.monotonic()
+        while True:
+            try:
+                yield from self.results.get(timeout=1.0)
+                continue
+            except queue.Empty:
+                pass
+            with self.cond:
+                finished = not self.feeding and not self.pending and not self.in_flight
+                workers = self.workers
+            if finished and self.results.empty():
+                break
+            if workers:
+                waiting_since = time.monotonic()
+            elif time.monotonic() - waiting_since > 30:
+                print("\n⏳ Waiting for workers to connect...")
+                waiting_since = time.monotonic()
+        if self.feed_error is not None:
+            raise self.feed_error
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.listener.close()
+        if self.local is not None:
+            self.local.join(10)
+            if self.local.is_alive():
+                self.local.terminate()
+
+
+def run_worker(address, authkey, processes=None, reconnect=True):
+    """Воркер: подключается к координатору и хэширует пачки, пока тот не скажет 'stop'.
+
+    reconnect=False - завершиться, если координатор недоступен (локальный воркер координатора).
+    """
+    processes = processes or cpu_count()
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    with Pool(processes) as pool:
+        while True:
+            try:
+                conn = Client(address, authkey=authkey)
+            except OSError:
+                if not reconnect:
+                    return
+                time.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                conn.send(('hello', name, processes))
+                while True:
+                    message = conn.recv()
+                    if message[0] == 'stop':
+                        return
+                    _, batch_id, func, items = message
+                    size = max(1, min(HASH_CHUNK, len(items) // processes))
+                    conn.send(('result', batch_id, list(pool.imap_unordered(func, chunked(items, size)))))
+            except (EOFError, OSError):
+                # Координатор перезапущен или сеть моргнула - подключаемся заново
+                if not reconnect:
+                    return
+                time.sleep(RECONNECT_DELAY)
+            finally:
+                conn.close()
+
+
+def coordinator_from_config(config):
+    """Координатор по секции distributed в config.yaml или None, если распределенное хэширование выключено"""
+    config = config or {}
+    if not config.get('enabled'):
+        return None
+    return Coordinator(host=config.get('host', '0.0.0.0'), port=config.get('port', DEFAULT_PORT),
+                       authkey=str(config.get('authkey') or '').encode('utf-8'),
+                       send_bytes=config.get('send_bytes', False), local_worker=config.get('local_worker', True))
+
+
+if __name__ == '__main__':
+    freeze_support()
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    with open('config.yaml', 'r', encoding='utf-8') as file:
+        application_config = yaml.safe_load(file)
+
+    distributed_config = application_config.get('distributed') or {}
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else distributed_config.get('port', DEFAULT_PORT)
+    authkey = str(distributed_config.get('authkey') or '').encode('utf-8')
+    print(f"🛠️ Hashing worker for {sys.argv[1]}:{port} ({cpu_count()} processes), press Ctrl-C to stop")
+    run_worker((sys.argv[1], port), authkey)
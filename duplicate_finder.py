@@ -0,0 +1,238 @@
+import os
+import sqlite3
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from tqdm import tqdm
+from hashing import hash_types_from_config
+from keepers import KeeperRules
+from library_db import DeferredFiles, SortedInts, init_db, load_metadata, save_checked_metadata
+from metrics import Metrics
+from scanner import IMAGE_EXTENSIONS, scan_files
+from phash_index import PhashIndex, hamming
+from digests import group_identical
+from workers import HASH_CHUNK, imap_chunks, process_files_hash
+
+
+# Сколько результатов воркеров сверяется с БД одним запросом (лимит параметров SQLite - 999)
+LOOKUP_BATCH = 500
+
+
+class ResultFile:
+    """Файл результатов, который дописывается построчно по мере поиска (без перевода строки в конце файла)"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8', errors='replace')
+        self.count = 0
+
+    def write(self, line):
+        self.file.write(('\n' if self.count else '') + line)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def passes_filters(hashes, original, filters):
+    """Вторичные фильтры: каждый дополнительный хэш должен быть не дальше своего порога.
+
+    Если хэш не посчитан у одной из сторон (библиотека еще не дохэширована), фильтр не применяется.
+    """
+    for name, limit in filters.items():
+        a, b = hashes.get(name), original.get(name)
+        if a is not None and b is not None and hamming(a, b) > limit:
+            return False
+    return True
+
+
+def lookup_batch(c, batch, filters=None):
+    """Сверка пачки (file_path, hashes, metadata) с БД одним запросом IN (...) по phash"""
+    filters = filters or {}
+    phashes = list({hashes['phash'] for _, hashes, _ in batch if hashes is not None})
+    originals = {}
+    if phashes:
+        placeholders = ','.join(['?'] * len(phashes))
+        columns = ''.join(f', {name}' for name in filters)
+        c.execute(f'SELECT phash, file_path{columns} FROM image_files WHERE phash IN ({placeholders})', phashes)
+        for phash, file_path, *values in c.fetchall():
+            originals.setdefault(phash, []).append((file_path, dict(zip(filters, values))))
+
+    resolved = []
+    for file_path, hashes, _ in batch:
+        original = None
+        if hashes is not None:
+            original = next((path for path, extra in originals.get(hashes['phash'], ())
+                             if passes_filters(hashes, extra, filters)), None)
+        resolved.append((file_path, original))
+    return resolved
+
+
+def find_duplicates(new_dirs, db_path='phash_db.sqlite', output_dup='duplicates.txt', output_uniq='unique.txt',
+                    max_distance=0, preload=False, fast_hash=False, filters=None, keepers=None,
+                    output_better='better_copies.txt', read_ahead=None, metrics=None):
+    """filters - {тип хэша: порог расстояния}: найденный по phash дубликат должен пройти и эти проверки.
+
+    keepers - правила выбора лучшей копии (KeeperRules): дубликат, который лучше своего
+    оригинала в библиотеке, не попадает в duplicates_filtered.txt, а пишется в output_better.
+    read_ahead (readahead.ReadAhead) - файлы заранее читаются потоками в порядке расположения на диске.
+    metrics (metrics.Metrics) - замеры этапов и воркеров.
+    """
+    keepers = keepers or KeeperRules()
+    metrics = metrics or Metrics('find_duplicates')
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    init_db(c)  # БД могла быть создана старой версией
+
+    search_roots = [os.path.normpath(d) for d in new_dirs]  # Нормализуем пути для сравнения
+    filters = filters or {}
+    hash_types = hash_types_from_config(filters)
+    filters = {name: filters[name] for name in hash_types[1:]}
+
+    # Для поиска похожих (не только идентичных) изображений строим индекс по расстоянию Хэмминга,
+    # для точного поиска индекс (словарь phash -> путь) строится только по запросу - он занимает память
+    index = None
+    metrics.begin('index')
+    if max_distance > 0 or preload:
+        print(f"🧭 Building phash index (max Hamming distance {max_distance})...")
+        index = PhashIndex.from_db(db_path, max_distance, extra=tuple(filters))
+        print(f"Indexed {len(index)} distinct hashes")
+
+    def resolve(batch):
+        if index is None:
+            return lookup_batch(c, batch, filters)
+        resolved = []
+        for file_path, hashes, _ in batch:
+            original = None
+            if hashes is not None:
+                original = index.nearest_path(
+                    hashes['phash'], accept=lambda path: passes_filters(hashes, index.extra.get(path, {}), filters))
+            resolved.append((file_path, original))
+        return resolved
+
+    # Результаты пишутся в файлы по мере обработки пачек, а не копятся в памяти до конца поиска
+    print(f"💾 Results are written to {output_dup} and {output_uniq} as files are checked")
+    dup_file = ResultFile(output_dup)
+    filtered_file = ResultFile('duplicates_filtered.txt')  # только из проверяемых директорий
+    better_file = ResultFile(output_better)  # копии лучше библиотечных: их стоит оставить вместо оригинала
+    uniq_file = ResultFile(output_uniq)
+    # Метаданные прошлого поиска больше не нужны: в таблице только файлы этого запуска
+    c.execute('DELETE FROM checked_metadata')
+
+    def write_duplicate(file_path, original, better=False):
+        dup_file.write(f"{file_path}\t{original}")
+        if better:
+            better_file.write(f"{file_path}\t{original}")
+        elif any(os.path.normpath(file_path).startswith(root) for root in search_roots):
+            filtered_file.write(file_path)
+
+    def collect(resolved):
+        # Сравнение копий по метаданным, сохраненным при хэшировании пачки;
+        # без метаданных у одной из сторон остается оригинал из библиотеки
+        quality = load_metadata(c, {path for file_path, original in resolved if original
+                                    for path in (file_path, original)})
+        for file_path, original in resolved:
+            if not original:
+                uniq_file.write(file_path)
+                continue
+            write_duplicate(file_path, original, file_path in quality and original in quality and keepers.best(
+                [(original, quality[original]), (file_path, quality[file_path])]) == file_path)
+
+    def store_metadata(batch):
+        save_checked_metadata(c, [(file_path, *metadata[:2], metadata[2])
+                                  for file_path, _, metadata in batch if metadata is not None])
+
+    def hash_and_resolve(pool, files, progress):
+        batch = []
+        chunksize = HASH_CHUNK
+        if read_ahead is not None:
+            files = read_ahead(files, inode=lambda file_path: inodes.pop(file_path, None))
+            chunksize = read_ahead.chunksize
+        # Воркер хэширует пачку файлов и возвращает список результатов
+        worker = partial(process_files_hash, fast=fast_hash, hash_types=hash_types)
+        for results in metrics.imap(partial(imap_chunks, pool), worker, files, chunksize=chunksize, profile=True):
+            batch.extend(results)
+            if len(batch) >= LOOKUP_BATCH:
+                with metrics.timer('db'):
+                    store_metadata(batch)
+                    collect(resolve(batch))
+                batch = []
+            progress.update(len(results))
+        if batch:
+            with metrics.timer('db'):
+                store_metadata(batch)
+                collect(resolve(batch))
+
+    # Файл, размер которого не встречается в библиотеке, не может быть ее побайтовой копией
+    c.execute('SELECT DISTINCT size FROM images WHERE size IS NOT NULL')
+    library_sizes = SortedInts(size for size, in c)
+
+    # Кандидаты в копии ждут конца сканирования во временной БД, а не в памяти
+    candidates = DeferredFiles()
+    inodes = {}  # для сортировки чтения по расположению на диске: только файлы, ушедшие на хэширование
+    total_files = 0
+    settled = 0
+
+    def discover():
+        """Сбор файлов: остальные уходят на хэширование сразу, кандидаты в копии - откладываются"""
+        nonlocal total_files
+        for file_path, fingerprint in scan_files(new_dirs, IMAGE_EXTENSIONS):
+            total_files += 1
+            if fingerprint is not None and fingerprint[0] in library_sizes:
+                candidates.hold(file_path, fingerprint)
+                continue
+            if fingerprint is not None and read_ahead is not None:
+                inodes[file_path] = fingerprint[2]
+            yield file_path
+
+    def deferred():
+        for file_path, fingerprint, _ in candidates.pending():
+            if read_ahead is not None:
+                inodes[file_path] = fingerprint[2]
+            yield file_path
+
+    try:
+        with Pool(cpu_count()) as pool:
+            print("🔍 Collecting files to check (hashing starts as soon as they are found)...")
+            metrics.begin('scan_and_hash')
+            with tqdm(desc="Analyzing", unit="file") as progress:
+                hash_and_resolve(pool, metrics.produce(discover(), 'scan'), progress)
+
+            if total_files == 0:
+                print("❌ No files to process!")
+                return
+
+            # Побайтовые копии файлов библиотеки определяются по размеру и дайджестам, без декодирования.
+            # Они равноценны оригиналу и по метаданным не сравниваются
+            metrics.begin('identical_copies')
+            print(f"⚖️ Checking {candidates.count()} files for byte-identical copies...")
+            for batch in candidates.size_groups():
+                found = []
+                for items in group_identical(pool, c, {file_path: fingerprint[0]
+                                                       for file_path, fingerprint, _ in batch}):
+                    known = next((item for item in items if item['rowid'] is not None), None)
+                    if known is None:
+                        continue
+                    for item in items:
+                        if item['rowid'] is None:
+                            write_duplicate(item['file_path'], known['file_path'])
+                            found.append(item['file_path'])
+                candidates.forget(found)
+                settled += len(found)
+                conn.commit()  # дайджесты файлов библиотеки, посчитанные по ходу
+            print(f"📑 Byte-identical copies: {settled}")
+
+            metrics.begin('hash_deferred')
+            with tqdm(total=candidates.count(), desc="Analyzing deferred", unit="file") as progress:
+                hash_and_resolve(pool, deferred(), progress)
+        print(f"🕵️ Processed {total_files} files")
+        print(f"✅ Done! Duplicates: {dup_file.count}, Filtered duplicates: {filtered_file.count}, "
+              f"Better than library: {better_file.count}, Unique: {uniq_file.count}")
+    finally:
+        for result_file in (dup_file, filtered_file, better_file, uniq_file):
+            result_file.close()
+        conn.commit()  # метаданные проверенных файлов
+        conn.close()
+        candidates.close()
+        # Замеры сохраняются и для пустого или прерванного запуска
+        metrics.update({'files': total_files, 'duplicates': dup_file.count, 'byte_identical': settled,
+                        'better_than_library': better_file.count, 'unique': uniq_file.count})
+        metrics.save()
@@ -1,15 +1,15 @@
 import os
-import sqlite3
-from PIL import Image
-import imagehash
-from multiprocessing import Pool, cpu_count, freeze_support
-from tqdm import tqdm
+from multiprocessing import freeze_support
 import yaml
 import sys
 import locale
-import tkinter as tk
-from tkinter import filedialog
 from pathlib import Path
+from hashing import hash_types_from_config
+from keepers import KeeperRules
+from library_db import create_db
+from duplicate_finder import find_duplicates
+from readahead import ReadAhead
+from metrics import Metrics
 
 # Фикс для кодировки в Windows
 if sys.platform.startswith('win'):
@@ -21,145 +21,12 @@ if sys.platform.startswith('win'):
 
 
 
-# Глобальные функции для multiprocessing
-def process_file_create(file_path):
-    try:
-        with Image.open(file_path) as img:
-            phash = str(imagehash.phash(img))
-            return (phash, file_path)
-    except Exception as e:
-        return None
+def select_directory(max_distance=0, fast_hash=False, filters=None, keepers=None, read_ahead=None, metrics=None):
+    # tkinter импортируется только при выборе папки: без него запуск быстрее,
+    # а процессы-воркеры при spawn не загружают Tcl/Tk
+    import tkinter as tk
+    from tkinter import filedialog
 
-def process_file_find(args):
-    file_path, db_path = args
-    try:
-        with Image.open(file_path) as img:
-            phash = str(imagehash.phash(img))
-            conn = sqlite3.connect(db_path)
-            c = conn.cursor()
-            c.execute('SELECT file_path FROM images WHERE phash = ?', (phash,))
-            result = c.fetchone()
-            conn.close()
-            return (file_path, result[0] if result else None)
-    except Exception as e:
-        return (file_path, None)
-
-
-def create_db(home_library_path, db_path='phash_db.sqlite'):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    print("home_library_path - ",home_library_path)
-    
-    # Создаем таблицу и индексы (если не существуют)
-    c.execute('''CREATE TABLE IF NOT EXISTS images 
-                (phash TEXT, file_path TEXT UNIQUE)''')  # Добавляем UNIQUE constraint
-    c.execute('CREATE INDEX IF NOT EXISTS phash_idx ON images (phash)')
-    c.execute('CREATE INDEX IF NOT EXISTS file_path_idx ON images (file_path)')
-
-    # Загружаем существующие пути из БД
-    existing_files = set()
-    print("🕵️ Checking existing files in database...")
-    c.execute('SELECT file_path FROM images')
-    for row in c.fetchall():
-        existing_files.add(row[0])
-    print(f"Found {len(existing_files)} pre-existing files in DB")
-
-    # Фильтруем новые файлы
-    print("🔍 Scanning for new files...")
-    new_files = []
-    for root, _, files in os.walk(home_library_path):
-        for f in files:
-            file_path = os.path.join(root, f)
-            if file_path.lower().endswith(('jpg', 'jpeg', 'png', 'gif', 'bmp')) and file_path not in existing_files:
-                new_files.append(file_path)
-
-    total_new = len(new_files)
-    if total_new == 0:
-        print("✅ All files already in database!")
-        conn.close()
-        return
-
-    # Обработка только новых файлов с прогресс-баром
-    progress = tqdm(total=total_new, desc="Processing", unit="file")
-    
-    with Pool(cpu_count()) as pool:
-        for result in pool.imap_unordered(process_file_create, new_files, chunksize=50):
-            if result:
-                try:
-                    c.execute('INSERT INTO images VALUES (?, ?)', result)
-                except sqlite3.IntegrityError:  # На случай параллельных записей
-                    pass
-            progress.update()
-    
-    conn.commit()
-    progress.close()
-    print(f"Added {total_new} new files to database")
-    conn.close()
-
-
-def find_duplicates(new_dirs, db_path='phash_db.sqlite', output_dup='duplicates.txt', output_uniq='unique.txt'):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-
-    # Сбор файлов
-    print("🔍 Collecting files to check...")
-    new_files = []
-    search_roots = [os.path.normpath(d) for d in new_dirs]  # Нормализуем пути для сравнения
-    
-    for d in new_dirs:
-        for root, _, files in os.walk(d):
-            for f in files:
-                if f.lower().endswith(('jpg', 'jpeg', 'png', 'gif', 'bmp')):
-                    new_files.append(os.path.join(root, f))
-
-    total_files = len(new_files)
-    if total_files == 0:
-        print("❌ No files to process!")
-        conn.close()
-        return
-
-    # Подготовка аргументов
-    args_list = [(file_path, db_path) for file_path in new_files]
-
-    # Обработка с прогресс-баром
-    duplicates = []
-    unique = []
-    
-    print(f"🕵️ Processing {total_files} files...")
-    with tqdm(total=total_files, desc="Analyzing", unit="file") as progress:
-        with Pool(cpu_count()) as pool:
-            for file_path, original in pool.imap_unordered(process_file_find, args_list):
-                if original:
-                    duplicates.append((file_path, original))
-                else:
-                    unique.append(file_path)
-                progress.update()
-
-    # Сохранение результатов с корректной кодировкой
-    print("💾 Saving results...")
-    
-    # 1. Полная версия duplicates.txt
-    with open(output_dup, 'w', encoding='utf-8', errors='replace') as f:
-        f.write('\n'.join([f"{dup[0]}\t{dup[1]}" for dup in duplicates]))
-    
-    # 2. Фильтрованная версия duplicates_filtered.txt (только из проверяемых директорий)
-    filtered_duplicates = [
-        dup for dup in duplicates 
-        if any(os.path.normpath(dup[0]).startswith(root) for root in search_roots)
-    ]
-    
-    with open('duplicates_filtered.txt', 'w', encoding='utf-8', errors='replace') as f:
-        f.write('\n'.join([dup[0] for dup in filtered_duplicates]))
-    
-    # Файл unique.txt
-    with open(output_uniq, 'w', encoding='utf-8', errors='replace') as f:
-        f.write('\n'.join(unique))
-
-    conn.close()
-    print(f"✅ Done! Duplicates: {len(duplicates)}, Filtered duplicates: {len(filtered_duplicates)}, Unique: {len(unique)}")
-
-
-def select_directory():
     # Создаем скрытое основное окно Tkinter
     root = tk.Tk()
     root.withdraw()  # Скрываем главное окно
@@ -174,7 +41,8 @@ def select_directory():
     if directory:  # Если пользователь выбрал каталог
         normalized_path = Path(directory).resolve().as_posix().replace('/', '\\')
         print("Выбор - ",normalized_path)
-        find_duplicates([normalized_path])
+        find_duplicates([normalized_path], max_distance=max_distance, fast_hash=fast_hash, filters=filters,
+                        keepers=keepers, read_ahead=read_ahead, metrics=metrics)
     else:
         print("Выбор отменен.")    
 
@@ -184,14 +52,30 @@ if __name__ == '__main__':
         application_config = yaml.safe_load(file)
 
     photo_db_path=(application_config['library']['path'])
+    # Максимальное расстояние Хэмминга между phash (0 - только точные совпадения)
+    max_distance = (application_config.get('duplicates') or {}).get('max_distance', 0)
+    # Пороги для дополнительных хэшей (dhash, colorhash, ...) - вторичный фильтр к phash
+    filters = (application_config.get('duplicates') or {}).get('filters') or {}
+    # Быстрое хэширование по уменьшенному декодированию JPEG
+    hashing_config = application_config.get('hashing') or {}
+    fast_hash = hashing_config.get('fast_decode', False)
+    hash_types = hash_types_from_config([*(hashing_config.get('types') or []), *filters])
+    # Правила выбора лучшей копии: разрешение, EXIF, формат, размер, папки prefer/avoid
+    keepers = KeeperRules.from_config(application_config.get('keepers'))
+    # Упреждающее чтение файлов для HDD и сетевых дисков
+    read_ahead = ReadAhead.from_config(application_config.get('readahead'))
+    # Замеры этапов в JSON (секция metrics)
+    metrics_config = application_config.get('metrics')
 
     # Проверка наличия файла
     if not os.path.exists('phash_db.sqlite'):
-        create_db(photo_db_path)
+        create_db(photo_db_path, fast_hash=fast_hash, hash_types=hash_types, read_ahead=read_ahead,
+                  metrics=Metrics.from_config(metrics_config, 'create_db'))
         
     else:
         print("Файл phash_db.sqlite существует.")
-        select_directory()
+        select_directory(max_distance, fast_hash, filters, keepers, read_ahead,
+                         Metrics.from_config(metrics_config, 'find_duplicates'))
     freeze_support()
     # create_db('F:\\Фотографии')  # Раскомментировать для первого запуска
     #find_duplicates(['E:\\Аня фото с дисков\\Google фото Takeout\\Google Фото'])
@@ -1,77 +1,108 @@
 import os
+import csv
+import json
 import sqlite3
-from tqdm import tqdm
-import tkinter as tk
-from tkinter import filedialog
 from pathlib import Path
+import yaml
+from hashing import int_to_phash
+from keepers import QUALITY_JOIN, QUALITY_SQL, KeeperRules, quality_from_row
+from library_db import init_db, prefix_range
+from metrics import Metrics
 
 def find_internal_duplicates(target_dir, db_path='phash_db.sqlite', 
-                            output_all='internal_duplicates.txt',
-                            output_filtered='internal_duplicates_filtered.txt'):
+                            output_all='internal_duplicates.jsonl',
+                            output_filtered='internal_duplicates_filtered.txt',
+                            keepers=None, metrics=None):
+    """Группы одинаковых phash внутри папки библиотеки.
+
+    output_all - по строке на группу: JSONL {"phash", "count", "keeper", "files"} или,
+    если имя файла оканчивается на .csv, строки group,phash,keep,file_path.
+    output_filtered - все копии, кроме keeper - лучшей по правилам keepers (KeeperRules).
+    metrics (metrics.Metrics) - замеры этапов.
+    """
+    keepers = keepers or KeeperRules()
+    metrics = metrics or Metrics('find_internal_duplicates')
     # Нормализуем путь для поиска в БД
     target_dir = os.path.normpath(target_dir) + os.sep
     
     conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    
-    print("🔍 Searching for files in target directory...")
-    # Ищем все файлы в целевой папке и подпапках
-    c.execute('''
-        SELECT phash, file_path 
-        FROM images 
-        WHERE file_path LIKE ? || '%'
-    ''', (target_dir,))
-    
-    files_in_target = c.fetchall()
-    
-    if not files_in_target:
-        print("❌ No files found in target directory!")
-        conn.close()
-        return
+    try:
+        c = conn.cursor()
+        init_db(c)  # БД могла быть создана старой версией
 
-    print(f"📁 Found {len(files_in_target)} files in target directory")
-    
-    # Группируем по phash
-    hash_groups = {}
-    for phash, file_path in files_in_target:
-        if phash not in hash_groups:
-            hash_groups[phash] = []
-        hash_groups[phash].append(file_path)
-    
-    # Фильтруем группы с дубликатами
-    duplicates = {k: v for k, v in hash_groups.items() if len(v) > 1}
-    
-    print(f"🔄 Found {len(duplicates)} duplicate groups")
-    
-    # Формируем списки для записи
-    all_duplicates = []
-    filtered_duplicates = []
-    
-    for group in duplicates.values():
-        # Записываем все комбинации
-        for i in range(len(group)):
-            for j in range(i+1, len(group)):
-                all_duplicates.append(f"{group[i]}\t{group[j]}")
-        
-        # Для filtered только первые пути
-        filtered_duplicates.extend(group[1:])
-    
-    # Сохраняем результаты
-    print("💾 Saving results...")
-    
-    # 1. Полный список всех пар дубликатов
-    with open(output_all, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(all_duplicates))
-    
-    # 2. Список дубликатов для удаления (все копии кроме первого)
-    with open(output_filtered, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(filtered_duplicates))
-    
-    conn.close()
-    print(f"✅ Done! Total duplicate pairs: {len(all_duplicates)}, Files to delete: {len(filtered_duplicates)}")
+        # Все подпапки target_dir - диапазон [target_dir, следующая строка после префикса) по индексу dirs.path_key
+        low, high = prefix_range(target_dir)
+        in_target = 'images.dir_id IN (SELECT id FROM dirs WHERE path_key >= ? AND path_key < ?)'
+    
+        metrics.begin('count')
+        print("🔍 Searching for files in target directory...")
+        c.execute(f'SELECT COUNT(*) FROM images WHERE {in_target}', (low, high))
+        files_in_target = c.fetchone()[0]
+    
+        metrics.update({'files': files_in_target})
+        if not files_in_target:
+            print("❌ No files found in target directory!")
+            return
+
+        print(f"📁 Found {files_in_target} files in target directory")
+    
+        # Запрос и запись результатов - один этап: группы читаются из курсора по мере записи
+        metrics.begin('group_and_save')
+        # Группировка целиком в SQLite: в Python приходят только группы с дубликатами, по одной,
+        # вместе с метаданными для выбора лучшей копии
+        c.execute(f'''
+            SELECT images.phash, COUNT(*), json_group_array(json_array(dirs.path || images.name, {QUALITY_SQL}))
+            FROM images JOIN dirs ON dirs.id = images.dir_id {QUALITY_JOIN}
+            WHERE {in_target} AND images.phash IS NOT NULL
+            GROUP BY images.phash
+            HAVING COUNT(*) > 1
+        ''', (low, high))
+    
+        csv_output = output_all.lower().endswith('.csv')
+        groups = 0
+        files_to_delete = 0
+    
+        # Результаты пишутся по мере чтения групп
+        print("💾 Saving results...")
+        with open(output_all, 'w', encoding='utf-8', newline='') as all_file, \
+                open(output_filtered, 'w', encoding='utf-8') as filtered_file:
+            writer = csv.writer(all_file) if csv_output else None
+            if writer:
+                writer.writerow(('group', 'phash', 'keep', 'file_path'))
+            for phash, count, files in c:
+                files = sorted((file_path, quality_from_row(quality)) for file_path, *quality in json.loads(files))
+                keeper = keepers.best(files)
+                files = [file_path for file_path, _ in files]
+                phash = int_to_phash(phash)
+                groups += 1
+                if writer:
+                    writer.writerows((groups, phash, int(file_path == keeper), file_path) for file_path in files)
+                else:
+                    all_file.write(json.dumps({'phash': phash, 'count': count, 'keeper': keeper, 'files': files},
+                                              ensure_ascii=False) + '\n')
+            
+                # Для filtered - все копии, кроме той, что остается
+                for file_path in files:
+                    if file_path == keeper:
+                        continue
+                    filtered_file.write(('\n' if files_to_delete else '') + file_path)
+                    files_to_delete += 1
+    
+        print(f"🔄 Found {groups} duplicate groups")
+        print(f"✅ Done! Duplicate groups: {groups}, Files to delete: {files_to_delete}")
+        metrics.update({'groups': groups, 'files_to_delete': files_to_delete})
+    finally:
+        conn.close()
+        # Отчет пишется и при раннем выходе, и при ошибке
+        metrics.save()
     
 
-def select_directory():
+def select_directory(keepers=None, metrics=None):
+    # tkinter импортируется только при выборе папки: без него запуск быстрее,
+    # а процессы-воркеры при spawn не загружают Tcl/Tk
+    import tkinter as tk
+    from tkinter import filedialog
+
     # Создаем скрытое основное окно Tkinter
     root = tk.Tk()
     root.withdraw()  # Скрываем главное окно
@@ -86,7 +117,7 @@ def select_directory():
     if directory:  # Если пользователь выбрал каталог
         normalized_path = Path(directory).resolve().as_posix().replace('/', '\\')
         print("Выбор - ",normalized_path)
-        find_internal_duplicates(normalized_path)
+        find_internal_duplicates(normalized_path, keepers=keepers, metrics=metrics)
     else:
         print("Выбор отменен.")  
     
@@ -94,4 +125,9 @@ def select_directory():
 if __name__ == '__main__':
     #target_directory = 'F:\\Фотографии\\2023'  # Укажите нужный путь
     #find_internal_duplicates(target_directory)
-    select_directory()
\ No newline at end of file
+    with open('config.yaml', 'r', encoding='utf-8') as file:
+        application_config = yaml.safe_load(file)
+
+    # Правила выбора копии, которая остается в библиотеке
+    select_directory(KeeperRules.from_config(application_config.get('keepers')),
+                     Metrics.from_config(application_config.get('metrics'), 'find_internal_duplicates'))
\ No newline at end of file
@@ -0,0 +1,152 @@
+import importlib.util
+import numpy as np
+from PIL import Image
+import imagehash
+
+# phash все равно сжимает изображение до 32x32, поэтому для быстрого режима
+# достаточно декодировать картинку с меньшей стороной не меньше этого значения
+FAST_HASH_MIN_SIDE = 256
+
+# Поддерживаемые хэши - у каждого своя колонка в images. phash считается всегда
+HASH_FUNCTIONS = {
+    'phash': imagehash.phash,
+    'dhash': imagehash.dhash,
+    'ahash': imagehash.average_hash,
+    'whash': imagehash.whash,
+    'colorhash': imagehash.colorhash,
+}
+HASH_TYPES = tuple(HASH_FUNCTIONS)
+
+# phash, как в imagehash: 32x32 пикселя -> DCT -> 8x8 низких частот -> биты выше медианы
+PHASH_SIZE = 8
+PHASH_IMAGE_SIZE = PHASH_SIZE * 4
+# Строки DCT-II без нормировки (как scipy.fftpack.dct) только для 8 низких частот
+DCT_MATRIX = 2 * np.cos(np.pi * np.arange(PHASH_SIZE)[:, None]
+                        * (2 * np.arange(PHASH_IMAGE_SIZE) + 1) / (2 * PHASH_IMAGE_SIZE))
+# Коэффициент ближе к медиане, чем на эту величину, - бит зависит от погрешности округления.
+# Такие изображения (почти однотонные) пересчитываются через scipy, как в imagehash
+PHASH_TIE_TOLERANCE = 1e-4
+
+
+def reduce_factor(size):
+    """Наибольший коэффициент уменьшения (8, 4, 2), при котором меньшая сторона >= FAST_HASH_MIN_SIDE"""
+    for factor in (8, 4, 2):
+        if min(size) // factor >= FAST_HASH_MIN_SIDE:
+            return factor
+    return 1
+
+
+def prepare_image(img, fast=False, mode='L'):
+    """Подготовка открытого изображения к хэшированию.
+
+    В быстром режиме JPEG декодируется сразу в уменьшенном масштабе (DCT scaling
+    через Image.draft, до 1/8) и только по яркости, остальные форматы уменьшаются
+    через Image.reduce до передачи в phash. Обычно хэш совпадает с полным
+    декодированием, на мелкодетальных снимках отличается не более чем на 2 бита
+    (см. benchmarks/decode_benchmark.py). Поэтому библиотеку и проверяемые папки
+    нужно хэшировать в одном режиме либо искать с duplicates.max_distance >= 2.
+    mode='RGB' сохраняет цвет для colorhash.
+    """
+    if not fast:
+        return img
+    factor = reduce_factor(img.size)
+    if factor == 1:
+        return img
+    if img.format == 'JPEG':
+        img.draft(mode, (img.width // factor, img.height // factor))
+        return img
+    return img.convert(mode).reduce(factor)
+
+
+def phash_pixels(gray):
+    """Изображение в оттенках серого, уменьшенное до 32x32 так же, как в imagehash.phash"""
+    return np.asarray(gray.resize((PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE), Image.LANCZOS), dtype=np.float64)
+
+
+def phash_batch(pixels):
+    """phash пачки изображений: pixels - массив (N, 32, 32) из phash_pixels -> N знаковых int64, как phash_to_int.
+
+    DCT всей пачки - два матричных умножения, медианы и упаковка битов в uint64 - по всем строкам
+    сразу, без scipy и hex-строк на каждый файл. Результат совпадает с imagehash.phash бит в бит.
+    """
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE)
+    low = (DCT_MATRIX @ pixels @ DCT_MATRIX.T).reshape(len(pixels), -1)
+    medians = np.median(low, axis=1, keepdims=True)
+    ties = np.flatnonzero((np.abs(low - medians) <= PHASH_TIE_TOLERANCE).any(axis=1))
+    if len(ties):
+        import scipy.fftpack
+        for i in ties:
+            dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels[i], axis=0), axis=1)
+            low[i] = dct[:PHASH_SIZE, :PHASH_SIZE].ravel()
+            medians[i] = np.median(low[i])
+    # Первый коэффициент - старший бит, как в строке ImageHash
+    return np.packbits(low > medians, axis=1).view('>i8').ravel().astype(np.int64)
+
+
+def compute_phash(img, fast=False):
+    return int_to_phash(int(phash_batch(phash_pixels(prepare_image(img, fast).convert('L')))[0]))
+
+
+def hash_types_from_config(names):
+    """Список хэшей из config.yaml (hashing.types): phash первым, без неизвестных и недоступных"""
+    hash_types = ['phash']
+    for name in names or ():
+        if name not in HASH_FUNCTIONS:
+            print(f"⚠️ Unknown hash type '{name}' ignored, supported: {', '.join(HASH_TYPES)}")
+        elif name == 'whash' and importlib.util.find_spec('pywt') is None:
+            print("⚠️ whash requires PyWavelets (pip install PyWavelets), ignored")
+        elif name not in hash_types:
+            hash_types.append(name)
+    return tuple(hash_types)
+
+
+def image_hashes(img, hash_types=('phash',), fast=False):
+    """Все запрошенные хэши по одному декодированию, кроме phash: ({тип: знаковое целое}, pixels).
+
+    Изображение декодируется и переводится в оттенки серого один раз, функции
+    imagehash получают уже готовую картинку. Для colorhash сохраняется цвет
+    (в быстром режиме JPEG тогда декодируется в RGB, а не только по яркости).
+    Для phash возвращаются только пиксели 32x32 (None, если phash не запрошен), а сам
+    хэш дописывает fill_phashes - сразу для всей пачки изображений.
+    """
+    color = 'colorhash' in hash_types
+    img = prepare_image(img, fast, 'RGB' if color else 'L')
+    gray = img.convert('L')
+    hashes = {}
+    pixels = None
+    for name in hash_types:
+        if name == 'colorhash':
+            hashes[name] = phash_to_int(imagehash.colorhash(img.convert('RGB')))
+        elif name == 'phash':
+            hashes[name] = None
+            pixels = phash_pixels(gray)
+        else:
+            hashes[name] = phash_to_int(HASH_FUNCTIONS[name](gray))
+    return hashes, pixels
+
+
+def fill_phashes(pending):
+    """phash для списка (хэши, pixels) из image_hashes одним вызовом phash_batch; pixels=None пропускаются"""
+    pending = [(hashes, pixels) for hashes, pixels in pending if pixels is not None]
+    if pending:
+        values = phash_batch(np.stack([pixels for _, pixels in pending])).tolist()
+        for (hashes, _), value in zip(pending, values):
+            hashes['phash'] = value
+
+
+def compute_hashes(img, hash_types=('phash',), fast=False):
+    """Все запрошенные хэши одного изображения: {тип: знаковое целое}"""
+    hashes, pixels = image_hashes(img, hash_types, fast)
+    fill_phashes([(hashes, pixels)])
+    return hashes
+
+
+def phash_to_int(phash):
+    """Хэш (hex-строка или ImageHash) -> знаковое 64-битное целое для колонки INTEGER в SQLite"""
+    value = int(str(phash), 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def int_to_phash(value):
+    """Обратное преобразование: целое из БД -> 16-символьная hex-строка, как у imagehash"""
+    return f'{value & 0xFFFFFFFFFFFFFFFF:016x}'
@@ -0,0 +1,71 @@
+import os
+
+# Критерии выбора копии, которая остается, по убыванию важности (keepers.order в config.yaml):
+# решает первый критерий, по которому копии различаются
+DEFAULT_ORDER = ('path', 'resolution', 'exif', 'format', 'size')
+# Форматы от лучшего к худшему: JPEG - обычно оригинал с камеры, PNG и BMP - конвертации, GIF - 256 цветов
+DEFAULT_FORMATS = ('jpg', 'jpeg', 'png', 'bmp', 'gif')
+
+# Поля качества из images и metadata, записанные при индексации - декодировать файлы не нужно
+QUALITY_FIELDS = ('size', 'width', 'height', 'date_taken', 'camera', 'orientation')
+QUALITY_SQL = ('images.size, metadata.width, metadata.height, '
+               'metadata.date_taken, metadata.camera, metadata.orientation')
+QUALITY_JOIN = 'LEFT JOIN metadata ON metadata.dir_id = images.dir_id AND metadata.name = images.name'
+
+
+class KeeperRules:
+    """Ранжирование копий одного снимка по метаданным из БД.
+
+    prefer и avoid - подстроки пути (без учета регистра): копия из папки prefer
+    выигрывает у остальных, копия из папки avoid (например, Takeout) - проигрывает.
+    При полном равенстве остается копия, которая идет в списке первой.
+    """
+
+    def __init__(self, order=DEFAULT_ORDER, prefer=(), avoid=(), formats=DEFAULT_FORMATS):
+        self.criteria = []
+        for name in order:
+            if name in DEFAULT_ORDER:
+                self.criteria.append(getattr(self, f'_{name}'))
+            else:
+                print(f"⚠️ Unknown keeper criterion '{name}' ignored, supported: {', '.join(DEFAULT_ORDER)}")
+        self.prefer = [rule.lower() for rule in prefer]
+        self.avoid = [rule.lower() for rule in avoid]
+        self.formats = {ext.lower().lstrip('.'): len(formats) - i for i, ext in enumerate(formats)}
+
+    @classmethod
+    def from_config(cls, config):
+        """Правила из секции keepers в config.yaml"""
+        config = config or {}
+        return cls(order=config.get('order') or DEFAULT_ORDER, prefer=config.get('prefer') or (),
+                   avoid=config.get('avoid') or (), formats=config.get('formats') or DEFAULT_FORMATS)
+
+    def _path(self, file_path, quality):
+        path = file_path.lower()
+        if any(rule in path for rule in self.avoid):
+            return -1
+        return 1 if any(rule in path for rule in self.prefer) else 0
+
+    def _resolution(self, file_path, quality):
+        return (quality.get('width') or 0) * (quality.get('height') or 0)
+
+    def _exif(self, file_path, quality):
+        return sum(quality.get(name) is not None for name in ('date_taken', 'camera', 'orientation'))
+
+    def _format(self, file_path, quality):
+        return self.formats.get(os.path.splitext(file_path)[1].lower().lstrip('.'), 0)
+
+    def _size(self, file_path, quality):
+        return quality.get('size') or 0
+
+    def rank(self, file_path, quality):
+        """Ключ сортировки: лучшая копия - наименьший ключ"""
+        return tuple(-criterion(file_path, quality) for criterion in self.criteria)
+
+    def best(self, files):
+        """files - список (file_path, словарь QUALITY_FIELDS); путь копии, которая остается"""
+        return min(files, key=lambda item: self.rank(*item))[0]
+
+
+def quality_from_row(values):
+    """Значения QUALITY_SQL (например, из json_array в запросе по группам) -> словарь QUALITY_FIELDS"""
+    return dict(zip(QUALITY_FIELDS, values))
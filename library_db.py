@@ -0,0 +1,839 @@
+import os
+import sys
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from itertools import groupby
+import numpy as np
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from tqdm import tqdm
+from hashing import HASH_TYPES, phash_to_int
+from digests import group_identical
+from metadata import copy_metadata
+from scanner import IMAGE_EXTENSIONS, scan_files
+from metrics import Metrics
+from workers import HASH_CHUNK, imap_chunks, process_file_backfill, process_files_create
+
+# Версия схемы хранится в PRAGMA user_version. Версия 0 - исходная таблица
+# images (phash TEXT, file_path TEXT UNIQUE) с колонками, добавленными через ALTER TABLE,
+# версия 2 - компактная схема только с phash, версия 3 - колонки для всех типов хэшей,
+# версия 4 - cluster_id для кластеризации библиотеки, версия 5 - dirs.path_key для поиска по префиксу
+SCHEMA_VERSION = 5
+
+# Колонки, которые могли быть добавлены к таблице версии 0
+LEGACY_EXTRA_COLUMNS = ('size', 'mtime_ns', 'inode', 'quick_digest', 'digest')
+
+# Сколько отложенных файлов (целыми группами одного размера) проверяется на побайтовые копии за раз
+DEFERRED_BATCH = 2000
+
+# Колонки metadata и checked_metadata, которые отдает load_metadata
+METADATA_FIELDS = ('size', 'mtime_ns', 'date_taken', 'date_source', 'width', 'height', 'camera', 'orientation')
+
+
+def create_schema(c):
+    """Схема версии 5.
+
+    phash - 64-битное INTEGER (знаковое, как в SQLite) вместо 16-символьной строки,
+    дайджесты - BLOB. Путь разбит на директорию (таблица dirs, путь с завершающим
+    разделителем) и имя файла. images - обычная rowid-таблица: поиск по phash идет
+    через images_phash и сразу попадает в строку по rowid, а единственный индекс
+    по пути - UNIQUE (dir_id, name). Представление image_files собирает полный путь
+    обратно для запросов на чтение. Дополнительные хэши (dhash, ahash, whash,
+    colorhash) хранятся в своих колонках, NULL - еще не посчитан. cluster_id - id
+    кластера похожих изображений (cluster_library.py), NULL - запись еще не кластеризована.
+    dirs.path_key - путь директории в виде os.path.normcase (на Windows - в нижнем регистре)
+    для поиска подпапок по префиксу без учета регистра, см. prefix_range.
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS dirs
+                (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE, path_key TEXT)''')
+    c.execute('CREATE INDEX IF NOT EXISTS dirs_key ON dirs (path_key)')
+    c.execute('''CREATE TABLE IF NOT EXISTS images
+                (id INTEGER PRIMARY KEY,
+                 phash INTEGER, dhash INTEGER, ahash INTEGER, whash INTEGER, colorhash INTEGER,
+                 dir_id INTEGER NOT NULL REFERENCES dirs (id),
+                 name TEXT NOT NULL,
+                 size INTEGER, mtime_ns INTEGER, inode INTEGER,
+                 quick_digest BLOB, digest BLOB, cluster_id INTEGER,
+                 UNIQUE (dir_id, name))''')
+    c.execute('CREATE INDEX IF NOT EXISTS images_phash ON images (phash)')
+    c.execute('CREATE INDEX IF NOT EXISTS images_size ON images (size)')
+    c.execute('CREATE INDEX IF NOT EXISTS images_cluster ON images (cluster_id)')
+    create_view(c)
+
+
+def create_view(c):
+    c.execute('DROP VIEW IF EXISTS image_files')
+    c.execute(f'''CREATE VIEW image_files AS
+                SELECT images.id, {', '.join(f'images.{name}' for name in HASH_TYPES)},
+                       dirs.path || images.name AS file_path,
+                       images.size, images.mtime_ns, images.inode, images.quick_digest, images.digest
+                FROM images JOIN dirs ON dirs.id = images.dir_id''')
+
+
+def add_columns(c):
+    """Версии 2-4 -> 5: колонки дополнительных хэшей (значения досчитываются при обновлении
+    библиотеки), cluster_id (заполняется при первом запуске cluster_library.py) и dirs.path_key"""
+    c.execute('PRAGMA table_info(images)')
+    columns = {row[1] for row in c.fetchall()}
+    for name in (*HASH_TYPES, 'cluster_id'):
+        if name not in columns:
+            c.execute(f'ALTER TABLE images ADD COLUMN {name} INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS images_cluster ON images (cluster_id)')
+    c.execute('PRAGMA table_info(dirs)')
+    if 'path_key' not in {row[1] for row in c.fetchall()}:
+        c.execute('ALTER TABLE dirs ADD COLUMN path_key TEXT')
+        c.executemany('UPDATE dirs SET path_key = ? WHERE id = ?',
+                      [(dir_key(path), rowid) for rowid, path in c.execute('SELECT id, path FROM dirs').fetchall()])
+    c.execute('CREATE INDEX IF NOT EXISTS dirs_key ON dirs (path_key)')
+    create_view(c)
+    c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    c.connection.commit()
+
+
+def split_path(file_path):
+    """Путь -> (директория с завершающим разделителем, имя файла)"""
+    directory, name = os.path.split(os.path.normpath(file_path))
+    if not directory.endswith(os.sep):
+        directory += os.sep
+    return directory, name
+
+
+def dir_key(directory):
+    """Ключ директории для dirs.path_key: на Windows регистр и вид разделителей не важны"""
+    return os.path.normcase(directory)
+
+
+def prefix_range(directory):
+    """Границы [low, high) для поиска директорий с префиксом directory через индекс dirs.path_key.
+
+    Сравнение >= / < идет по индексу, регистр выравнивается через dir_key. Если у префикса
+    нет следующей строки (он состоит из символов U+10FFFF), верхняя граница - пустой BLOB:
+    в SQLite любой текст меньше любого BLOB.
+    """
+    low = dir_key(directory)
+    stem = low.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return low, b''
+    last = ord(stem[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        last = 0xE000  # суррогаты не кодируются в UTF-8
+    return low, stem[:-1] + chr(last)
+
+
+def _hex_to_blob(value):
+    try:
+        return bytes.fromhex(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def migrate_db(c):
+    """Перенос БД версии 0 в текущую схему одной транзакцией"""
+    c.execute('PRAGMA table_info(images)')
+    columns = {row[1] for row in c.fetchall()}
+    extras = ', '.join(name if name in columns else 'NULL' for name in LEGACY_EXTRA_COLUMNS)
+
+    c.execute('BEGIN')
+    c.execute('ALTER TABLE images RENAME TO images_v0')
+    for index in ('phash_idx', 'file_path_idx', 'size_idx'):
+        c.execute(f'DROP INDEX IF EXISTS {index}')
+    create_schema(c)
+
+    dir_ids = DirIds(c)
+    read = c.connection.cursor()
+    read.execute(f'SELECT phash, file_path, {extras} FROM images_v0')
+    migrated = 0
+    while rows := read.fetchmany(10000):
+        batch = []
+        for phash, file_path, size, mtime_ns, inode, quick_digest, digest in rows:
+            directory, name = split_path(file_path)
+            try:
+                phash = phash_to_int(phash)
+            except (TypeError, ValueError):
+                phash = None
+            batch.append((phash, dir_ids(directory), name, size, mtime_ns, inode,
+                          _hex_to_blob(quick_digest), _hex_to_blob(digest)))
+        c.executemany('''INSERT OR IGNORE INTO images
+                         (phash, dir_id, name, size, mtime_ns, inode, quick_digest, digest)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', batch)
+        migrated += len(batch)
+    c.execute('DROP TABLE images_v0')
+    c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    c.connection.commit()
+    return migrated
+
+
+def init_db(c):
+    """Создание схемы или миграция БД старого формата"""
+    c.execute('PRAGMA user_version')
+    version = c.fetchone()[0]
+    if version < SCHEMA_VERSION:
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'")
+        if not c.fetchone():
+            create_schema(c)
+            c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        elif version < 2:
+            print("🛠️ Migrating phash DB to the compact schema...")
+            print(f"Migrated {migrate_db(c)} rows")
+        else:
+            add_columns(c)
+
+    # Чекпоинт незавершенного наполнения БД: строка есть - прошлый запуск был прерван
+    c.execute('''CREATE TABLE IF NOT EXISTS ingest_checkpoint
+                (id INTEGER PRIMARY KEY CHECK (id = 1), library_path TEXT,
+                 started TEXT, total INTEGER, done INTEGER)''')
+
+    # Метаданные файлов библиотеки для photo_organizer, собранные при хэшировании.
+    # size и mtime_ns - отпечаток, по которому видно, что запись не устарела
+    c.execute('''CREATE TABLE IF NOT EXISTS metadata
+                (id INTEGER PRIMARY KEY,
+                 dir_id INTEGER NOT NULL REFERENCES dirs (id),
+                 name TEXT NOT NULL,
+                 size INTEGER, mtime_ns INTEGER,
+                 date_taken TEXT, date_source TEXT, width INTEGER, height INTEGER,
+                 camera TEXT, orientation INTEGER,
+                 UNIQUE (dir_id, name))''')
+    # Метаданные файлов проверяемых папок (find_duplicates) - только последнего поиска:
+    # таблица очищается в начале каждого поиска и не добавляет строк в dirs
+    c.execute('''CREATE TABLE IF NOT EXISTS checked_metadata
+                (file_path TEXT PRIMARY KEY,
+                 size INTEGER, mtime_ns INTEGER,
+                 date_taken TEXT, date_source TEXT, width INTEGER, height INTEGER,
+                 camera TEXT, orientation INTEGER)''')
+
+    # Параметры последней кластеризации: при смене порога кластеры строятся заново
+    c.execute('''CREATE TABLE IF NOT EXISTS cluster_state
+                (id INTEGER PRIMARY KEY CHECK (id = 1), max_distance INTEGER, updated TEXT)''')
+
+
+class DirIds:
+    """Кэш id директорий из таблицы dirs; недостающие директории добавляются"""
+
+    def __init__(self, c):
+        self.c = c
+        self.ids = {}
+
+    def __call__(self, directory):
+        dir_id = self.ids.get(directory)
+        if dir_id is None:
+            self.c.execute('INSERT OR IGNORE INTO dirs (path, path_key) VALUES (?, ?)', (directory, dir_key(directory)))
+            self.c.execute('SELECT id FROM dirs WHERE path = ?', (directory,))
+            dir_id = self.ids[directory] = self.c.fetchone()[0]
+        return dir_id
+
+
+class SortedInts:
+    """Множество целых чисел в отсортированном массиве numpy: 8 байт на значение вместо ~70 у set"""
+
+    def __init__(self, values):
+        self.values = np.unique(np.fromiter(values, dtype=np.int64))
+
+    def __contains__(self, value):
+        i = int(np.searchsorted(self.values, value))
+        return i < len(self.values) and self.values[i] == value
+
+    def __len__(self):
+        return len(self.values)
+
+
+class DeferredFiles:
+    """Файлы, судьба которых решается после сканирования (перемещенные файлы и кандидаты
+    в побайтовые копии), - во временной БД SQLite, а не в словарях: память create_db и
+    find_duplicates не растет с числом файлов.
+
+    files - путь, отпечаток, id записи измененного файла (NULL для нового), а у копии
+    среди новых файлов - путь лидера и ее дайджесты; sizes - размеры файлов, уже
+    отправленных на хэширование. Пустое имя - временная БД, которая удаляется при закрытии.
+    Сканер пишет сюда из потока подачи Pool, поэтому обращения идут под блокировкой.
+    """
+
+    def __init__(self):
+        self.conn = sqlite3.connect('', check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute('''CREATE TABLE files
+                             (file_path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,
+                              changed_id INTEGER, leader TEXT, quick_digest BLOB, digest BLOB)''')
+        self.conn.execute('CREATE INDEX files_size ON files (size, file_path)')
+        self.conn.execute('CREATE INDEX files_leader ON files (leader)')
+        self.conn.execute('CREATE TABLE sizes (size INTEGER PRIMARY KEY)')
+
+    def first_size(self, size):
+        """True, если файлов такого размера еще не отправлялось на хэширование (размер запоминается)"""
+        with self.lock:
+            return self.conn.execute('INSERT OR IGNORE INTO sizes VALUES (?)', (size,)).rowcount == 1
+
+    def hold(self, file_path, fingerprint, changed_id=None):
+        with self.lock:
+            self.conn.execute('''INSERT OR REPLACE INTO files (file_path, size, mtime_ns, inode, changed_id)
+                                 VALUES (?, ?, ?, ?, ?)''', (file_path, *fingerprint, changed_id))
+
+    def count(self, pending=False):
+        """Число отложенных файлов; pending=True - только тех, что нужно декодировать (без лидера)"""
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM files{' WHERE leader IS NULL' if pending else ''}"
+                                     ).fetchone()[0]
+
+    def size_groups(self, limit=DEFERRED_BATCH):
+        """Списки (путь, отпечаток, id измененной записи) из целых групп одного размера, около limit файлов.
+
+        Страницы читаются по ключу (size, file_path), поэтому между ними строки можно удалять и менять.
+        """
+        last = (-1, '')
+        batch = []
+        while True:
+            with self.lock:
+                rows = self.conn.execute('''SELECT file_path, size, mtime_ns, inode, changed_id FROM files
+                                             WHERE (size, file_path) > (?, ?) ORDER BY size, file_path LIMIT 1000''',
+                                          last).fetchall()
+            if not rows:
+                break
+            for file_path, size, mtime_ns, inode, changed_id in rows:
+                if len(batch) >= limit and size != batch[-1][1][0]:
+                    yield batch
+                    batch = []
+                batch.append((file_path, (size, mtime_ns, inode), changed_id))
+            last = (rows[-1][1], rows[-1][0])
+        if batch:
+            yield batch
+
+    def pending(self):
+        """(путь, отпечаток, id измененной записи) файлов без лидера - их нужно декодировать"""
+        last = ''
+        while True:
+            with self.lock:
+                rows = self.conn.execute('''SELECT file_path, size, mtime_ns, inode, changed_id FROM files
+                                             WHERE leader IS NULL AND file_path > ? ORDER BY file_path LIMIT 1000''',
+                                          (last,)).fetchall()
+            if not rows:
+                return
+            for file_path, size, mtime_ns, inode, changed_id in rows:
+                yield file_path, (size, mtime_ns, inode), changed_id
+            last = rows[-1][0]
+
+    def follow(self, followers):
+        """followers - список (лидер, быстрый дайджест, дайджест, путь копии): копия получит хэши лидера"""
+        with self.lock:
+            self.conn.executemany('UPDATE files SET leader = ?, quick_digest = ?, digest = ? WHERE file_path = ?',
+                                  followers)
+
+    def followers(self, leader):
+        """(путь, отпечаток, id измененной записи, быстрый дайджест, дайджест) копий лидера"""
+        with self.lock:
+            rows = self.conn.execute('''SELECT file_path, size, mtime_ns, inode, changed_id, quick_digest, digest
+                                         FROM files WHERE leader = ?''', (leader,)).fetchall()
+        return [(file_path, (size, mtime_ns, inode), changed_id, quick, digest)
+                for file_path, size, mtime_ns, inode, changed_id, quick, digest in rows]
+
+    def forget(self, file_paths):
+        with self.lock:
+            self.conn.executemany('DELETE FROM files WHERE file_path = ?', [(file_path,) for file_path in file_paths])
+
+    def changed_left(self):
+        """{путь: id записи} измененных файлов, которые остались отложенными (так и не сохранены)"""
+        with self.lock:
+            return dict(self.conn.execute('SELECT file_path, changed_id FROM files WHERE changed_id IS NOT NULL'))
+
+    def close(self):
+        self.conn.close()
+
+
+def save_metadata(c, dir_ids, rows):
+    """rows - список (file_path, size, mtime_ns, метаданные из read_metadata)"""
+    values = []
+    for file_path, size, mtime_ns, metadata in rows:
+        directory, name = split_path(file_path)
+        values.append((dir_ids(directory), name, size, mtime_ns, *metadata))
+    c.executemany('''INSERT OR REPLACE INTO metadata
+                     (dir_id, name, size, mtime_ns, date_taken, date_source, width, height, camera, orientation)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', values)
+
+
+def save_checked_metadata(c, rows):
+    """Метаданные файлов проверяемых папок; rows - список (file_path, size, mtime_ns, метаданные из read_metadata)"""
+    c.executemany(f'''INSERT OR REPLACE INTO checked_metadata (file_path, {', '.join(METADATA_FIELDS)})
+                     VALUES ({', '.join('?' * (len(METADATA_FIELDS) + 1))})''',
+                  [(os.path.normpath(file_path), size, mtime_ns, *metadata)
+                   for file_path, size, mtime_ns, metadata in rows])
+
+
+def load_metadata(c, file_paths):
+    """Метаданные для списка путей: {file_path: словарь колонок}.
+
+    Файлы библиотеки ищутся по директориям: id директории определяется один раз, имена -
+    через индекс UNIQUE (dir_id, name) пачками. Остальные пути - в checked_metadata.
+    """
+    by_dir = {}
+    for file_path in file_paths:
+        directory, name = split_path(file_path)
+        by_dir.setdefault(directory, {})[name] = file_path
+
+    result = {}
+    for directory, names in by_dir.items():
+        c.execute('SELECT id FROM dirs WHERE path = ?', (directory,))
+        row = c.fetchone()
+        if row is None:
+            continue
+        names_list = list(names)
+        for i in range(0, len(names_list), 900):
+            chunk = names_list[i:i + 900]
+            c.execute(f'''SELECT name, {', '.join(METADATA_FIELDS)} FROM metadata
+                          WHERE dir_id = ? AND name IN ({','.join(['?'] * len(chunk))})''', (row[0], *chunk))
+            for name, *values in c.fetchall():
+                result[names[name]] = dict(zip(METADATA_FIELDS, values))
+
+    rest = {os.path.normpath(file_path): file_path for file_path in file_paths if file_path not in result}
+    paths = list(rest)
+    for i in range(0, len(paths), 900):
+        chunk = paths[i:i + 900]
+        c.execute(f'''SELECT file_path, {', '.join(METADATA_FIELDS)} FROM checked_metadata
+                      WHERE file_path IN ({','.join(['?'] * len(chunk))})''', chunk)
+        for file_path, *values in c.fetchall():
+            result[rest[file_path]] = dict(zip(METADATA_FIELDS, values))
+    return result
+
+
+def forget_metadata(c, file_paths):
+    """Удаление метаданных файлов, которые были перемещены"""
+    rows = []
+    for file_path in file_paths:
+        directory, name = split_path(file_path)
+        rows.append((name, directory))
+    c.executemany('''DELETE FROM metadata WHERE name = ?
+                     AND dir_id = (SELECT id FROM dirs WHERE path = ?)''', rows)
+    c.executemany('DELETE FROM checked_metadata WHERE file_path = ?',
+                  [(os.path.normpath(file_path),) for file_path in file_paths])
+
+
+def reset_clusters(c, rowids):
+    """Сброс кластеров, в которые входят записи rowids: удаленный или перехэшированный файл
+    мог связывать части кластера, поэтому все его участники кластеризуются заново"""
+    rowids = list(rowids)
+    for i in range(0, len(rowids), 999):
+        chunk = rowids[i:i + 999]
+        placeholders = ','.join(['?'] * len(chunk))
+        c.execute(f'''UPDATE images SET cluster_id = NULL WHERE cluster_id IN
+                      (SELECT cluster_id FROM images WHERE id IN ({placeholders}) AND cluster_id IS NOT NULL)''',
+                  chunk)
+
+
+def relink_rows(c, dir_ids, relinked):
+    """Перемещенные/переименованные файлы: запись и метаданные переносятся на новый путь без перехэширования.
+
+    relinked - список (новый путь, id записи).
+    """
+    rows = []
+    for file_path, rowid in relinked:
+        directory, name = split_path(file_path)
+        rows.append((dir_ids(directory), name, rowid))
+    c.executemany('''UPDATE OR REPLACE metadata SET dir_id = ?, name = ?
+                     WHERE (dir_id, name) = (SELECT dir_id, name FROM images WHERE id = ?)''', rows)
+    c.executemany('UPDATE images SET dir_id = ?, name = ? WHERE id = ?', rows)
+
+
+def delete_rows(c, rowids):
+    """Удаление записей исчезнувших файлов вместе с метаданными; их кластеры пересчитаются. Возвращает число записей"""
+    rowids = list(rowids)
+    deleted = 0
+    for i in range(0, len(rowids), 999):
+        chunk = rowids[i:i + 999]
+        placeholders = ','.join(['?'] * len(chunk))
+        reset_clusters(c, chunk)
+        c.execute(f'''DELETE FROM metadata WHERE (dir_id, name) IN
+                      (SELECT dir_id, name FROM images WHERE id IN ({placeholders}))''', chunk)
+        c.execute(f'DELETE FROM images WHERE id IN ({placeholders})', chunk)
+        deleted += c.rowcount
+    return deleted
+
+
+def connect(db_path):
+    """Подключение к БД в режиме WAL: запись не блокирует читателей и не требует fsync на каждый коммит"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class IngestWriter:
+    """Пакетная запись результатов хэширования в images.
+
+    Строки копятся в буфере и пишутся через executemany, коммит - каждые batch_size
+    строк или commit_interval секунд вместе с чекпоинтом. После сбоя или Ctrl-C
+    закоммиченные файлы при следующем запуске распознаются по отпечатку как
+    неизмененные, поэтому наполнение продолжается с места остановки.
+
+    Сохраненные файлы удаляются из fingerprints и changed: в changed остаются только
+    измененные файлы, которые так и не удалось перехэшировать.
+    """
+
+    def __init__(self, conn, fingerprints, changed, batch_size=1000, commit_interval=5.0):
+        self.conn = conn
+        self.dir_ids = DirIds(conn.cursor())
+        self.fingerprints = fingerprints  # путь -> отпечаток файла, ожидающего сохранения
+        self.changed = changed  # путь измененного файла -> id его записи
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.inserts = []
+        self.updates = []
+        self.metadata = []
+        self.saved = 0
+        self.updated = 0
+        self.total = None
+        self.done_before = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.last_commit = time.monotonic()
+
+    def begin(self, library_path):
+        c = self.conn.cursor()
+        c.execute('SELECT started, total, done FROM ingest_checkpoint WHERE id = 1')
+        previous = c.fetchone()
+        started = datetime.now().isoformat(timespec='seconds')
+        if previous:
+            started, previous_total, self.done_before = previous
+            print(f"♻️ Resuming interrupted ingest started {started}: "
+                  f"{self.done_before} of {previous_total or '?'} files were already saved")
+        c.execute('INSERT OR REPLACE INTO ingest_checkpoint VALUES (1, ?, ?, NULL, ?)',
+                  (library_path, started, self.done_before))
+        self.conn.commit()
+
+    def save(self, hashes, file_path, quick_digest, digest, metadata=None):
+        """hashes - словарь {тип хэша: значение}, отсутствующие типы пишутся как NULL"""
+        fingerprint = self.fingerprints.pop(file_path)
+        if metadata is not None:
+            self.metadata.append((file_path, *fingerprint[:2], metadata))
+        values = [hashes.get(name) for name in HASH_TYPES]
+        rowid = self.changed.pop(file_path, None)
+        if rowid is not None:
+            self.updates.append((*values, *fingerprint, quick_digest, digest, rowid))
+            self.updated += 1
+        else:
+            directory, name = split_path(file_path)
+            self.inserts.append((*values, self.dir_ids(directory), name, *fingerprint, quick_digest, digest))
+        self.saved += 1
+        if (len(self.inserts) + len(self.updates) >= self.batch_size
+                or time.monotonic() - self.last_commit >= self.commit_interval):
+            self.flush()
+
+    def flush(self):
+        start = time.perf_counter()
+        c = self.conn.cursor()
+        # INSERT OR IGNORE - на случай, если файл уже попал в БД параллельным запуском
+        c.executemany(f'''INSERT OR IGNORE INTO images
+                          ({', '.join(HASH_TYPES)}, dir_id, name, size, mtime_ns, inode, quick_digest, digest)
+                          VALUES ({', '.join('?' * (len(HASH_TYPES) + 7))})''', self.inserts)
+        # Файл изменен - перехэшируем запись на месте, его кластер пересчитается
+        reset_clusters(c, [row[-1] for row in self.updates])
+        c.executemany(f'''UPDATE images SET {', '.join(f'{name} = ?' for name in HASH_TYPES)},
+                          size = ?, mtime_ns = ?, inode = ?, quick_digest = ?, digest = ? WHERE id = ?''',
+                      self.updates)
+        save_metadata(c, self.dir_ids, self.metadata)
+        self.rows += len(self.inserts) + len(self.updates)
+        self.inserts, self.updates, self.metadata = [], [], []
+        c.execute('UPDATE ingest_checkpoint SET done = ?, total = COALESCE(?, total) WHERE id = 1',
+                  (self.done_before + self.saved, self.total and self.done_before + self.total))
+        self.conn.commit()
+        self.db_time += time.perf_counter() - start
+        self.last_commit = time.monotonic()
+
+    def finish(self):
+        self.flush()
+        self.conn.execute('DELETE FROM ingest_checkpoint WHERE id = 1')
+        self.conn.commit()
+        rate = self.rows / self.db_time if self.db_time else 0
+        print(f"💽 DB writes: {self.rows} rows in {self.db_time:.2f}s ({rate:.0f} rows/sec)")
+
+
+def backfill_hashes(pool, conn, hash_types, fast=False):
+    """Досчет хэшей, добавленных в hashing.types после индексации библиотеки.
+
+    Файлы декодируются заново, но считаются только недостающие колонки; результаты
+    пишутся пачками, поэтому прерванный досчет продолжается со следующего запуска.
+    """
+    c = conn.cursor()
+    where = ' OR '.join(f'{name} IS NULL' for name in hash_types)
+    c.execute(f'SELECT id, file_path, {", ".join(hash_types)} FROM image_files '
+              f'WHERE phash IS NOT NULL AND ({where})')
+    items = [(row[0], row[1], tuple(name for name, value in zip(hash_types, row[2:]) if value is None))
+             for row in c.fetchall()]
+    if not items:
+        return 0
+
+    print(f"🧮 Computing {', '.join(hash_types[1:])} for {len(items)} files indexed without them...")
+    sql = f'UPDATE images SET {", ".join(f"{name} = COALESCE(?, {name})" for name in HASH_TYPES)} WHERE id = ?'
+    updates = []
+    filled = 0
+    for rowid, hashes in tqdm(pool.imap_unordered(partial(process_file_backfill, fast=fast), items, chunksize=16),
+                              total=len(items), desc="Backfilling hashes", unit="file"):
+        if hashes is None:
+            continue
+        updates.append((*(hashes.get(name) for name in HASH_TYPES), rowid))
+        if len(updates) >= 1000:
+            c.executemany(sql, updates)
+            conn.commit()
+            filled += len(updates)
+            updates = []
+    c.executemany(sql, updates)
+    conn.commit()
+    return filled + len(updates)
+
+
+def create_db(home_library_path, db_path='phash_db.sqlite', fast_hash=False, batch_size=1000, commit_interval=5.0,
+              hash_types=('phash',), coordinator=None, read_ahead=None, metrics=None):
+    """Индексация библиотеки.
+
+    coordinator (distributed_hashing.Coordinator) раздает хэширование воркерам по сети,
+    read_ahead (readahead.ReadAhead) заранее читает файлы для воркеров локального Pool,
+    metrics (metrics.Metrics) - замеры этапов и воркеров.
+    """
+    metrics = metrics or Metrics('create_db')
+    conn = connect(db_path)
+    c = conn.cursor()
+    print("home_library_path - ", home_library_path)
+
+    init_db(c)
+
+    # Записи БД не загружаются в память целиком: записи директории читаются, когда до нее дошел
+    # сканер, а найденные на диске записи отмечаются в seen (байт на запись) - остальные пропали
+    metrics.begin('index')
+    print("🕵️ Checking existing files in database...")
+    c.execute('SELECT COALESCE(MAX(id), 0), COUNT(*) FROM images')
+    max_id, existing_count = c.fetchone()
+    print(f"Found {existing_count} pre-existing files in DB")
+    seen = bytearray(max_id + 1)
+    c.execute('SELECT DISTINCT size FROM images WHERE size IS NOT NULL')
+    known_sizes = SortedInts(size for size, in c)
+
+    # В памяти - только файлы, которые сейчас хэшируются; отложенные до конца сканирования - в deferred
+    fingerprints = {}
+    changed = {}
+    deferred = DeferredFiles()
+    adopted = []
+    new_count = 0
+    changed_count = 0
+    unchanged = 0
+
+    def expect(file_path, fingerprint, changed_id):
+        """Отложенный файл уходит на хэширование или сохраняется как копия: writer возьмет отпечаток отсюда"""
+        fingerprints[file_path] = fingerprint
+        if changed_id is not None:
+            changed[file_path] = changed_id
+
+    def discover():
+        """Сканирование библиотеки: новые и измененные файлы уходят на хэширование сразу по мере обнаружения"""
+        nonlocal new_count, changed_count, unchanged
+        # Генератор читает поток Pool (координатора, ReadAhead), поэтому у него свое соединение с БД
+        read = sqlite3.connect(db_path)
+        scanned = ((os.path.normpath(file_path), fingerprint)
+                   for file_path, fingerprint in scan_files([home_library_path], IMAGE_EXTENSIONS)
+                   if fingerprint is not None)
+        try:
+            # Сканер отдает файлы директории подряд - записи каждой директории читаются одним запросом
+            for directory, files in groupby(scanned, key=lambda item: split_path(item[0])[0]):
+                rows = read.execute('''SELECT images.name, images.id, images.size, images.mtime_ns, images.inode
+                                       FROM images JOIN dirs ON dirs.id = images.dir_id
+                                       WHERE dirs.path = ?''', (directory,))
+                existing = {name: (rowid, tuple(fingerprint)) for name, rowid, *fingerprint in rows}
+                for file_path, fingerprint in files:
+                    known = existing.get(split_path(file_path)[1])
+                    changed_id = None
+                    if known is None:
+                        new_count += 1
+                    else:
+                        seen[known[0]] = 1
+                        if known[1][0] is None:
+                            # Запись из старой БД без отпечатка - доверяем хэшу и просто запоминаем отпечаток
+                            adopted.append((*fingerprint, known[0]))
+                            continue
+                        if known[1] == fingerprint:
+                            unchanged += 1
+                            continue
+                        changed_id = known[0]
+                        changed_count += 1
+
+                    # Файл того же размера, что и уже известный, может оказаться перемещенным файлом
+                    # или побайтовой копией - его судьба решается после сканирования
+                    size = fingerprint[0]
+                    if size in known_sizes or not deferred.first_size(size):
+                        deferred.hold(file_path, fingerprint, changed_id)
+                    else:
+                        expect(file_path, fingerprint, changed_id)
+                        yield file_path
+        finally:
+            read.close()
+
+    writer = IngestWriter(conn, fingerprints, changed, batch_size, commit_interval)
+    writer.begin(home_library_path)
+    try:
+        with Pool(cpu_count()) as pool:
+            # Воркер получает пачку файлов и возвращает список результатов: phash пачки - одним phash_batch
+            worker = partial(process_files_create, fast=fast_hash, hash_types=hash_types)
+            # Декодирование - на воркерах координатора, если он есть; дайджесты и досчет хэшей - всегда локально
+            if coordinator is not None:
+                hash_map = coordinator.imap_unordered
+            elif read_ahead is not None:
+                # Воркеры получают уже прочитанные байты, чтение идет в порядке расположения файлов на диске
+                def hash_map(func, files, chunksize):
+                    return imap_chunks(pool, func, read_ahead(files, inode=lambda path: fingerprints[path][2]),
+                                       read_ahead.chunksize)
+            else:
+                hash_map = partial(imap_chunks, pool)
+
+            metrics.begin('scan_and_hash')
+            print("🔍 Scanning for new and changed files (hashing starts as soon as they are found)...")
+            progress = tqdm(desc="Processing", unit="file")
+            for results in metrics.imap(hash_map, worker, metrics.produce(discover(), 'scan'), chunksize=HASH_CHUNK,
+                                        profile=True):
+                for result in results:
+                    if result:
+                        writer.save(*result)
+                progress.update(len(results))
+            progress.close()
+
+            metrics.begin('relink_and_cleanup')
+            if adopted:
+                c.executemany('UPDATE images SET size = ?, mtime_ns = ?, inode = ? WHERE id = ?', adopted)
+                print(f"🏷️ Stored fingerprints for {len(adopted)} files indexed by an older version")
+            print(f"✅ Unchanged files skipped: {unchanged}")
+
+            # Записи, которых сканер не нашел на диске (записи, добавленные этим запуском, - после max_id)
+            missing = {}
+            missing_rowids = []
+            c.execute('SELECT id, size, mtime_ns, inode FROM images WHERE id <= ?', (max_id,))
+            for rowid, *fingerprint in c:
+                if not seen[rowid]:
+                    missing_rowids.append(rowid)
+                    if fingerprint[0] is not None:
+                        missing.setdefault(tuple(fingerprint), []).append(rowid)
+
+            # Перемещенные/переименованные файлы: тот же отпечаток, новый путь - переносим запись без декодирования
+            relinked = []
+            if missing:
+                for batch in deferred.size_groups():
+                    for file_path, fingerprint, changed_id in batch:
+                        rowids = None if changed_id is not None else missing.get(fingerprint)
+                        if rowids:
+                            relinked.append((file_path, rowids.pop()))
+                deferred.forget(file_path for file_path, _ in relinked)
+
+            if relinked:
+                relink_rows(c, writer.dir_ids, relinked)
+                print(f"🔗 Re-linked {len(relinked)} moved or renamed files")
+            relinked_rowids = {rowid for _, rowid in relinked}
+            missing_rowids = [rowid for rowid in missing_rowids if rowid not in relinked_rowids]
+            if missing_rowids:
+                print(f"🧹 Found {len(missing_rowids)} files in DB that are missing on disk. Cleaning up...")
+                total_deleted = delete_rows(c, missing_rowids)
+                print(f"🚮 Removed {total_deleted} entries from DB")
+            else:
+                print("✅ No missing files to clean up in DB")
+
+            # Фиксируем проход по метаданным и уже посчитанные хэши - дальше с ними сверяются отложенные файлы
+            writer.total = new_count - len(relinked) + changed_count
+            writer.flush()
+
+            # Побайтовые копии (файлы одного размера -> дайджест начала/конца -> полный дайджест)
+            # получают phash уже известного файла без декодирования. Отложенные файлы проверяются
+            # пачками целых групп одного размера
+            metrics.begin('identical_copies')
+            print("⚖️ Checking for byte-identical copies...")
+            copied = 0
+            for batch in deferred.size_groups():
+                info = {file_path: (fingerprint, changed_id) for file_path, fingerprint, changed_id in batch}
+                groups = group_identical(pool, c, {file_path: fingerprint[0]
+                                                   for file_path, (fingerprint, _) in info.items()})
+                # Копии известных файлов получают метаданные оригинала - для выбора лучшей копии и photo_organizer
+                known_metadata = load_metadata(c, {item['file_path'] for items in groups for item in items
+                                                   if item['rowid'] is not None})
+                saved = []
+                followers = []
+                for items in groups:
+                    known = next((item for item in items
+                                  if item['rowid'] is not None and item['hashes']['phash'] is not None), None)
+                    candidates = [item for item in items if item['rowid'] is None]
+                    if known is None:
+                        # Копии только среди новых файлов - декодируем первую, остальным отдаем ее хэш
+                        leader, candidates = candidates[0], candidates[1:]
+                        followers += [(leader['file_path'], item['quick_digest'], item['digest'], item['file_path'])
+                                      for item in candidates]
+                    else:
+                        original = known_metadata.get(known['file_path'])
+                        for item in candidates:
+                            expect(item['file_path'], *info[item['file_path']])
+                            writer.save(known['hashes'], item['file_path'], item['quick_digest'], item['digest'],
+                                        copy_metadata(original, item['file_path']) if original else None)
+                            saved.append(item['file_path'])
+                    copied += len(candidates)
+                deferred.forget(saved)
+                deferred.follow(followers)
+            if copied:
+                print(f"📑 {copied} files are byte-identical copies and need no decoding")
+
+            metrics.begin('hash_deferred')
+
+            def to_decode():
+                for file_path, fingerprint, changed_id in deferred.pending():
+                    expect(file_path, fingerprint, changed_id)
+                    yield file_path
+
+            progress = tqdm(total=deferred.count(pending=True), desc="Processing deferred", unit="file")
+            for results in metrics.imap(hash_map, worker, to_decode(), chunksize=HASH_CHUNK, profile=True):
+                for result in results:
+                    if result:
+                        writer.save(*result)
+                        # Дата из имени и пути лидера не переносится на копию с другим именем
+                        followers = deferred.followers(result[1])
+                        for file_path, fingerprint, changed_id, quick_digest, digest in followers:
+                            expect(file_path, fingerprint, changed_id)
+                            writer.save(result[0], file_path, quick_digest, digest,
+                                        copy_metadata(result[4], file_path) if result[4] else None)
+                        deferred.forget([result[1], *(item[0] for item in followers)])
+                progress.update(len(results))
+            progress.close()
+            # Измененные файлы, которые так и не удалось сохранить (битый лидер и его копии), - в changed
+            changed.update(deferred.changed_left())
+
+            # Хэши, включенные в hashing.types позже: побайтовые копии могли унаследовать NULL от оригинала
+            metrics.begin('backfill')
+            writer.flush()
+            backfilled = backfill_hashes(pool, conn, hash_types, fast_hash) if len(hash_types) > 1 else 0
+            if backfilled:
+                print(f"🧮 Added missing hashes for {backfilled} files")
+    except BaseException:
+        # Ctrl-C или сбой: сохраняем все, что уже посчитано - повторный запуск продолжит с этого места
+        writer.flush()
+        deferred.close()
+        print(f"\n⏸️ Interrupted: {writer.saved} files saved, run again to resume")
+        conn.close()
+        # Замеры прерванного запуска тоже сохраняются - долгий прогон обычно и прерывают
+        metrics.add('files_saved', writer.saved)
+        metrics.save()
+        raise
+
+    deferred.close()
+    metrics.begin('finish')
+    # Измененные файлы, которые больше не открываются (остались в changed), не должны оставаться в БД со старым хэшем
+    # (вместе с метаданными - иначе photo_organizer взял бы дату из устаревшей записи)
+    broken = list(changed.values())
+    if broken:
+        delete_rows(c, broken)
+    # Метаданные без записи в images - проверяемые папки, которые старые версии писали в metadata
+    c.execute('''DELETE FROM metadata WHERE NOT EXISTS
+                 (SELECT 1 FROM images WHERE images.dir_id = metadata.dir_id AND images.name = metadata.name)''')
+    # Директории, в которых не осталось файлов
+    c.execute('''DELETE FROM dirs WHERE NOT EXISTS (SELECT 1 FROM images WHERE images.dir_id = dirs.id)
+                 AND NOT EXISTS (SELECT 1 FROM metadata WHERE metadata.dir_id = dirs.id)''')
+
+    writer.finish()
+    if writer.total:
+        print(f"Added {new_count - len(relinked)} new files and re-hashed {changed_count} changed files")
+    else:
+        print("✅ All files already in database!")
+    conn.close()
+
+    metrics.update({'files_new': new_count - len(relinked), 'files_changed': changed_count,
+                    'files_unchanged': unchanged, 'files_relinked': len(relinked), 'files_removed': len(missing_rowids),
+                    'files_copied': copied, 'files_broken': len(broken),
+                    'db_rows': writer.rows, 'db_seconds': writer.db_time})
+    metrics.save()
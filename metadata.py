@@ -0,0 +1,96 @@
+import os
+import re
+from datetime import datetime
+from PIL import Image
+
+# Теги EXIF: DateTimeOriginal лежит в под-IFD Exif, модель камеры и ориентация - в основном IFD
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+MODEL = 0x0110
+ORIENTATION = 0x0112
+
+
+def get_date_from_filename(filename):
+    """Парсим дату из имени файла (первый приоритет)"""
+    # Ищем форматы: YYYY-MM-DD, YYYYMMDD, YYYY_MM_DD
+    patterns = [
+        r'\d{4}-\d{2}-\d{2}',    # 2023-12-31
+        r'\d{8}',                 # 20231231
+        r'\d{4}_\d{2}_\d{2}'      # 2023_12_31
+    ]
+    
+    for pattern in patterns:
+        match = re.search(pattern, filename)
+        if match:
+            date_str = match.group()
+            try:
+                # Преобразуем разные форматы в дату
+                if '-' in date_str:
+                    return datetime.strptime(date_str, "%Y-%m-%d")
+                elif '_' in date_str:
+                    return datetime.strptime(date_str, "%Y_%m_%d")
+                else:
+                    return datetime.strptime(date_str, "%Y%m%d")
+            except ValueError:
+                continue
+    return None
+
+
+def parse_exif_date(value):
+    try:
+        return datetime.strptime(str(value).strip('\x00 '), "%Y:%m:%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+def read_metadata(img, file_path):
+    """Метаданные открытого изображения: (date_taken, date_source, width, height, camera, orientation).
+
+    Вызывается до prepare_image - draft меняет img.size. date_taken - DateTimeOriginal
+    в виде 'YYYY-MM-DD HH:MM:SS', date_source - откуда photo_organizer возьмет дату
+    (filename, exif или filemtime).
+    """
+    width, height = img.size
+    date_taken = camera = orientation = None
+    try:
+        exif = img.getexif()
+        date_taken = parse_exif_date(exif.get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL))
+        camera = str(exif.get(MODEL, '')).strip('\x00 ') or None
+        orientation = exif.get(ORIENTATION)
+    except Exception:
+        pass
+
+    date_taken = date_taken.isoformat(sep=' ') if date_taken else None
+    return (date_taken, get_date_source(file_path, date_taken), width, height, camera, orientation)
+
+
+def get_date_source(file_path, date_taken):
+    """Откуда photo_organizer возьмет дату: имя файла важнее EXIF"""
+    if get_date_from_filename(os.path.basename(file_path)):
+        return 'filename'
+    return 'exif' if date_taken else 'filemtime'
+
+
+# Колонки таблицы metadata в порядке кортежа read_metadata
+METADATA_COLUMNS = ('date_taken', 'date_source', 'width', 'height', 'camera', 'orientation')
+
+
+def copy_metadata(original, file_path):
+    """Метаданные побайтовой копии по записи оригинала: словарь колонок metadata из БД
+    или кортеж read_metadata только что декодированного файла.
+
+    Содержимое файлов совпадает, от имени зависит только источник даты.
+    """
+    if not isinstance(original, dict):
+        original = dict(zip(METADATA_COLUMNS, original))
+    return (original['date_taken'], get_date_source(file_path, original['date_taken']), original['width'],
+            original['height'], original['camera'], original['orientation'])
+
+
+# Глобальная функция для multiprocessing - для файлов, которых нет в индексе метаданных
+def extract_file_metadata(file_path):
+    try:
+        with Image.open(file_path) as img:
+            return (file_path, read_metadata(img, file_path))
+    except Exception:
+        return (file_path, None)
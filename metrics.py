@@ -0,0 +1,255 @@
+"""Замеры запуска скриптов конвейера: время wall/CPU по этапам, скорость каждого воркера,
+самые медленные файлы, прочитанные байты и скорость записи в БД.
+
+Результат - JSON в папке из секции metrics в config.yaml (<скрипт>-<время запуска>.json).
+С profile: true воркеры хэширования дополнительно пишут профиль cProfile
+(<скрипт>-<время запуска>-<воркер>.prof), его можно открыть через pstats или snakeviz.
+"""
+import os
+import json
+import time
+import heapq
+import cProfile
+import threading
+import contextlib
+from datetime import datetime
+from functools import partial
+from multiprocessing import current_process
+
+# Сколько самых медленных файлов попадает в отчет по каждой группе воркеров
+SLOWEST_FILES = 20
+# Как часто воркер перезаписывает свой профиль: Pool завершает воркеры через terminate() без хуков,
+# поэтому последняя секунда работы воркера в профиль может не попасть
+PROFILE_DUMP_INTERVAL = 1.0
+
+_profiler = None
+_profile_dumped = 0.0
+
+
+def _item_path(item):
+    """Путь файла из элемента работы: путь, (путь, содержимое) или кортеж с путем внутри"""
+    if isinstance(item, str):
+        return item
+    return next((value for value in item if isinstance(value, str)), None)
+
+
+def _item_bytes(item, file_path):
+    if isinstance(item, tuple) and len(item) > 1 and isinstance(item[1], bytes):
+        return len(item[1])
+    try:
+        return os.path.getsize(file_path)
+    except (OSError, TypeError):
+        return 0
+
+
+def _dump_profile(profile_path, worker):
+    global _profile_dumped
+    try:
+        os.makedirs(os.path.dirname(profile_path) or '.', exist_ok=True)
+        _profiler.dump_stats(f"{profile_path}-{worker}.prof")
+    except OSError:
+        pass  # удаленный воркер без папки для профиля - замеры важнее
+    _profile_dumped = time.monotonic()
+
+
+def measured_call(func, profile_path, item):
+    """func(item) в воркере с замером: (результат, (воркер, путь, файлов, байты, wall, CPU потока)).
+
+    item-список - пачка файлов (workers.chunked): замер идет на всю пачку, путь - первого файла.
+    """
+    global _profiler
+    thread = threading.current_thread()
+    worker = current_process().name if thread is threading.main_thread() else thread.name
+    items = item if isinstance(item, list) else [item]
+    paths = [_item_path(value) for value in items]
+    file_path = paths[0] if paths else None
+    size = sum(_item_bytes(value, path) for value, path in zip(items, paths))
+    # Профилируются только процессы-воркеры: cProfile в Python до 3.12 работает на один поток
+    profile = profile_path is not None and thread is threading.main_thread()
+    if profile and _profiler is None:
+        _profiler = cProfile.Profile()
+    start, cpu = time.perf_counter(), time.thread_time()
+    if profile:
+        _profiler.enable()
+    try:
+        result = func(item)
+    finally:
+        if profile:
+            _profiler.disable()
+    stat = (worker, file_path, len(items), size, time.perf_counter() - start, time.thread_time() - cpu)
+    if profile and time.monotonic() - _profile_dumped >= PROFILE_DUMP_INTERVAL:
+        _dump_profile(profile_path, worker)
+    return result, stat
+
+
+class Metrics:
+    """Замеры одного запуска. Metrics() без output_dir ничего не замеряет и не записывает.
+
+    Этапы идут друг за другом: begin(name) закрывает предыдущий этап, timer(name) -
+    вложенный замер, который суммируется по всем входам (например, запросы к БД между пачками).
+    """
+
+    def __init__(self, script='run', output_dir=None, profile=False):
+        self.script = script
+        self.output_dir = output_dir
+        self.enabled = output_dir is not None
+        self.profile = profile and self.enabled
+        self.started = datetime.now()
+        self.run_id = f"{script}-{self.started:%Y%m%d-%H%M%S}"
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.stages = {}
+        self.timers = {}
+        self.counters = {}
+        self.groups = {}
+        self.current = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, script):
+        """Metrics по секции metrics в config.yaml; выключенные замеры - пустой Metrics"""
+        config = config or {}
+        if not config.get('enabled'):
+            return cls(script)
+        return cls(script, config.get('output') or 'metrics', config.get('profile', False))
+
+    def _add_time(self, table, name, wall, cpu):
+        with self.lock:
+            stats = table.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+            stats['wall'] += wall
+            stats['cpu'] += cpu
+            stats['calls'] += 1
+
+    def begin(self, name):
+        """Начало этапа name (и конец предыдущего)"""
+        self.end()
+        self.current = (name, time.perf_counter(), time.process_time())
+
+    def end(self):
+        if self.current is not None:
+            name, wall, cpu = self.current
+            self._add_time(self.stages, name, time.perf_counter() - wall, time.process_time() - cpu)
+            self.current = None
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self._add_time(self.timers, name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def update(self, counters):
+        """Несколько счетчиков сразу: {имя: значение}"""
+        for name, value in counters.items():
+            self.add(name, value)
+
+    def produce(self, iterable, name):
+        """Элементы iterable с замером времени их получения (например, обхода директорий)"""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            wall = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                # Генератор читает поток Pool - CPU процесса здесь не разделить, только wall
+                self._add_time(self.timers, name, time.perf_counter() - wall, 0.0)
+            yield item
+
+    def imap(self, map_func, func, items, chunksize=1, group='hash', profile=False):
+        """map_func(func, items, chunksize=...) - Pool.imap_unordered, координатор или ThreadPoolExecutor.map.
+
+        Каждый элемент (или пачка, если map_func раздает func пачки) замеряется в воркере,
+        результаты отдаются так же, как у map_func.
+        profile=True - воркеры-процессы пишут профиль cProfile, если он включен в config.yaml.
+        """
+        if not self.enabled:
+            yield from map_func(func, items, chunksize=chunksize)
+            return
+        profile_path = os.path.join(self.output_dir, self.run_id) if profile and self.profile else None
+        for result, stat in map_func(partial(measured_call, func, profile_path), items, chunksize=chunksize):
+            self.record(group, *stat)
+            yield result
+
+    def record(self, group, worker, file_path, files, size, wall, cpu):
+        with self.lock:
+            stats = self.groups.setdefault(group, {'files': 0, 'bytes': 0, 'wall': 0.0, 'cpu': 0.0,
+                                                   'workers': {}, 'slowest': []})
+            per_worker = stats['workers'].setdefault(worker, {'files': 0, 'bytes': 0, 'wall': 0.0, 'cpu': 0.0})
+            for target in (stats, per_worker):
+                target['files'] += files
+                target['bytes'] += size
+                target['wall'] += wall
+                target['cpu'] += cpu
+            slowest = stats['slowest']
+            entry = (wall, file_path or '', files)
+            if len(slowest) < SLOWEST_FILES:
+                heapq.heappush(slowest, entry)
+            elif entry > slowest[0]:
+                heapq.heapreplace(slowest, entry)
+
+    def report(self):
+        self.end()
+        report = {
+            'script': self.script,
+            'started': self.started.isoformat(timespec='seconds'),
+            'wall': round(time.perf_counter() - self.start_wall, 3),
+            'cpu': round(time.process_time() - self.start_cpu, 3),
+            'stages': {name: _rounded(stats) for name, stats in self.stages.items()},
+            'timers': {name: _rounded(stats) for name, stats in self.timers.items()},
+            'workers': {},
+            'counters': dict(self.counters),
+        }
+        for group, stats in self.groups.items():
+            report['workers'][group] = {
+                **_throughput(stats),
+                'workers': {worker: _throughput(values) for worker, values in sorted(stats['workers'].items())},
+                # Для пачек файлов - путь первого файла и размер пачки
+                'slowest': [{'path': file_path, 'files': files, 'seconds': round(wall, 3)}
+                            for wall, file_path, files in sorted(stats['slowest'], reverse=True)],
+            }
+        if self.counters.get('db_seconds'):
+            rate = self.counters.get('db_rows', 0) / self.counters['db_seconds']
+            report['counters']['db_rows_per_sec'] = round(rate, 1)
+        return report
+
+    def save(self):
+        """Запись JSON-отчета; возвращает путь к нему или None, если замеры выключены"""
+        if not self.enabled:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.run_id}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        print(f"📈 Metrics saved to {path}")
+        return path
+
+
+def _rounded(stats):
+    return {name: round(value, 3) if isinstance(value, float) else value for name, value in stats.items()}
+
+
+def _throughput(stats):
+    """Суммы по воркеру или группе и скорость в расчете на время работы воркера.
+
+    cpu_share - доля CPU во времени обработки: низкая доля - воркер ждет диск или сеть.
+    """
+    wall = stats['wall']
+    return {
+        'files': stats['files'],
+        'bytes': stats['bytes'],
+        'wall': round(wall, 3),
+        'cpu': round(stats['cpu'], 3),
+        'files_per_sec': round(stats['files'] / wall, 1) if wall else None,
+        'mb_per_sec': round(stats['bytes'] / wall / 1e6, 2) if wall else None,
+        'cpu_share': round(stats['cpu'] / wall, 3) if wall else None,
+    }
@@ -0,0 +1,47 @@
+"""Перевод phash_db.sqlite старого формата на компактную схему (phash - INTEGER, пути через таблицу dirs).
+
+Запуск: python migrate_db.py [путь к БД]
+Скрипты мигрируют БД автоматически при первом запуске, эта команда дополнительно
+сжимает файл (VACUUM) и печатает размер до и после.
+"""
+import os
+import sys
+import sqlite3
+from library_db import SCHEMA_VERSION, init_db
+
+
+def db_size(db_path):
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+
+def migrate(db_path='phash_db.sqlite'):
+    if not os.path.exists(db_path):
+        print(f"❌ {db_path} not found!")
+        return
+
+    size_before = db_size(db_path)
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('PRAGMA user_version')
+    version = c.fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        print(f"✅ {db_path} already uses schema version {version}")
+    init_db(c)
+
+    print("🗜️ Compacting database...")
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute('VACUUM')
+    conn.execute('ANALYZE')
+    c.execute('SELECT COUNT(*) FROM images')
+    rows = c.fetchone()[0]
+    c.execute('SELECT COUNT(*) FROM dirs')
+    dirs = c.fetchone()[0]
+    conn.close()
+
+    size_after = db_size(db_path)
+    print(f"✅ Done! {rows} images in {dirs} directories, "
+          f"{size_before / 1048576:.1f} MB -> {size_after / 1048576:.1f} MB")
+
+
+if __name__ == '__main__':
+    migrate(sys.argv[1] if len(sys.argv) > 1 else 'phash_db.sqlite')
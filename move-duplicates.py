@@ -1,65 +1,59 @@
 import os
-import shutil
-from pathlib import Path
+import sys
+import yaml
+from metrics import Metrics
+from trash_journal import move_to_trash, restore_from_trash
 
-def move_duplicates_to_trash(duplicates_file='duplicates_filtered.txt'):
-    # Создаем папку Trash в рабочей директории
-    trash_dir = os.path.join(os.getcwd(), 'Trash')
-    os.makedirs(trash_dir, exist_ok=True)
+def print_report(done_label, done_count, errors):
+    print("\n📝 Отчет:")
+    print(f"• {done_label}: {done_count}")
+    print(f"• Ошибок: {len(errors)}")
+    
+    if errors:
+        print("\n🚨 Список ошибок:")
+        for error in errors[:5]:  # Показываем первые 5 ошибок
+            print(f"  {error}")
+        if len(errors) > 5:
+            print(f"  ... и еще {len(errors)-5} ошибок")
+
+def move_duplicates_to_trash(duplicates_file='duplicates_filtered.txt', metrics=None, trash_dir=None):
+    # По умолчанию папка Trash в рабочей директории: файлы раскладываются по подпапкам-шардам,
+    # каждое перемещение записывается в Trash/journal.sqlite
+    trash_dir = trash_dir or os.path.join(os.getcwd(), 'Trash')
+    metrics = metrics or Metrics('move_duplicates')
 
     # Читаем файл с дубликатами
     if not os.path.exists(duplicates_file):
         print(f"❌ Файл {duplicates_file} не найден!")
         return
 
-    moved_count = 0
-    errors = []
-
     with open(duplicates_file, 'r', encoding='utf-8') as f:
         file_paths = f.read().splitlines()
 
     print(f"🔍 Найдено {len(file_paths)} файлов для перемещения")
 
+    clean_paths = []
     for orig_path in file_paths:
-        try:
-            # Чистим путь от возможных кавычек и лишних слешей
-            clean_path = orig_path.strip().replace('\\', '/').replace('//', '/')
-            clean_path = clean_path.strip('"').replace('/', '\\')
-            
-            if not os.path.exists(clean_path):
-                errors.append(f"Файл не существует: {clean_path}")
-                continue
-
-            # Формируем новый путь
-            filename = os.path.basename(clean_path)
-            dest_path = os.path.join(trash_dir, filename)
+        # Чистим путь от возможных кавычек и лишних слешей
+        clean_path = orig_path.strip().replace('\\', '/').replace('//', '/')
+        clean_path = clean_path.strip('"').replace('/', '\\')
+        clean_paths.append(clean_path)
 
-            # Обрабатываем коллизии имен
-            counter = 1
-            while os.path.exists(dest_path):
-                name, ext = os.path.splitext(filename)
-                dest_path = os.path.join(trash_dir, f"{name}_{counter}{ext}")
-                counter += 1
+    moved_count, errors = move_to_trash(clean_paths, trash_dir, metrics=metrics)
+    print_report("Успешно перемещено", moved_count, errors)
+    metrics.save()
 
-            # Перемещаем файл
-            shutil.move(clean_path, dest_path)
-            moved_count += 1
-            print(f"✓ Успешно перемещен: {filename}")
-
-        except Exception as e:
-            errors.append(f"Ошибка при перемещении {orig_path}: {str(e)}")
-
-    # Выводим отчет
-    print("\n📝 Отчет:")
-    print(f"• Успешно перемещено: {moved_count}")
-    print(f"• Ошибок: {len(errors)}")
-    
-    if errors:
-        print("\n🚨 Список ошибок:")
-        for error in errors[:5]:  # Показываем первые 5 ошибок
-            print(f"  {error}")
-        if len(errors) > 5:
-            print(f"  ... и еще {len(errors)-5} ошибок")
+def restore_duplicates_from_trash(trash_dir=None):
+    """Возврат всех файлов из корзины на исходные места по журналу"""
+    trash_dir = trash_dir or os.path.join(os.getcwd(), 'Trash')
+    restored_count, errors = restore_from_trash(trash_dir)
+    print_report("Успешно восстановлено", restored_count, errors)
 
 if __name__ == '__main__':
-    move_duplicates_to_trash()
\ No newline at end of file
+    # python move-duplicates.py --restore - вернуть все файлы из корзины
+    if '--restore' in sys.argv[1:]:
+        restore_duplicates_from_trash()
+    else:
+        with open('config.yaml', 'r', encoding='utf-8') as file:
+            application_config = yaml.safe_load(file)
+        move_duplicates_to_trash(metrics=Metrics.from_config(application_config.get('metrics'), 'move_duplicates'))
\ No newline at end of file
@@ -0,0 +1,44 @@
+import os
+import shutil
+
+# Перемещение между дисками - это копирование, несколько копий параллельно лучше загружают оба диска
+MOVE_THREADS = 8
+
+
+def free_name(listings, target_dir, filename):
+    """Имя без конфликтов в target_dir: сверка с листингом папки в памяти и уже запланированными файлами"""
+    taken = listings.get(target_dir)
+    if taken is None:
+        try:
+            taken = {os.path.normcase(name) for name in os.listdir(target_dir)}
+        except OSError:
+            taken = set()
+        listings[target_dir] = taken
+
+    name, ext = os.path.splitext(filename)
+    candidate = filename
+    counter = 1
+    while os.path.normcase(candidate) in taken:
+        candidate = f"{name}_{counter}{ext}"
+        counter += 1
+    taken.add(os.path.normcase(candidate))
+    return os.path.join(target_dir, candidate)
+
+
+def prepare_dirs(target_dirs, errors):
+    """Создание целевых папок один раз: {папка: st_dev}. Ошибки дописываются в errors"""
+    devices = {}
+    for target_dir in target_dirs:
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+            devices[target_dir] = os.stat(target_dir).st_dev
+        except OSError as e:
+            errors.append(f"Error creating {target_dir}: {str(e)}")
+    return devices
+
+
+def move_file(file_path, new_path, same_volume):
+    if same_volume:
+        os.rename(file_path, new_path)  # Тот же том - только переименование, без копирования данных
+    else:
+        shutil.move(file_path, new_path)
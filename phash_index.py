@@ -0,0 +1,103 @@
+import sqlite3
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def band_masks(bands, bits=HASH_BITS):
+    """Разбиение хэша на bands почти равных полос: список (сдвиг, маска)"""
+    result = []
+    shift = 0
+    for i in range(bands):
+        width = bits // bands + (1 if i < bits % bands else 0)
+        result.append((shift, (1 << width) - 1))
+        shift += width
+    return result
+
+
+def to_unsigned(phash):
+    """hex-строка или знаковое целое из БД -> беззнаковое 64-битное целое"""
+    return (int(phash, 16) if isinstance(phash, str) else phash) & HASH_MASK
+
+
+def hamming(a, b):
+    """Расстояние Хэмминга между двумя хэшами в любом представлении"""
+    return (to_unsigned(a) ^ to_unsigned(b)).bit_count()
+
+
+class PhashIndex:
+    """Индекс 64-битных phash для поиска всех хэшей в пределах расстояния Хэмминга.
+
+    Multi-index hashing: хэш делится на max_distance + 1 полос. Если два хэша
+    отличаются не более чем на max_distance бит, то по принципу Дирихле хотя бы
+    одна полоса совпадает точно - кандидаты берутся из словарей по полосам,
+    а точное расстояние проверяется только для них.
+    """
+
+    def __init__(self, max_distance=0):
+        self.max_distance = max_distance
+        self.bands = band_masks(max_distance + 1)
+        self.tables = [{} for _ in self.bands]
+        self.paths = {}  # hash (int) -> список путей
+        self.extra = {}  # путь -> {тип хэша: значение}, если индекс построен с extra
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, phash, file_path):
+        value = to_unsigned(phash)
+        paths = self.paths.get(value)
+        if paths is not None:
+            paths.append(file_path)
+            return
+        self.paths[value] = [file_path]
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            table.setdefault((value >> shift) & mask, []).append(value)
+
+    def query(self, phash, max_distance=None):
+        """Все хэши индекса на расстоянии <= max_distance: список (distance, hash, paths) по возрастанию"""
+        if max_distance is None:
+            max_distance = self.max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(f"Index was built for max_distance={self.max_distance}")
+        value = to_unsigned(phash)
+
+        if max_distance == 0:
+            paths = self.paths.get(value)
+            return [(0, value, paths)] if paths else []
+
+        seen = set()
+        matches = []
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            for candidate in table.get((value >> shift) & mask, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = (candidate ^ value).bit_count()
+                if distance <= max_distance:
+                    matches.append((distance, candidate, self.paths[candidate]))
+        matches.sort()
+        return matches
+
+    def nearest_path(self, phash, max_distance=None, accept=None):
+        """Путь к ближайшему изображению библиотеки или None; accept(path) - дополнительная проверка кандидата"""
+        for _, _, paths in self.query(phash, max_distance):
+            for path in paths:
+                if accept is None or accept(path):
+                    return path
+        return None
+
+    @classmethod
+    def from_db(cls, db_path, max_distance=0, extra=()):
+        """Построение индекса по всем phash из phash_db.sqlite; extra - хэши, которые запоминаются для каждого пути"""
+        index = cls(max_distance)
+        conn = sqlite3.connect(db_path)
+        c = conn.cursor()
+        columns = ''.join(f', {name}' for name in extra)
+        c.execute(f'SELECT phash, file_path{columns} FROM image_files WHERE phash IS NOT NULL')
+        for phash, file_path, *values in c:
+            index.add(phash, file_path)
+            if extra:
+                index.extra[file_path] = dict(zip(extra, values))
+        conn.close()
+        return index
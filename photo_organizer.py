@@ -1,75 +1,75 @@
 import os
-import shutil
+import sys
+import sqlite3
+import yaml
 from datetime import datetime
-from PIL import Image
-from PIL.ExifTags import TAGS
-import re
+from multiprocessing import Pool, cpu_count
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from metadata import get_date_from_filename, extract_file_metadata
+from library_db import init_db, load_metadata, forget_metadata
+from mover import MOVE_THREADS, free_name, prepare_dirs, move_file
+from metrics import Metrics
 
-def get_date_from_filename(filename):
-    """Парсим дату из имени файла (первый приоритет)"""
-    # Ищем форматы: YYYY-MM-DD, YYYYMMDD, YYYY_MM_DD
-    patterns = [
-        r'\d{4}-\d{2}-\d{2}',    # 2023-12-31
-        r'\d{8}',                 # 20231231
-        r'\d{4}_\d{2}_\d{2}'      # 2023_12_31
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, filename)
-        if match:
-            date_str = match.group()
-            try:
-                # Преобразуем разные форматы в дату
-                if '-' in date_str:
-                    return datetime.strptime(date_str, "%Y-%m-%d")
-                elif '_' in date_str:
-                    return datetime.strptime(date_str, "%Y_%m_%d")
-                else:
-                    return datetime.strptime(date_str, "%Y%m%d")
-            except ValueError:
-                continue
-    return None
-
-def get_date_from_exif(file_path):
-    """Пытаемся получить дату из EXIF-данных (второй приоритет)"""
-    try:
-        with Image.open(file_path) as img:
-            exif_data = img._getexif()
-            if exif_data:
-                for tag_id, value in exif_data.items():
-                    tag_name = TAGS.get(tag_id, tag_id)
-                    if tag_name == 'DateTimeOriginal':
-                        return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
-    except Exception:
-        pass
-    return None
+def get_file_date(file_path, date_taken=None, st=None):
+    """Основная функция получения даты с новым приоритетом: (дата, источник).
 
-def get_file_date(file_path):
-    """Основная функция получения даты с новым приоритетом"""
+    date_taken - DateTimeOriginal из индекса метаданных (или только что извлеченный), st - os.stat файла
+    """
     filename = os.path.basename(file_path)
     
     # 1. Пытаемся получить дату из имени файла
     date = get_date_from_filename(filename)
     if date:
-        return date
+        return date, 'filename'
     
     # 2. Пробуем EXIF-данные
-    date = get_date_from_exif(file_path)
-    if date:
-        return date
+    if date_taken:
+        return datetime.fromisoformat(date_taken), 'exif'
     
     # 3. Используем дату изменения файла
     try:
-        timestamp = os.path.getmtime(file_path)
-        return datetime.fromtimestamp(timestamp)
+        timestamp = st.st_mtime if st is not None else os.path.getmtime(file_path)
+        return datetime.fromtimestamp(timestamp), 'filemtime'
     except OSError:
         pass
     
     # 4. Если все методы не сработали - текущая дата
-    return datetime.now()
+    return datetime.now(), 'fallback'
+
+def load_metadata_index(file_paths, db_path='phash_db.sqlite'):
+    """Метаданные, собранные при хэшировании (phash_db.sqlite); нет БД - пустой словарь"""
+    if not os.path.exists(db_path):
+        return {}
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    init_db(c)
+    metadata = load_metadata(c, file_paths)
+    conn.close()
+    return metadata
 
-def organize_photos(source_file='unique.txt', base_output_dir='sorted_photos'):
+def move_step(item):
+    """Шаг плана: (file_path, new_path, source, same_volume) -> (item, ошибка или None)"""
+    file_path, new_path, source, same_volume = item
+    try:
+        move_file(file_path, new_path, same_volume)
+        return item, None
+    except Exception as e:
+        return item, e
+
+def save_plan(plan, plan_file):
+    with open(plan_file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(f"{file_path}\t{new_path}\t{source}" for file_path, new_path, source in plan))
+
+def organize_photos(source_file='unique.txt', base_output_dir='sorted_photos', db_path='phash_db.sqlite',
+                    dry_run=False, plan_file='move_plan.txt', threads=MOVE_THREADS, metrics=None):
+    """Сортировка в два этапа: сначала план перемещений целиком, затем его выполнение пулом потоков.
+
+    dry_run - только сохранить план в plan_file (источник, назначение, источник даты через табуляцию).
+    metrics (metrics.Metrics) - замеры этапов, чтения EXIF и перемещений.
+    """
+    metrics = metrics or Metrics('organize_photos')
+    metrics.begin('metadata_index')
     # Читаем файл с путями
     with open(source_file, 'r', encoding='utf-8') as f:
         file_paths = [line.strip() for line in f.readlines()]
@@ -84,51 +84,84 @@ def organize_photos(source_file='unique.txt', base_output_dir='sorted_photos'):
         'fallback': 0
     }
 
-    # Обрабатываем файлы
-    for file_path in tqdm(file_paths, desc="Sorting photos"):
+    # Даты берем из индекса метаданных; если файла там нет или он изменился - читаем EXIF в пуле процессов
+    print("🗂️ Reading metadata index...")
+    indexed = load_metadata_index(file_paths, db_path)
+    stats = {}
+    dates_taken = {}
+    to_extract = []
+    for file_path in file_paths:
         try:
-            if not os.path.exists(file_path):
-                errors.append(f"File not found: {file_path}")
-                continue
+            st = os.stat(file_path)
+        except OSError:
+            continue
+        stats[file_path] = st
+        row = indexed.get(file_path)
+        if row and (row['size'], row['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+            dates_taken[file_path] = row['date_taken']
+        else:
+            to_extract.append(file_path)
+    print(f"Metadata index covers {len(dates_taken)} of {len(stats)} files")
 
-            # Получаем дату и источник
-            date = get_file_date(file_path)
-            source = 'filename' if date else 'fallback'  # временная заглушка
-            
-            # Определяем реальный источник
-            if get_date_from_filename(os.path.basename(file_path)):
-                date_sources['filename'] += 1
-                source = 'filename'
-            elif get_date_from_exif(file_path):
-                date_sources['exif'] += 1
-                source = 'exif'
+    if to_extract:
+        metrics.begin('exif')
+        with Pool(cpu_count()) as pool:
+            for file_path, metadata in tqdm(metrics.imap(pool.imap_unordered, extract_file_metadata, to_extract,
+                                                         chunksize=16, group='exif'),
+                                            total=len(to_extract), desc="Reading EXIF"):
+                dates_taken[file_path] = metadata[0] if metadata else None
+
+    # Этап 1: план. Целевые папки и свободные имена определяются по листингам папок в памяти
+    metrics.begin('plan')
+    plan = []
+    listings = {}
+    for file_path in file_paths:
+        if file_path not in stats:
+            errors.append(f"File not found: {file_path}")
+            continue
+
+        # Получаем дату и источник
+        date, source = get_file_date(file_path, dates_taken.get(file_path), stats[file_path])
+        date_sources[source] += 1
+
+        year = date.strftime("%Y")
+        month = date.strftime("%m - %B")
+        target_dir = os.path.join(base_output_dir, year, month)
+        plan.append((file_path, free_name(listings, target_dir, os.path.basename(file_path)), source))
+
+    if dry_run:
+        save_plan(plan, plan_file)
+        print(f"📝 Dry run: {len(plan)} moves to {len(listings)} folders saved to {plan_file}, errors: {len(errors)}")
+        metrics.update({'files': len(file_paths), 'planned': len(plan), 'errors': len(errors)})
+        metrics.save()
+        return plan
+
+    # Этап 2: создаем папки один раз и перемещаем файлы параллельно
+    metrics.begin('move')
+    devices = prepare_dirs(listings, errors)
+    steps = [
+        (file_path, new_path, source, stats[file_path].st_dev == devices[os.path.dirname(new_path)])
+        for file_path, new_path, source in plan if os.path.dirname(new_path) in devices
+    ]
+    print(f"📦 Moving {len(steps)} files ({sum(1 for step in steps if not step[3])} across volumes)...")
+
+    moved = []
+    with ThreadPoolExecutor(threads) as executor:
+        moves = metrics.imap(executor.map, move_step, steps, group='move')
+        for (file_path, new_path, source, _), error in tqdm(moves, total=len(steps), desc="Sorting photos"):
+            if error is None:
+                moved.append(file_path)
+                processed.append(f"{new_path} | Source: {source}")
             else:
-                date_sources['filemtime'] += 1
-                source = 'filemtime'
-
-            # Создаем целевую директорию
-            year = date.strftime("%Y")
-            month = date.strftime("%m - %B")
-            target_dir = os.path.join(base_output_dir, year, month)
-            os.makedirs(target_dir, exist_ok=True)
-            
-            # Формируем новое имя
-            filename = os.path.basename(file_path)
-            new_path = os.path.join(target_dir, filename)
-            
-            # Разрешаем конфликты имен
-            counter = 1
-            while os.path.exists(new_path):
-                name, ext = os.path.splitext(filename)
-                new_path = os.path.join(target_dir, f"{name}_{counter}{ext}")
-                counter += 1
-            
-            # Перемещаем и логируем
-            shutil.move(file_path, new_path)
-            processed.append(f"{new_path} | Source: {source}")
+                errors.append(f"Error processing {file_path}: {str(error)}")
 
-        except Exception as e:
-            errors.append(f"Error processing {file_path}: {str(e)}")
+    # Перемещенные файлы больше не нужны в индексе метаданных
+    metrics.begin('report')
+    if moved and os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        forget_metadata(conn.cursor(), moved)
+        conn.commit()
+        conn.close()
 
     # Сохраняем отчет
     with open('sorting_report.txt', 'w', encoding='utf-8') as f:
@@ -148,6 +181,13 @@ def organize_photos(source_file='unique.txt', base_output_dir='sorted_photos'):
     print(f"• Files sorted by modification date: {date_sources['filemtime']}")
     print(f"• Files with fallback date: {date_sources['fallback']}")
     print(f"\n✅ Total processed: {len(processed)}, Errors: {len(errors)}")
+    metrics.update({'files': len(file_paths), 'moved': len(moved), 'errors': len(errors),
+                    **{f'date_{source}': count for source, count in date_sources.items()}})
+    metrics.save()
 
 if __name__ == '__main__':
-    organize_photos()
\ No newline at end of file
+    # python photo_organizer.py --dry-run - только построить план в move_plan.txt, ничего не перемещая
+    with open('config.yaml', 'r', encoding='utf-8') as file:
+        application_config = yaml.safe_load(file)
+    organize_photos(dry_run='--dry-run' in sys.argv[1:],
+                    metrics=Metrics.from_config(application_config.get('metrics'), 'organize_photos'))
\ No newline at end of file
@@ -1,8 +1,25 @@
 import os
 import shutil
+import bisect
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import ImageTk
+from trash_journal import open_journal, load_trash_ids, get_trash_files, mark_restored, restore_files
+from thumbnail_cache import THUMBNAIL_DIR, ThumbnailCache
+
+# Сколько изображений вперед и назад готовится в фоне, пока пользователь смотрит текущее
+PREFETCH_AHEAD = 3
+PREFETCH_THREADS = 2
+# Сколько готовых PhotoImage держим в памяти
+PHOTO_CACHE_SIZE = 16
+# Как часто главный поток забирает готовые превью из фоновых потоков, мс
+PREFETCH_POLL_MS = 50
+# Список показывает только видимые строки; остальные существуют лишь как id в памяти
+LIST_ROWS = 8
+# Сколько строк журнала (пути) держим в памяти
+ROW_CACHE_SIZE = 5000
 
 class RestoreViewer:
     def __init__(self, master):
@@ -11,30 +28,47 @@ class RestoreViewer:
         self.master.state('zoomed')
         
         # Инициализация данных
-        self.trash_dir = os.path.join(os.getcwd(), 'trash')
-        self.log_file = os.path.join(os.getcwd(), 'deletion_log.txt')
-        self.deleted_files = self.load_deleted_files()
+        self.trash_dir = os.path.join(os.getcwd(), 'Trash')
+        self.journal = open_journal(self.trash_dir)
+        self.deleted_ids = load_trash_ids(self.journal)
+        self.rows = {}
+        self.selected = set()
+        self.list_offset = 0
         self.current_index = 0
+
+        # Превью: дисковый кэш, готовые PhotoImage в памяти (LRU) и фоновая подготовка соседних файлов
+        self.thumbnails = ThumbnailCache(os.path.join(self.trash_dir, THUMBNAIL_DIR))
+        self.photo_cache = OrderedDict()
+        self.prefetching = {}
+        self.prefetcher = ThreadPoolExecutor(PREFETCH_THREADS)
+        # Кэш превью не растет без предела: лишнее удаляется в фоне, не задерживая открытие окна
+        self.prefetcher.submit(self.thumbnails.prune)
+        self.polling = False
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Настройка интерфейса
         self.create_widgets()
         self.show_current_file()
 
-    def load_deleted_files(self):
-        """Загрузка списка удаленных файлов из лога"""
-        deleted_files = []
-        if os.path.exists(self.log_file):
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                for line in f.readlines():
-                    parts = line.strip().split(' ', 1)
-                    if len(parts) == 2:
-                        filename, original_path = parts
-                        deleted_files.append({
-                            'filename': filename,
-                            'original_path': original_path,
-                            'trash_path': os.path.join(self.trash_dir, filename)
-                        })
-        return deleted_files
+    def load_rows(self, rowids):
+        """Подгрузка путей из журнала (его пишет move-duplicates.py) только для нужных id"""
+        missing = [rowid for rowid in rowids if rowid not in self.rows]
+        if not missing:
+            return
+        if len(self.rows) + len(missing) > ROW_CACHE_SIZE:
+            self.rows.clear()
+        for rowid, (original_path, trash_path) in get_trash_files(self.journal, missing).items():
+            self.rows[rowid] = {
+                'id': rowid,
+                'filename': os.path.basename(trash_path),
+                'original_path': original_path,
+                'trash_path': os.path.join(self.trash_dir, trash_path)
+            }
+
+    def file_info(self, index):
+        rowid = self.deleted_ids[index]
+        self.load_rows([rowid])
+        return self.rows[rowid]
 
     def create_widgets(self):
         """Создание элементов интерфейса с исправленным layout"""
@@ -47,6 +81,7 @@ class RestoreViewer:
         control_frame.pack(side=tk.TOP, fill=tk.X, pady=10)  # Перемещено вверх
         ttk.Button(control_frame, text="<< Назад", command=self.prev_file).pack(side=tk.LEFT, padx=20)
         ttk.Button(control_frame, text="Восстановить", command=self.restore_file).pack(side=tk.LEFT, padx=20)
+        ttk.Button(control_frame, text="Восстановить выбранные", command=self.restore_selected).pack(side=tk.LEFT, padx=20)
         ttk.Button(control_frame, text="Вперед >>", command=self.next_file).pack(side=tk.LEFT, padx=20)
 
         # Контейнер для изображения и списка
@@ -65,7 +100,8 @@ class RestoreViewer:
             list_frame,
             columns=('num', 'filename', 'original_path'),
             show='headings',
-            height=8
+            height=LIST_ROWS,
+            selectmode='extended'
         )
 
         self.files_tree.heading('num', text='№', anchor=tk.W)
@@ -76,11 +112,12 @@ class RestoreViewer:
         self.files_tree.column('filename', width=200)
         self.files_tree.column('original_path', width=500)
 
-        scroll = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.files_tree.yview)
-        self.files_tree.configure(yscroll=scroll.set)
-        scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        # Прокрутка управляет смещением страницы, а не самим Treeview: в нем всегда не больше LIST_ROWS строк
+        self.list_scroll = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.on_list_scroll)
+        self.list_scroll.pack(side=tk.RIGHT, fill=tk.Y)
         self.files_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.files_tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        self.files_tree.bind('<MouseWheel>', self.on_mouse_wheel)
 
         # Статус бар (под панелью управления)
         self.status = ttk.Label(main_frame, text="", anchor=tk.W)
@@ -90,30 +127,70 @@ class RestoreViewer:
         self.populate_files_list()
 
     def populate_files_list(self):
-        """Заполнение списка файлов"""
-        for i, file_info in enumerate(self.deleted_files, 1):
+        """Заполнение видимой страницы списка"""
+        total = len(self.deleted_ids)
+        self.list_offset = max(0, min(self.list_offset, total - LIST_ROWS))
+        page_ids = self.deleted_ids[self.list_offset:self.list_offset + LIST_ROWS]
+        self.load_rows(page_ids)
+
+        self.files_tree.delete(*self.files_tree.get_children())
+        for i, rowid in enumerate(page_ids, self.list_offset + 1):
+            file_info = self.rows[rowid]
             self.files_tree.insert(
                 '', 
                 tk.END, 
+                iid=str(rowid),
                 values=(i, file_info['filename'], file_info['original_path'])
             )
+        self.files_tree.selection_set([str(rowid) for rowid in page_ids if rowid in self.selected])
+
+        if total:
+            self.list_scroll.set(self.list_offset / total, (self.list_offset + len(page_ids)) / total)
+        else:
+            self.list_scroll.set(0, 1)
+
+    def scroll_list_to(self, offset):
+        self.list_offset = offset
+        self.populate_files_list()
+
+    def on_list_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.scroll_list_to(int(float(amount) * len(self.deleted_ids)))
+        elif action == 'scroll':
+            step = LIST_ROWS if unit == 'pages' else 1
+            self.scroll_list_to(self.list_offset + int(amount) * step)
+
+    def on_mouse_wheel(self, event):
+        self.scroll_list_to(self.list_offset + (-3 if event.delta > 0 else 3))
+        return 'break'
 
     def on_tree_select(self, event):
-        """Обработка выбора в списке"""
-        if selected := self.files_tree.selection():
-            self.current_index = self.files_tree.index(selected[0])
-            self.show_current_file()
+        """Обработка выбора в списке: выбранные id запоминаются и при прокрутке страниц"""
+        page_ids = set(self.deleted_ids[self.list_offset:self.list_offset + LIST_ROWS])
+        chosen = {int(iid) for iid in self.files_tree.selection()}
+        if chosen == page_ids & self.selected:
+            return  # событие от восстановления выбора при перерисовке страницы
+        self.selected = (self.selected - page_ids) | chosen
+        if focused := self.files_tree.focus():
+            index = bisect.bisect_left(self.deleted_ids, int(focused))
+            if index < len(self.deleted_ids) and self.deleted_ids[index] == int(focused):
+                self.current_index = index
+                self.show_current_file()
 
     def show_current_file(self):
         """Отображение текущего файла с исправлением масштабирования"""
         for widget in self.image_frame.winfo_children():
             widget.destroy()
 
-        if not self.deleted_files:
+        if not self.deleted_ids:
             self.status.config(text="Нет файлов для восстановления!")
             return
 
-        file_info = self.deleted_files[self.current_index]
+        # Текущий файл всегда виден в списке
+        if not self.list_offset <= self.current_index < self.list_offset + LIST_ROWS:
+            self.scroll_list_to(self.current_index - LIST_ROWS // 2)
+
+        file_info = self.file_info(self.current_index)
         
         try:
             # Обновляем геометрию перед расчетами
@@ -123,11 +200,10 @@ class RestoreViewer:
             max_width = max(100, self.master.winfo_width() - 100)
             max_height = max(100, self.master.winfo_height() - 300)
             
-            # Загрузка изображения
-            img = Image.open(file_info['trash_path'])
-            img.thumbnail((max_width, max_height))
-            
-            self.current_image = ImageTk.PhotoImage(img)
+            # Загрузка изображения: из памяти, из фоновой подготовки или из дискового кэша превью
+            box = (max_width, max_height)
+            self.current_image = self.get_photo(file_info['trash_path'], box)
+            self.prefetch(box)
             
             # Контейнер для центрирования
             img_container = ttk.Frame(self.image_frame)
@@ -145,14 +221,73 @@ class RestoreViewer:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось загрузить изображение: {str(e)}")
 
-        self.status.config(text=f"Файл {self.current_index + 1} из {len(self.deleted_files)}")
+        status = f"Файл {self.current_index + 1} из {len(self.deleted_ids)}"
+        if self.selected:
+            status += f", выбрано: {len(self.selected)}"
+        self.status.config(text=status)
+
+    def get_photo(self, trash_path, box):
+        """PhotoImage для файла; PhotoImage создается только в главном потоке Tk"""
+        key = (trash_path, box)
+        photo = self.photo_cache.get(key)
+        if photo is not None:
+            self.photo_cache.move_to_end(key)
+            return photo
+
+        future = self.prefetching.pop(key, None)
+        img = future.result() if future is not None else self.thumbnails.load(trash_path, box)
+        return self.remember_photo(key, ImageTk.PhotoImage(img))
+
+    def remember_photo(self, key, photo):
+        self.photo_cache[key] = photo
+        self.photo_cache.move_to_end(key)
+        while len(self.photo_cache) > PHOTO_CACHE_SIZE:
+            self.photo_cache.popitem(last=False)
+        return photo
+
+    def prefetch(self, box):
+        """Фоновая подготовка превью для PREFETCH_AHEAD файлов в обе стороны от текущего"""
+        wanted = []
+        for offset in range(1, PREFETCH_AHEAD + 1):
+            for index in (self.current_index + offset, self.current_index - offset):
+                if 0 <= index < len(self.deleted_ids):
+                    wanted.append((self.file_info(index)['trash_path'], box))
+
+        # Ушли далеко - превью, которые еще не начали готовиться, больше не нужны
+        for key in list(self.prefetching):
+            if key not in wanted and self.prefetching[key].cancel():
+                del self.prefetching[key]
+
+        for key in wanted:
+            if key not in self.photo_cache and key not in self.prefetching:
+                self.prefetching[key] = self.prefetcher.submit(self.thumbnails.load, *key)
+
+        if self.prefetching and not self.polling:
+            self.polling = True
+            self.master.after(PREFETCH_POLL_MS, self.collect_prefetched)
+
+    def collect_prefetched(self):
+        """Готовые в фоне превью превращаются в PhotoImage заранее, до нажатия кнопки"""
+        for key, future in list(self.prefetching.items()):
+            if future.done():
+                del self.prefetching[key]
+                if future.exception() is None:
+                    self.remember_photo(key, ImageTk.PhotoImage(future.result()))
+        self.polling = bool(self.prefetching)
+        if self.polling:
+            self.master.after(PREFETCH_POLL_MS, self.collect_prefetched)
+
+    def on_close(self):
+        self.prefetcher.shutdown(wait=False, cancel_futures=True)
+        self.journal.close()
+        self.master.destroy()
 
     def restore_file(self):
         """Восстановление файла"""
-        if not self.deleted_files:
+        if not self.deleted_ids:
             return
 
-        file_info = self.deleted_files[self.current_index]
+        file_info = self.file_info(self.current_index)
         
         # Проверка существования файла в корзине
         if not os.path.exists(file_info['trash_path']):
@@ -178,30 +313,47 @@ class RestoreViewer:
         try:
             shutil.move(file_info['trash_path'], file_info['original_path'])
             self.remove_from_log(file_info)
-            self.deleted_files.pop(self.current_index)
+            self.forget_files([file_info['id']])
             self.update_interface()
             messagebox.showinfo("Успех", "Файл успешно восстановлен!")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка восстановления: {str(e)}")
 
     def remove_from_log(self, file_info):
-        """Удаление записи из лог-файла"""
+        """Отметка о восстановлении в журнале корзины"""
         try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            with open(self.log_file, 'w', encoding='utf-8') as f:
-                for line in lines:
-                    if line.strip() != f"{file_info['filename']} {file_info['original_path']}":
-                        f.write(line)
+            mark_restored(self.journal, [file_info['id']])
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка обновления лога: {str(e)}")
 
+    def restore_selected(self):
+        """Восстановление всех выбранных файлов; отметки в журнале - одной транзакцией"""
+        if not self.deleted_ids:
+            return
+        rowids = sorted(self.selected) or [self.deleted_ids[self.current_index]]
+        restored, errors = restore_files(self.journal, self.trash_dir, rowids, batch_size=len(rowids))
+        self.forget_files(restored)
+        self.update_interface()
+        if errors:
+            more = f"\n... и еще {len(errors) - 5}" if len(errors) > 5 else ""
+            messagebox.showerror("Ошибка", f"Восстановлено: {len(restored)}, ошибок: {len(errors)}\n"
+                                 + "\n".join(errors[:5]) + more)
+        else:
+            messagebox.showinfo("Успех", f"Восстановлено файлов: {len(restored)}")
+
+    def forget_files(self, rowids):
+        """Удаление восстановленных id из списка: поиск делением пополам, без перестройки списка"""
+        for rowid in rowids:
+            index = bisect.bisect_left(self.deleted_ids, rowid)
+            if index < len(self.deleted_ids) and self.deleted_ids[index] == rowid:
+                del self.deleted_ids[index]
+            self.rows.pop(rowid, None)
+            self.selected.discard(rowid)
+
     def update_interface(self):
-        """Обновление интерфейса после восстановления"""
-        self.files_tree.delete(*self.files_tree.get_children())
+        """Обновление интерфейса после восстановления: перерисовывается только видимая страница"""
+        self.current_index = max(0, min(self.current_index - 1, len(self.deleted_ids) - 1))
         self.populate_files_list()
-        self.current_index = max(0, self.current_index - 1)
         self.show_current_file()
 
     def prev_file(self):
@@ -210,7 +362,7 @@ class RestoreViewer:
             self.show_current_file()
 
     def next_file(self):
-        if self.current_index < len(self.deleted_files) - 1:
+        if self.current_index < len(self.deleted_ids) - 1:
             self.current_index += 1
             self.show_current_file()
 
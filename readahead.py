@@ -0,0 +1,127 @@
+"""Упреждающее чтение файлов для хэширования.
+
+Воркеры Pool открывают файлы сами, и на HDD и сетевых дисках ядра простаивают в ожидании
+случайных чтений. ReadAhead читает файлы в нескольких потоках заранее, в порядке их
+расположения на диске (директория, затем inode), и отдает воркерам уже прочитанные байты.
+Объем прочитанного, но еще не отданного, ограничен buffer_mb.
+"""
+import os
+import queue
+import threading
+
+DEFAULT_READERS = 4
+DEFAULT_BUFFER_MB = 256
+# Сколько путей сортируется по расположению на диске за раз: пути приходят потоком от сканера
+WINDOW = 512
+# Файлов в одной задаче воркера: содержимое передается через pipe, поэтому пачка меньше workers.HASH_CHUNK
+CHUNKSIZE = 8
+
+
+class ReadAhead:
+    """readers - число потоков чтения (для HDD - 1-2, для SSD и SMB - больше), buffer_mb - лимит буфера"""
+
+    def __init__(self, readers=DEFAULT_READERS, buffer_mb=DEFAULT_BUFFER_MB, window=WINDOW):
+        self.readers = max(1, readers)
+        self.buffer_size = max(1, buffer_mb) * 1024 * 1024
+        self.window = window
+        self.chunksize = CHUNKSIZE
+
+    @classmethod
+    def from_config(cls, config):
+        """ReadAhead по секции readahead в config.yaml или None, если упреждающее чтение выключено"""
+        config = config or {}
+        if not config.get('enabled'):
+            return None
+        return cls(readers=config.get('readers', DEFAULT_READERS),
+                   buffer_mb=config.get('buffer_mb', DEFAULT_BUFFER_MB))
+
+    def __call__(self, paths, inode=None):
+        """Генератор (путь, содержимое) по мере чтения; порядок не сохраняется.
+
+        inode - функция путь -> inode (например, из отпечатка сканера) для сортировки внутри директории.
+        Если файл не прочитался, содержимое - b'' (воркер вернет для него None, как для битого файла).
+        """
+        todo = queue.Queue(self.readers * 2)
+        done = queue.Queue()
+        cond = threading.Condition()
+        state = {'buffered': 0, 'stop': False, 'error': None}
+
+        def put(item):
+            while not state['stop']:
+                try:
+                    todo.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def feed():
+            try:
+                window = []
+                for file_path in paths:
+                    window.append(file_path)
+                    if len(window) >= self.window:
+                        if not all(put(item) for item in sort_window(window, inode)):
+                            return
+                        window = []
+                for item in sort_window(window, inode):
+                    if not put(item):
+                        return
+            except BaseException as e:
+                state['error'] = e
+            finally:
+                for _ in range(self.readers):
+                    put(None)
+
+        def read():
+            try:
+                while not state['stop']:
+                    try:
+                        file_path = todo.get(timeout=0.5)
+                    except queue.Empty:
+                        continue
+                    if file_path is None:
+                        return
+                    try:
+                        with open(file_path, 'rb') as f:
+                            data = f.read()
+                    except OSError:
+                        data = b''
+                    with cond:
+                        # Буфер полон - ждем, пока потребитель заберет прочитанное (один файл проходит всегда)
+                        while state['buffered'] and state['buffered'] + len(data) > self.buffer_size \
+                                and not state['stop']:
+                            cond.wait(0.5)
+                        state['buffered'] += len(data)
+                    done.put((file_path, data))
+            finally:
+                done.put(None)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        threads += [threading.Thread(target=read, daemon=True) for _ in range(self.readers)]
+        for thread in threads:
+            thread.start()
+        try:
+            running = self.readers
+            while running:
+                item = done.get()
+                if item is None:
+                    running -= 1
+                    continue
+                with cond:
+                    state['buffered'] -= len(item[1])
+                    cond.notify_all()
+                yield item
+        finally:
+            state['stop'] = True
+            with cond:
+                cond.notify_all()
+        if state['error'] is not None:
+            raise state['error']
+
+
+def sort_window(window, inode=None):
+    """Пути в порядке расположения на диске: по директории, затем по inode (или имени)"""
+    if inode is None:
+        return sorted(window, key=lambda file_path: os.path.split(file_path))
+    return sorted(window, key=lambda file_path: (os.path.dirname(file_path), inode(file_path) or 0))
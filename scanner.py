@@ -0,0 +1,74 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif', 'bmp')
+
+# Сканирование упирается в задержки диска/сети, а не в CPU, поэтому потоков больше, чем ядер
+SCAN_THREADS = 16
+# Сколько директорий на поток читается наперед: листинги ждут потребителя в памяти
+SCAN_AHEAD = 2
+
+
+def file_fingerprint(st, inode=None):
+    """Отпечаток файла: (size, mtime_ns, inode/file-id)"""
+    return (st.st_size, st.st_mtime_ns, st.st_ino if inode is None else inode)
+
+
+def _scan_dir(path, extensions):
+    """Одна директория: подходящие файлы с отпечатками и список поддиректорий"""
+    files = []
+    dirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.name.lower().endswith(extensions) and entry.is_file():
+                        # На Windows размер и время уже есть в результате листинга, inode() - отдельный запрос;
+                        # оба вызова выполняются здесь, в потоке сканера, а не в потребителе
+                        files.append((entry.path, file_fingerprint(entry.stat(), entry.inode())))
+                except OSError:
+                    files.append((entry.path, None))
+    except OSError:
+        pass
+    return files, dirs
+
+
+def _walk(roots, extensions, threads):
+    """(файлы, поддиректории) каждой директории под roots по мере чтения.
+
+    Наперед читается не больше threads * SCAN_AHEAD директорий, остальные ждут в очереди
+    путями: память не растет с числом файлов, даже если потребитель медленнее диска.
+    """
+    backlog = deque(roots)
+    pending = set()
+    with ThreadPoolExecutor(threads) as executor:
+        while backlog or pending:
+            while backlog and len(pending) < threads * SCAN_AHEAD:
+                pending.add(executor.submit(_scan_dir, backlog.popleft(), extensions))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                backlog.extend(dirs)
+                yield files, dirs
+
+
+def scan_files(roots, extensions=IMAGE_EXTENSIONS, threads=SCAN_THREADS):
+    """Параллельный обход директорий вместо os.walk.
+
+    Каждая директория читается через os.scandir в пуле потоков, найденные
+    поддиректории сразу отправляются в тот же пул. Файлы отдаются генератором
+    по мере обнаружения как (path, (size, mtime_ns, inode)); если stat не удался,
+    вместо отпечатка - None. Порядок файлов не гарантируется.
+    """
+    for files, _ in _walk(roots, extensions, threads):
+        yield from files
+
+
+def scan_dirs(roots, threads=SCAN_THREADS):
+    """Все директории под roots, включая сами roots, тем же параллельным обходом (файлы не читаются)"""
+    yield from roots
+    for _, dirs in _walk(roots, (), threads):
+        yield from dirs
@@ -0,0 +1,102 @@
+import os
+import time
+import hashlib
+import threading
+from PIL import Image
+
+# Превью хранятся рядом с журналом корзины, в подпапках по первым символам ключа
+THUMBNAIL_DIR = '.thumbnails'
+THUMBNAIL_QUALITY = 85
+# Предел размера кэша: при запуске просмотра удаляются давно не открывавшиеся превью сверх него
+THUMBNAIL_CACHE_MB = 256
+# Временный файл старше этого брошен упавшим процессом
+STALE_TEMP_SECONDS = 3600
+
+
+class ThumbnailCache:
+    """Дисковый кэш превью.
+
+    Ключ - путь, размер и mtime файла плюс размер области показа: измененный или
+    замененный файл получает новое превью, старое просто перестает использоваться.
+    Такие превью, как и превью восстановленных или очищенных файлов, удаляет prune()
+    по пределу max_bytes: mtime превью обновляется при каждом чтении, поэтому первыми
+    удаляются давно не открывавшиеся. load() и prune() можно вызывать из фоновых потоков.
+    """
+
+    def __init__(self, cache_dir, max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def cache_path(self, file_path, st, box):
+        key = f"{os.path.normcase(os.path.abspath(file_path))}|{st.st_size}|{st.st_mtime_ns}|{box[0]}x{box[1]}"
+        digest = hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.jpg')
+
+    def load(self, file_path, box):
+        """Превью файла, вписанное в box = (ширина, высота), как PIL Image"""
+        st = os.stat(file_path)
+        cached = self.cache_path(file_path, st, box)
+        try:
+            with Image.open(cached) as img:
+                img.load()
+            os.utime(cached)  # отметка использования для prune()
+            return img
+        except OSError:
+            pass
+
+        with Image.open(file_path) as img:
+            img.draft('RGB', box)  # JPEG декодируется сразу в уменьшенном масштабе (до 1/8)
+            img.thumbnail(box)
+            thumb = img.convert('RGB')
+
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            # Через временный файл: другой поток не должен прочитать недописанное превью
+            temp_path = f"{cached}.{threading.get_ident()}.tmp"
+            thumb.save(temp_path, 'JPEG', quality=THUMBNAIL_QUALITY)
+            os.replace(temp_path, cached)
+        except OSError:
+            pass
+        return thumb
+
+    def prune(self):
+        """Удаление давно не открывавшихся превью сверх max_bytes и брошенных временных файлов.
+
+        Возвращает число удаленных файлов.
+        """
+        entries = []
+        removed = 0
+        now = time.time()
+        try:
+            subdirs = [entry.path for entry in os.scandir(self.cache_dir) if entry.is_dir()]
+        except OSError:
+            return 0
+        for subdir in subdirs:
+            try:
+                files = list(os.scandir(subdir))
+            except OSError:
+                continue
+            for entry in files:
+                try:
+                    st = entry.stat()
+                    if entry.name.endswith('.tmp'):
+                        if now - st.st_mtime > STALE_TEMP_SECONDS:
+                            os.remove(entry.path)
+                            removed += 1
+                    else:
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+                except OSError:
+                    pass
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass  # превью сейчас читается (Windows) - удалится при следующем запуске
+            total -= size
+        return removed
@@ -0,0 +1,203 @@
+import os
+import shutil
+import sqlite3
+import hashlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+from digests import quick_digest
+from mover import MOVE_THREADS, free_name, prepare_dirs, move_file
+from metrics import Metrics
+
+# Журнал лежит в самой корзине: папку Trash можно перенести целиком, пути в корзине - относительные
+JOURNAL_NAME = 'journal.sqlite'
+# Сколько перемещений записывается в журнал одной транзакцией
+JOURNAL_BATCH = 500
+
+
+def shard_name(original_path):
+    """Подпапка корзины: 256 шардов по хэшу исходного пути, чтобы в одной папке не копились сотни тысяч файлов"""
+    key = os.path.normcase(original_path).encode('utf-8', 'surrogatepass')
+    return hashlib.blake2b(key, digest_size=1).hexdigest()
+
+
+def open_journal(trash_dir):
+    """Журнал перемещений в корзину.
+
+    Строка добавляется до перемещения (moved_at IS NULL - перемещение не подтверждено),
+    после перемещения получает moved_at и дайджест, после восстановления - restored_at.
+    """
+    os.makedirs(trash_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(trash_dir, JOURNAL_NAME))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''CREATE TABLE IF NOT EXISTS moves
+                    (id INTEGER PRIMARY KEY, original_path TEXT NOT NULL, trash_path TEXT NOT NULL,
+                     digest BLOB, moved_at TEXT, restored_at TEXT)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS moves_restored ON moves (restored_at)')
+    return conn
+
+
+def recover_pending(conn, trash_dir):
+    """Строки, оставшиеся неподтвержденными после сбоя: файл в корзине - перемещение состоялось"""
+    now = datetime.now().isoformat(timespec='seconds')
+    pending = conn.execute('SELECT id, trash_path FROM moves WHERE moved_at IS NULL').fetchall()
+    done = [(now, rowid) for rowid, trash_path in pending if os.path.exists(os.path.join(trash_dir, trash_path))]
+    conn.executemany('UPDATE moves SET moved_at = ? WHERE id = ?', done)
+    conn.execute('DELETE FROM moves WHERE moved_at IS NULL')
+    conn.commit()
+
+
+def _move_to_trash(item):
+    rowid, original_path, trash_path, same_volume = item
+    try:
+        digest = quick_digest(original_path)
+        move_file(original_path, trash_path, same_volume)
+        return rowid, digest, None
+    except Exception as e:
+        return rowid, None, e
+
+
+def move_to_trash(file_paths, trash_dir, threads=MOVE_THREADS, metrics=None):
+    """Перемещение файлов в шардированную корзину с записью в журнал. Возвращает (перемещено, ошибки).
+
+    metrics (metrics.Metrics) - замеры этапов, перемещений и записи в журнал; сохраняет вызывающий код.
+    """
+    metrics = metrics or Metrics('move_to_trash')
+    metrics.begin('plan')
+    conn = open_journal(trash_dir)
+    recover_pending(conn, trash_dir)
+    errors = []
+
+    # План: свободные имена по листингам шардов в памяти, без проверки каждого варианта на диске
+    plan = []
+    listings = {}
+    for original_path in file_paths:
+        try:
+            st = os.stat(original_path)
+        except OSError:
+            errors.append(f"Файл не существует: {original_path}")
+            continue
+        shard = os.path.join(trash_dir, shard_name(original_path))
+        plan.append((original_path, free_name(listings, shard, os.path.basename(original_path)), st.st_dev))
+    devices = prepare_dirs(listings, errors)
+    plan = [step for step in plan if os.path.dirname(step[1]) in devices]
+
+    moved = 0
+    metrics.begin('move')
+    with ThreadPoolExecutor(threads) as executor, tqdm(total=len(plan), desc="Перемещение", unit="file") as progress:
+        for i in range(0, len(plan), JOURNAL_BATCH):
+            c = conn.cursor()
+            items = []
+            with metrics.timer('journal'):
+                for original_path, trash_path, device in plan[i:i + JOURNAL_BATCH]:
+                    c.execute('INSERT INTO moves (original_path, trash_path) VALUES (?, ?)',
+                              (original_path, os.path.relpath(trash_path, trash_dir)))
+                    items.append((c.lastrowid, original_path, trash_path,
+                                  device == devices[os.path.dirname(trash_path)]))
+                conn.commit()
+
+            done = []
+            failed = []
+            now = datetime.now().isoformat(timespec='seconds')
+            moves = metrics.imap(executor.map, _move_to_trash, items, group='move')
+            for (rowid, digest, error), item in zip(moves, items):
+                if error is None:
+                    done.append((digest, now, rowid))
+                else:
+                    failed.append((rowid,))
+                    errors.append(f"Ошибка при перемещении {item[1]}: {str(error)}")
+                progress.update()
+            with metrics.timer('journal'):
+                c.executemany('UPDATE moves SET digest = ?, moved_at = ? WHERE id = ?', done)
+                c.executemany('DELETE FROM moves WHERE id = ?', failed)
+                conn.commit()
+            moved += len(done)
+    conn.close()
+    metrics.end()
+    metrics.update({'files': len(file_paths), 'moved': moved, 'errors': len(errors)})
+    return moved, errors
+
+
+def load_trash_ids(conn):
+    """id файлов, которые сейчас лежат в корзине, по возрастанию"""
+    return [row[0] for row in conn.execute('''SELECT id FROM moves
+                                               WHERE moved_at IS NOT NULL AND restored_at IS NULL ORDER BY id''')]
+
+
+def get_trash_files(conn, rowids):
+    """{id: (original_path, trash_path)} для списка id - запрос по первичному ключу"""
+    rowids = list(rowids)
+    files = {}
+    for i in range(0, len(rowids), 999):
+        chunk = rowids[i:i + 999]
+        placeholders = ','.join(['?'] * len(chunk))
+        for rowid, original_path, trash_path in conn.execute(
+                f'SELECT id, original_path, trash_path FROM moves WHERE id IN ({placeholders})', chunk):
+            files[rowid] = (original_path, trash_path)
+    return files
+
+
+def mark_restored(conn, rowids):
+    now = datetime.now().isoformat(timespec='seconds')
+    conn.executemany('UPDATE moves SET restored_at = ? WHERE id = ?', [(now, rowid) for rowid in rowids])
+    conn.commit()
+
+
+def _restore(item):
+    rowid, original_path, trash_path, digest = item
+    try:
+        if os.path.exists(original_path):
+            raise FileExistsError("файл уже существует")
+        if digest is not None and quick_digest(trash_path) != digest:
+            raise ValueError("файл в корзине изменен")
+        os.makedirs(os.path.dirname(original_path), exist_ok=True)
+        shutil.move(trash_path, original_path)
+        return rowid, None
+    except Exception as e:
+        return rowid, e
+
+
+def restore_files(conn, trash_dir, rowids=None, threads=MOVE_THREADS, batch_size=JOURNAL_BATCH):
+    """Параллельное восстановление файлов корзины (rowids=None - всех).
+
+    Отметки о восстановлении пишутся одной транзакцией на batch_size файлов.
+    Возвращает (id восстановленных, ошибки).
+    """
+    query = '''SELECT id, original_path, trash_path, digest FROM moves
+               WHERE moved_at IS NOT NULL AND restored_at IS NULL'''
+    if rowids is None:
+        rows = conn.execute(query + ' ORDER BY id').fetchall()
+    else:
+        rowids = sorted(rowids)
+        rows = []
+        for i in range(0, len(rowids), 999):
+            chunk = rowids[i:i + 999]
+            placeholders = ','.join(['?'] * len(chunk))
+            rows += conn.execute(f'{query} AND id IN ({placeholders}) ORDER BY id', chunk).fetchall()
+    items = [(rowid, original_path, os.path.join(trash_dir, trash_path), digest)
+             for rowid, original_path, trash_path, digest in rows]
+
+    restored = []
+    errors = []
+    with ThreadPoolExecutor(threads) as executor, tqdm(total=len(items), desc="Восстановление", unit="file") as progress:
+        for i in range(0, len(items), max(1, batch_size)):
+            batch = items[i:i + max(1, batch_size)]
+            done = []
+            for (rowid, error), item in zip(executor.map(_restore, batch), batch):
+                if error is None:
+                    done.append(rowid)
+                else:
+                    errors.append(f"Ошибка при восстановлении {item[1]}: {str(error)}")
+                progress.update()
+            mark_restored(conn, done)
+            restored.extend(done)
+    return restored, errors
+
+
+def restore_from_trash(trash_dir, threads=MOVE_THREADS):
+    """Восстановление всех файлов корзины по журналу. Возвращает (восстановлено, ошибки)"""
+    conn = open_journal(trash_dir)
+    recover_pending(conn, trash_dir)
+    restored, errors = restore_files(conn, trash_dir, threads=threads)
+    conn.close()
+    return len(restored), errors
@@ -0,0 +1,338 @@
+"""Режим наблюдения: БД библиотеки обновляется по событиям файловой системы, без полных пересканирований.
+
+На Linux события приходят от inotify, на остальных системах (и если inotify недоступен)
+библиотека периодически сравнивается со снимком отпечатков. Переименования применяются
+сразу, удаления - после паузы (вторая половина переименования может прийти позже), новые
+и измененные файлы хэшируются небольшим пулом процессов, когда поток событий затихнет
+на watch.debounce секунд.
+"""
+import os
+import sys
+import time
+import locale
+import select
+import struct
+import ctypes
+import ctypes.util
+from functools import partial
+from multiprocessing import Pool, cpu_count, freeze_support
+import yaml
+from hashing import hash_types_from_config
+from library_db import (DirIds, IngestWriter, connect, create_db, delete_rows, init_db, prefix_range, relink_rows,
+                        split_path)
+from scanner import IMAGE_EXTENSIONS, file_fingerprint, scan_dirs, scan_files
+from workers import chunked, process_files_create
+
+# Фикс для кодировки в Windows
+if sys.platform.startswith('win'):
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout.reconfigure(encoding='utf-8')
+    locale.setlocale(locale.LC_ALL, 'Russian_Russia.65001')
+
+# Процессов для хэширования: изменения приходят понемногу, остальные ядра остаются другим задачам
+WATCH_WORKERS = 2
+# Пачка хэшируется не позже, чем через столько секунд после первого события, даже если события не затихают
+MAX_DELAY = 30.0
+
+# Флаги inotify из <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """Рекурсивное наблюдение через inotify (ctypes, без внешних зависимостей).
+
+    poll() возвращает множество путей, которые могли измениться (файлы и директории),
+    или None, если очередь событий ядра переполнилась и нужно полное сравнение.
+    """
+
+    def __init__(self, root):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.paths = {}  # wd -> директория
+        self.add_tree(root)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno == 28:  # ENOSPC: исчерпан fs.inotify.max_user_watches
+                raise OSError(errno, 'Too many directories to watch, raise fs.inotify.max_user_watches')
+            return
+        # Для уже наблюдаемой (например, переименованной) директории ядро вернет тот же wd - обновляем путь
+        self.paths[wd] = path
+
+    def add_tree(self, root):
+        for directory in scan_dirs([root]):
+            self.add_watch(directory)
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 1 << 16)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            directory = self.paths.get(wd)
+            if directory is None or mask & IN_DELETE_SELF:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Новая директория: файлы могли появиться в ней раньше, чем на нее встало наблюдение
+                self.add_tree(path)
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Запасной вариант без inotify: раз в interval секунд обход библиотеки и сравнение отпечатков"""
+
+    def __init__(self, root, snapshot, interval=60.0):
+        self.root = root
+        self.snapshot = snapshot  # путь -> отпечаток
+        self.interval = interval
+        self.next_scan = time.monotonic() + interval
+
+    def poll(self, timeout):
+        delay = self.next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, delay))
+        self.next_scan = time.monotonic() + self.interval
+        current = {os.path.normpath(path): fingerprint
+                   for path, fingerprint in scan_files([self.root], IMAGE_EXTENSIONS) if fingerprint is not None}
+        changed = {path for path, fingerprint in current.items() if self.snapshot.get(path) != fingerprint}
+        changed.update(path for path in self.snapshot if path not in current)
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def load_snapshot(c):
+    """Отпечатки всех файлов библиотеки из БД: {путь: (size, mtime_ns, inode)}"""
+    c.execute('SELECT file_path, size, mtime_ns, inode FROM image_files')
+    return {file_path: (size, mtime_ns, inode) for file_path, size, mtime_ns, inode in c}
+
+
+def make_watcher(root, load_snapshot, poll_interval=60.0, use_inotify=True):
+    """load_snapshot() -> {путь: отпечаток}: вызывается только для PollingWatcher, inotify снимок не нужен"""
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify is not available ({e}), falling back to polling")
+    return PollingWatcher(root, load_snapshot(), poll_interval)
+
+
+class LibraryUpdater:
+    """Применение изменений к БД: переименования - сразу, удаления - через hold секунд, хэширование - пачками"""
+
+    def __init__(self, conn, pool, fast_hash=False, hash_types=('phash',), hold=2.0):
+        self.conn = conn
+        self.c = conn.cursor()
+        self.pool = pool
+        self.worker = partial(process_files_create, fast=fast_hash, hash_types=hash_types)
+        self.dir_ids = DirIds(self.c)
+        self.hold = hold
+        self.held = {}  # id записи исчезнувшего файла -> (путь, отпечаток, когда удалить)
+
+    def find_rows(self, path):
+        """Записи БД для пути: сам файл или все файлы директории: список (id, путь, отпечаток)"""
+        directory, name = split_path(path)
+        self.c.execute('''SELECT images.id, dirs.path || images.name, size, mtime_ns, inode
+                          FROM images JOIN dirs ON dirs.id = images.dir_id
+                          WHERE dirs.path = ? AND images.name = ?''', (directory, name))
+        rows = self.c.fetchall()
+        if not rows:
+            low, high = prefix_range(os.path.normpath(path) + os.sep)
+            self.c.execute('''SELECT images.id, dirs.path || images.name, size, mtime_ns, inode
+                              FROM images JOIN dirs ON dirs.id = images.dir_id
+                              WHERE dirs.path_key >= ? AND dirs.path_key < ?''', (low, high))
+            rows = self.c.fetchall()
+        return [(rowid, file_path, (size, mtime_ns, inode)) for rowid, file_path, size, mtime_ns, inode in rows]
+
+    def apply_moves(self, paths):
+        """Если исчезнувший файл (по отпечатку) появился по новому пути - запись переносится на него.
+
+        Запись, для которой новый путь не нашелся, ждет hold секунд: удаление и создание при
+        переименовании могут прийти в разных poll(), и файл иначе хэшировался бы заново.
+        Вызывается и с пустым paths, пока есть ожидающие записи. Возвращает {путь: отпечаток}
+        существующих файлов для хэширования.
+        """
+        now = time.monotonic()
+        existing = {}
+        missing = []
+        for path in paths:
+            path = os.path.normpath(path)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                missing.extend(self.find_rows(path))
+                continue
+            except OSError:
+                continue
+            if os.path.isdir(path):
+                existing.update((os.path.normpath(file_path), fingerprint)
+                                for file_path, fingerprint in scan_files([path], IMAGE_EXTENSIONS)
+                                if fingerprint is not None)
+            elif path.lower().endswith(IMAGE_EXTENSIONS):
+                existing[path] = file_fingerprint(st)
+        for rowid, file_path, fingerprint in missing:
+            self.held.setdefault(rowid, (os.path.normpath(file_path), fingerprint, now + self.hold))
+        if not self.held:
+            return existing
+
+        by_fingerprint = {}
+        for file_path, fingerprint in existing.items():
+            by_fingerprint.setdefault(fingerprint, []).append(file_path)
+        relinked = []
+        deleted = []
+        for rowid, (file_path, fingerprint, deadline) in list(self.held.items()):
+            if file_path in existing:
+                # Файл снова на месте - запись остается, изменение (если есть) найдет hash_files
+                del self.held[rowid]
+                continue
+            targets = by_fingerprint.get(fingerprint)
+            target = targets.pop() if targets else None
+            if target is not None and not self.find_rows(target):
+                relinked.append((target, rowid))
+                del existing[target]
+                del self.held[rowid]
+            elif deadline <= now:
+                deleted.append(rowid)
+                del self.held[rowid]
+        if not relinked and not deleted:
+            return existing
+        relink_rows(self.c, self.dir_ids, relinked)
+        delete_rows(self.c, deleted)
+        self.conn.commit()
+        if relinked:
+            print(f"🔗 Re-linked {len(relinked)} moved or renamed files")
+        if deleted:
+            print(f"🚮 Removed {len(deleted)} deleted files from DB")
+        return existing
+
+    def hash_files(self, files):
+        """Хэширование новых и измененных файлов; files - {путь: отпечаток на момент события}"""
+        fingerprints = {}
+        changed = {}
+        for file_path in files:
+            try:
+                fingerprint = file_fingerprint(os.stat(file_path))
+            except OSError:
+                continue  # удален, пока ждали затишья - удаление придет отдельным событием
+            rows = self.find_rows(file_path)
+            if rows and rows[0][1] == file_path:
+                if rows[0][2] == fingerprint:
+                    continue
+                changed[file_path] = rows[0][0]
+            fingerprints[file_path] = fingerprint
+        if not fingerprints:
+            return 0
+
+        writer = IngestWriter(self.conn, fingerprints, changed)
+        for results in self.pool.imap_unordered(self.worker, chunked(list(fingerprints), 4)):
+            for result in results:
+                if result:
+                    writer.save(*result)
+        # Измененный файл, который больше не открывается (остался в changed), не должен оставаться в БД со старым хэшем
+        delete_rows(self.c, list(changed.values()))
+        writer.flush()
+        print(f"🆕 Indexed {writer.saved - writer.updated} new and {writer.updated} changed files")
+        return writer.saved
+
+
+def watch_library(library_path, db_path='phash_db.sqlite', fast_hash=False, hash_types=('phash',),
+                  debounce=2.0, poll_interval=60.0, use_inotify=True):
+    """Наблюдение за библиотекой до Ctrl-C.
+
+    При запуске БД один раз сверяется с диском через create_db (изменения, сделанные,
+    пока наблюдение не работало), дальше обрабатываются только события. При переполнении
+    очереди inotify сверка повторяется.
+    """
+    library_path = os.path.normpath(library_path)
+    create_db(library_path, db_path, fast_hash=fast_hash, hash_types=hash_types)
+
+    conn = connect(db_path)
+    c = conn.cursor()
+    init_db(c)
+    watcher = make_watcher(library_path, partial(load_snapshot, c), poll_interval, use_inotify)
+    print(f"👀 Watching {library_path} ({type(watcher).__name__}), press Ctrl-C to stop")
+
+    # Удаление ждет второй половины переименования: при опросе она придет не раньше следующего обхода
+    hold = debounce + watcher.interval if isinstance(watcher, PollingWatcher) else debounce
+    pending = {}
+    first_event = last_event = None
+    with Pool(min(WATCH_WORKERS, cpu_count())) as pool:
+        updater = LibraryUpdater(conn, pool, fast_hash, hash_types, hold)
+        try:
+            while True:
+                paths = watcher.poll(debounce / 2)
+                if paths is None:
+                    print("⚠️ Too many events at once, re-checking the whole library...")
+                    conn.close()
+                    create_db(library_path, db_path, fast_hash=fast_hash, hash_types=hash_types)
+                    conn = connect(db_path)
+                    updater = LibraryUpdater(conn, pool, fast_hash, hash_types, hold)
+                    pending = {}
+                    continue
+                now = time.monotonic()
+                if paths or updater.held:
+                    pending.update(updater.apply_moves(paths))
+                if paths:
+                    first_event = first_event or now
+                    last_event = now
+                if pending and (now - last_event >= debounce or now - first_event >= MAX_DELAY):
+                    batch, pending = pending, {}
+                    first_event = None
+                    updater.hash_files(batch)
+        except KeyboardInterrupt:
+            print("\n⏹️ Stopped watching")
+        finally:
+            watcher.close()
+            conn.close()
+
+
+if __name__ == '__main__':
+    freeze_support()
+    with open('config.yaml', 'r', encoding='utf-8') as file:
+        application_config = yaml.safe_load(file)
+
+    hashing_config = application_config.get('hashing') or {}
+    filters = (application_config.get('duplicates') or {}).get('filters') or {}
+    hash_types = hash_types_from_config([*(hashing_config.get('types') or []), *filters])
+    watch_config = application_config.get('watch') or {}
+    watch_library(application_config['library']['path'], fast_hash=hashing_config.get('fast_decode', False),
+                  hash_types=hash_types, debounce=watch_config.get('debounce', 2.0),
+                  poll_interval=watch_config.get('poll_interval', 60.0),
+                  use_inotify=watch_config.get('inotify', True))
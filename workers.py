@@ -0,0 +1,121 @@
+"""Функции, которые выполняются в процессах-воркерах Pool и у воркеров распределенного хэширования.
+
+При spawn (Windows, macOS) каждый воркер заново импортирует модуль функции, поэтому здесь
+только то, что нужно для хэширования: PIL, imagehash (вместе с numpy, на котором он построен)
+и дайджесты. sqlite3, library_db с индексами поиска, tqdm, yaml и tkinter остаются в родительском процессе.
+
+Воркер получает пачку файлов (chunked): каждый файл декодируется и уменьшается до 32x32 по отдельности,
+а phash всей пачки считается одним phash_batch.
+"""
+import io
+import os
+import threading
+from PIL import Image
+from hashing import compute_hashes, fill_phashes, image_hashes
+from digests import digests_from_bytes
+from metadata import read_metadata
+
+# Файлов в одной задаче воркера: их phash считается одним матричным умножением
+HASH_CHUNK = 16
+# Сколько пачек на процесс Pool может ждать в очереди: поток подачи Pool иначе забирает
+# все элементы сразу, и память растет с числом файлов
+IMAP_WINDOW = 4
+
+
+def chunked(items, size=HASH_CHUNK):
+    """Элементы items списками по size - задачи для функций воркеров, которые принимают пачку"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def imap_chunks(pool, func, items, chunksize=HASH_CHUNK, window=None):
+    """pool.imap_unordered по пачкам chunked(items, chunksize): на каждую пачку - список результатов func.
+
+    В очереди Pool не больше window пачек (по умолчанию IMAP_WINDOW на ядро): следующая
+    пачка берется из items, только когда результат предыдущей забран.
+    """
+    slots = threading.Semaphore(window or IMAP_WINDOW * (os.cpu_count() or 1))
+    stopped = threading.Event()
+
+    def feed():
+        for chunk in chunked(items, chunksize):
+            # С таймаутом: при досрочном выходе поток подачи не должен зависнуть и задержать Pool.terminate
+            while not slots.acquire(timeout=0.5):
+                if stopped.is_set():
+                    return
+            yield chunk
+
+    try:
+        for result in pool.imap_unordered(func, feed()):
+            slots.release()
+            yield result
+    finally:
+        stopped.set()
+
+
+def _decode_create(item, fast, hash_types):
+    """(результат без phash, pixels) для файла библиотеки или (None, None), если файл битый"""
+    file_path, data = item if isinstance(item, tuple) else (item, None)
+    try:
+        # Файл читается один раз: из тех же байт считаются и дайджесты, и все хэши
+        if data is None:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        quick_digest, digest = digests_from_bytes(data)
+        with Image.open(io.BytesIO(data)) as img:
+            metadata = read_metadata(img, file_path)
+            hashes, pixels = image_hashes(img, hash_types, fast)
+            return (hashes, file_path, quick_digest, digest, metadata), pixels
+    except Exception as e:
+        return None, None
+
+
+def process_files_create(items, fast=False, hash_types=('phash',)):
+    """Пачка файлов библиотеки: items - пути или (путь, содержимое), если файл уже прочитан (ReadAhead, координатор).
+
+    Возвращает результаты в порядке items: (хэши, путь, быстрый дайджест, дайджест, метаданные)
+    или None для битого файла.
+    """
+    decoded = [_decode_create(item, fast, hash_types) for item in items]
+    fill_phashes([(result[0], pixels) for result, pixels in decoded if result is not None])
+    return [result for result, _ in decoded]
+
+
+def process_file_backfill(item, fast=False):
+    """Досчет только недостающих хэшей для записи библиотеки: item = (id, file_path, типы хэшей)"""
+    rowid, file_path, hash_types = item
+    try:
+        with Image.open(file_path) as img:
+            return (rowid, compute_hashes(img, hash_types, fast))
+    except Exception as e:
+        return (rowid, None)
+
+
+def _decode_hash(item, fast, hash_types):
+    file_path, data = item if isinstance(item, tuple) else (item, None)
+    try:
+        st = os.stat(file_path)
+        with Image.open(file_path if data is None else io.BytesIO(data)) as img:
+            # Метаданные - из того же открытого файла, для photo_organizer
+            metadata = (st.st_size, st.st_mtime_ns, read_metadata(img, file_path))
+            hashes, pixels = image_hashes(img, hash_types, fast)
+            return (file_path, hashes, metadata), pixels
+    except Exception as e:
+        return (file_path, None, None), None
+
+
+# Воркеры поиска дубликатов только считают хэш, поиск по БД - в родительском процессе
+def process_files_hash(items, fast=False, hash_types=('phash',)):
+    """Пачка проверяемых файлов: items - пути или (путь, содержимое), если файл уже прочитан ReadAhead.
+
+    Возвращает (путь, хэши, (size, mtime_ns, метаданные)) в порядке items, для битого файла - (путь, None, None).
+    """
+    decoded = [_decode_hash(item, fast, hash_types) for item in items]
+    fill_phashes([(result[1], pixels) for result, pixels in decoded if result[1] is not None])
+    return [result for result, _ in decoded]